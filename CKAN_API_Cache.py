@@ -0,0 +1,675 @@
+#!/usr/bin/env python
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import weakref
+
+import CKAN_API_Helper as CK_helper
+
+
+class ResourceCache(object):
+    """
+    Local on-disk cache of downloaded WindLab resources.
+
+    Entries are keyed by the resource id plus the 'hash' (or, if not given,
+    the 'last_modified') field returned by resource_show, so that a changed
+    resource gets a new key. The cache is bounded to max_bytes; the least
+    recently used entries are removed once the budget is exceeded. The index
+    is kept in "index.json" inside cache_dir, so that the cache persists
+    between runs. Access times of cache hits are kept in memory and written
+    with the next change of the entries, every index_write_interval hits, 
+    or by close(). Pinned entries, e.g. files of lazily loaded netCDF 
+    resources still in use, are not evicted, and files of pinned entries 
+    removed otherwise are only deleted once unpinned.
+
+    Parameters
+    ----------
+    cache_dir : String, optional
+        Dir where the cached files and the index are stored.
+        The default is './windlab_cache'.
+    max_bytes : Integer, optional
+        Byte budget of the cache. The default is 10 GB.
+    index_write_interval : Integer, optional
+        Number of cache hits after which the access times are written to the
+        index. The default is 100.
+
+    Example
+    -------
+    cache = ResourceCache('./windlab_cache', max_bytes = 50 * 1024**3)
+    res = CK_Calls.read_datasets(ckan_url, api_token, windlab_data, cache = cache)
+    print(cache.cache_stats())
+    cache.close()
+    """
+
+    def __init__(self,
+                 cache_dir  = './windlab_cache',
+                 max_bytes  = 10 * 1024**3,
+                 index_write_interval = 100):
+
+        self.cache_dir  = cache_dir
+        self.max_bytes  = max_bytes
+        self.index_write_interval = index_write_interval
+        self.hits       = 0
+        self.misses     = 0
+        self.bytes_saved = 0
+
+        # Reentrant, as unpin() may run from a finalizer
+        self._lock      = threading.RLock()
+        self._key_locks = {}
+        self._pins      = {}
+        self._pending_removal = set()
+        self._unsaved_hits = 0
+        self._index_file_name = os.path.join(cache_dir, 'index.json')
+
+        if os.path.isdir(cache_dir) is False:
+            os.makedirs(cache_dir)
+
+        self._index = {}
+        if os.path.isfile(self._index_file_name):
+            try:
+                with open(self._index_file_name, 'r') as file:
+                    self._index = json.load(file)
+            except Exception:
+                print('Warning: ResourceCache: Not able to read index. Starting with empty cache.')
+                self._index = {}
+
+        # Removing entries, where the file has gone missing
+        for key in list(self._index):
+            if os.path.isfile(self.file_name(key)) is False:
+                del self._index[key]
+
+    def key(self, resource):
+        """
+        Returns the cache key of a resource dict from resource_show, or None
+        if the resource has neither 'hash' nor 'last_modified' set.
+        """
+        version = resource.get('hash') or resource.get('last_modified')
+        if not version:
+            return None
+        return hashlib.sha256((resource['id'] + '|' + str(version)).encode('utf-8')).hexdigest()
+
+    def file_name(self, key):
+        """Dir and file name of the cached file for key."""
+        return os.path.join(self.cache_dir, key)
+
+    def lock(self, key):
+        """Lock of a single key, so that a resource is downloaded only once."""
+        with self._lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = threading.Lock()
+            return self._key_locks[key]
+
+    def pin(self, key, owner = None):
+        """
+        Keeps the file of key until unpin(key) is called, or, if owner is 
+        given, until owner is garbage collected. Pins are counted and only 
+        hold within this process.
+        """
+        with self._lock:
+            self._pins[key] = self._pins.get(key, 0) + 1
+        if owner is not None:
+            weakref.finalize(owner, self.unpin, key)
+
+    def unpin(self, key):
+        """Releases one pin of key, see pin()."""
+        with self._lock:
+            count = self._pins.get(key, 0) - 1
+            if count > 0:
+                self._pins[key] = count
+                return
+            self._pins.pop(key, None)
+            if key in self._pending_removal:
+                self._pending_removal.discard(key)
+                if key not in self._index:
+                    self._remove(key)
+            self._evict()
+            self._write_index()
+
+    def get(self, key):
+        """
+        Returns the dir and file name of the cached file for key, or None in
+        case of a cache miss.
+        """
+        with self._lock:
+            entry = self._index.get(key)
+            if (entry is None) or (os.path.isfile(self.file_name(key)) is False):
+                self._index.pop(key, None)
+                self.misses = self.misses + 1
+                return None
+            entry['last_access'] = time.time()
+            self.hits = self.hits + 1
+            self.bytes_saved = self.bytes_saved + entry['size']
+            # Access times only, written in batches
+            self._unsaved_hits = self._unsaved_hits + 1
+            if self._unsaved_hits >= self.index_write_interval:
+                self._write_index()
+            return self.file_name(key)
+
+    def add(self, key, resource_id = None):
+        """
+        Registers the file written to self.file_name(key) in the cache and
+        evicts least recently used entries if the byte budget is exceeded.
+        """
+        with self._lock:
+            # Older versions of the same resource are stale
+            if resource_id is not None:
+                for old_key in list(self._index):
+                    if (old_key != key) and (self._index[old_key]['resource_id'] == resource_id):
+                        self._remove(old_key)
+            self._pending_removal.discard(key)
+            self._index[key] = {'resource_id':  resource_id,
+                                'size':         os.path.getsize(self.file_name(key)),
+                                'last_access':  time.time()}
+            self._evict(keep = key)
+            self._write_index()
+        return self.file_name(key)
+
+    def close(self):
+        """Writes access times not yet written to the index."""
+        with self._lock:
+            if self._unsaved_hits > 0:
+                self._write_index()
+
+    def clear(self):
+        """Removes all entries from the cache."""
+        with self._lock:
+            for key in list(self._index):
+                self._remove(key)
+            self._write_index()
+
+    def cache_stats(self):
+        """
+        Returns a dict with the number of hits and misses, the bytes not
+        downloaded due to hits, and the current size of the cache.
+        """
+        with self._lock:
+            return {'hits':         self.hits,
+                    'misses':       self.misses,
+                    'bytes_saved':  self.bytes_saved,
+                    'entries':      len(self._index),
+                    'bytes':        sum(entry['size'] for entry in self._index.values()),
+                    'max_bytes':    self.max_bytes}
+
+    def _evict(self, keep = None):
+        total = sum(entry['size'] for entry in self._index.values())
+        for key in sorted(self._index, key = lambda kk: self._index[kk]['last_access']):
+            if total <= self.max_bytes:
+                break
+            if (key == keep) or (key in self._pins):
+                continue
+            total = total - self._index[key]['size']
+            self._remove(key)
+
+    def _remove(self, key):
+        self._index.pop(key, None)
+        if key in self._pins:
+            # File still in use, deleted by unpin()
+            self._pending_removal.add(key)
+            return
+        try:
+            os.remove(self.file_name(key))
+        except OSError:
+            pass
+
+    def _write_index(self):
+        self._unsaved_hits = 0
+        temp_file_name = self._index_file_name + '.tmp'
+        with open(temp_file_name, 'w') as file:
+            json.dump(self._index, file)
+        os.replace(temp_file_name, self._index_file_name)
+
+
+class MetadataCache(object):
+    """
+    Persistent local store of package_show and resource_show payloads.
+
+    Cached packages are revalidated against their 'metadata_modified' field,
+    which is fetched for many packages at once through a single package_search
+    (batch_size packages per search). Only packages that changed on the server
+    are fetched again through package_show. As CKAN updates the
+    'metadata_modified' of a package whenever one of its resources changes,
+    resources of packages revalidated within the last ttl seconds are also 
+    served from the store.
+
+    Parameters
+    ----------
+    db_file_name : String, optional
+        Dir and file name of the SQLite data base.
+        The default is './windlab_cache/metadata.sqlite'.
+    batch_size : Integer, optional
+        Number of packages revalidated per package_search. The default is 100.
+    ttl : Float, optional
+        Seconds resources of a revalidated package are served from the store
+        by resource_show, before its package needs revalidating again.
+        The default is 300.
+
+    Example
+    -------
+    metadata_cache = MetadataCache()
+    datasets = metadata_cache.get_packages(ckan, dataset_ids)
+    print(metadata_cache.cache_stats())
+    """
+
+    def __init__(self,
+                 db_file_name   = './windlab_cache/metadata.sqlite',
+                 batch_size     = 100,
+                 ttl            = 300):
+
+        self.db_file_name   = db_file_name
+        self.batch_size     = batch_size
+        self.ttl            = ttl
+        self.hits           = 0
+        self.misses         = 0
+        self.search_calls   = 0
+        self.show_calls     = 0
+
+        dir_name = os.path.dirname(db_file_name)
+        if (dir_name != '') and (os.path.isdir(dir_name) is False):
+            os.makedirs(dir_name)
+
+        self._lock      = threading.Lock()
+        self._validated = {}
+        self._db        = sqlite3.connect(db_file_name, check_same_thread = False)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS packages ('
+                             'id TEXT PRIMARY KEY, name TEXT, metadata_modified TEXT, '
+                             'payload TEXT, checked REAL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS packages_name ON packages (name)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS resources ('
+                             'id TEXT PRIMARY KEY, package_id TEXT, payload TEXT)')
+
+    def close(self):
+        """Closes the data base."""
+        with self._lock:
+            self._db.close()
+
+    def get_packages(self, ckan, ids_or_names):
+        """
+        Returns the package_show dicts for a list of package ids or names, in
+        the same order. Unchanged packages are taken from the store.
+
+        Parameters
+        ----------
+        ckan : RemoteCKAN
+            Connection to the CKAN data base.
+        ids_or_names : List
+            List of package ids or names.
+
+        Returns
+        -------
+        List
+            List of package dicts.
+        """
+        current = self.revalidate(ckan, ids_or_names)
+
+        packages = []
+        for id_or_name in ids_or_names:
+            package = None
+            if id_or_name in current:
+                package_id, metadata_modified = current[id_or_name]
+                with self._lock:
+                    row = self._db.execute('SELECT metadata_modified, payload FROM packages WHERE id = ?',
+                                           (package_id,)).fetchone()
+                if (row is not None) and (row[0] == metadata_modified):
+                    package = json.loads(row[1])
+                    with self._lock:
+                        self.hits = self.hits + 1
+
+            if package is None:
+                package = self.fetch_package(ckan, id_or_name)
+            packages.append(package)
+        return packages
+
+    def package_show(self, ckan, id_or_name):
+        """Same as ckan.action.package_show(id=id_or_name), but through the store."""
+        return self.get_packages(ckan, [id_or_name])[0]
+
+    def resource_show(self, ckan, resource_id):
+        """
+        Same as ckan.action.resource_show(id=resource_id), but taken from the
+        store if the package of the resource has been revalidated.
+        """
+        with self._lock:
+            row = self._db.execute('SELECT package_id, payload FROM resources WHERE id = ?',
+                                   (resource_id,)).fetchone()
+            if ((row is not None) and
+                    (time.time() - self._validated.get(row[0], -float('inf')) <= self.ttl)):
+                self.hits = self.hits + 1
+                return json.loads(row[1])
+            self.misses = self.misses + 1
+            self.show_calls = self.show_calls + 1
+
+        resource = ckan.action.resource_show(id = resource_id)
+        with self._lock:
+            with self._db:
+                self._db.execute('INSERT OR REPLACE INTO resources VALUES (?, ?, ?)',
+                                 (resource['id'], resource.get('package_id'), json.dumps(resource)))
+        return resource
+
+    def revalidate(self, ckan, ids_or_names):
+        """
+        Gets the current 'metadata_modified' of the packages through batched 
+        package_search calls.
+
+        Returns
+        -------
+        Dict
+            Dict of id or name given -> (package id, metadata_modified) for all
+            packages found.
+        """
+        current = {}
+        unique = list(dict.fromkeys(ids_or_names))
+        for ii in range(0, len(unique), self.batch_size):
+            batch = unique[ii:ii + self.batch_size]
+            terms = ' OR '.join('"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+                                for value in batch)
+            ret = ckan.action.package_search(fq = 'id:(' + terms + ') OR name:(' + terms + ')',
+                                             fl = ['id', 'name', 'metadata_modified'],
+                                             rows = len(batch),
+                                             include_private = True)
+            with self._lock:
+                self.search_calls = self.search_calls + 1
+            for package in ret['results']:
+                for key in (package['id'], package['name']):
+                    current[key] = (package['id'], package['metadata_modified'])
+
+        with self._lock:
+            now = time.time()
+            for package_id, metadata_modified in current.values():
+                row = self._db.execute('SELECT metadata_modified FROM packages WHERE id = ?',
+                                       (package_id,)).fetchone()
+                if (row is not None) and (row[0] == metadata_modified):
+                    self._validated[package_id] = now
+                else:
+                    self._validated.pop(package_id, None)
+        return current
+
+    def fetch_package(self, ckan, id_or_name):
+        """Gets a package through package_show and adds it to the store."""
+        with self._lock:
+            self.misses = self.misses + 1
+            self.show_calls = self.show_calls + 1
+        package = ckan.action.package_show(id = id_or_name)
+        self.add_package(package)
+        return package
+
+    def add_package(self, package):
+        """Adds a full package dict, including its resources, to the store."""
+        with self._lock:
+            with self._db:
+                self._db.execute('INSERT OR REPLACE INTO packages VALUES (?, ?, ?, ?, ?)',
+                                 (package['id'], package.get('name'), package.get('metadata_modified'),
+                                  json.dumps(package), time.time()))
+                for resource in package.get('resources', []):
+                    self._db.execute('INSERT OR REPLACE INTO resources VALUES (?, ?, ?)',
+                                     (resource['id'], package['id'], json.dumps(resource)))
+            self._validated[package['id']] = time.time()
+
+    def cache_stats(self):
+        """
+        Returns a dict with the number of hits and misses, and the number of
+        package_search and show calls made.
+        """
+        with self._lock:
+            return {'hits':         self.hits,
+                    'misses':       self.misses,
+                    'search_calls': self.search_calls,
+                    'show_calls':   self.show_calls}
+
+
+class CatalogIndex(object):
+    """
+    Offline index of the package metadata of a CKAN installation, kept in a
+    SQLite data base with a FTS5 full text table over the fields in
+    index_fields. Answers tag string queries locally, see search(). Words 
+    are stemmed (porter), so that e.g. 'wake' also finds 'wakes'.
+
+    The index is updated through refresh(): only packages modified since the
+    newest 'metadata_modified' in the index are fetched, and packages deleted
+    on the server are found through one light-weight search returning ids
+    only.
+
+    Parameters
+    ----------
+    db_file_name : String, optional
+        Dir and file name of the SQLite data base.
+        The default is './windlab_cache/catalog.sqlite'.
+
+    Example
+    -------
+    catalog = CatalogIndex()
+    catalog.refresh(client.ckan, client = client)
+    res = CK_Calls.search_local(windlab_data, catalog)
+    """
+
+    index_fields = ['title', 'notes', 'subject', 'variable', 'author', 'maintainer', 'tags']
+
+    def __init__(self,
+                 db_file_name   = './windlab_cache/catalog.sqlite'):
+
+        self.db_file_name = db_file_name
+
+        dir_name = os.path.dirname(db_file_name)
+        if (dir_name != '') and (os.path.isdir(dir_name) is False):
+            os.makedirs(dir_name)
+
+        self._lock  = threading.Lock()
+        self._db    = sqlite3.connect(db_file_name, check_same_thread = False)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS packages ('
+                             'id TEXT PRIMARY KEY, name TEXT, metadata_modified TEXT, payload TEXT)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)')
+            # Indices without stemming are rebuilt by the next refresh
+            row = self._db.execute("SELECT sql FROM sqlite_master WHERE name = 'packages_fts'").fetchone()
+            if (row is not None) and ('porter' not in row[0]):
+                self._db.execute('DROP TABLE packages_fts')
+                self._db.execute("DELETE FROM settings WHERE key = 'last_modified'")
+            self._db.execute('CREATE VIRTUAL TABLE IF NOT EXISTS packages_fts USING fts5('
+                             'id UNINDEXED, name, ' + ', '.join(self.index_fields) + 
+                             ", tokenize = 'porter unicode61')")
+
+    def close(self):
+        """Closes the data base."""
+        with self._lock:
+            self._db.close()
+
+    @property
+    def last_modified(self):
+        """Newest 'metadata_modified' in the index, or None if never refreshed."""
+        with self._lock:
+            row = self._db.execute("SELECT value FROM settings WHERE key = 'last_modified'").fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM packages').fetchone()[0]
+
+    def refresh(self, 
+                ckan, 
+                full = False,
+                rows = 1000,
+                page_workers = 4,
+                client = None):
+        """
+        Brings the index up to date with the CKAN installation.
+
+        Parameters
+        ----------
+        ckan : RemoteCKAN
+            Connection to the CKAN data base.
+        full : Boolean, optional
+            If True, all packages are fetched again. The default is False.
+        rows : Integer, optional
+            Number of packages per page of the search. The default is 1000.
+        page_workers : Integer, optional
+            Number of pages fetched in parallel. The default is 4.
+        client : WindLabClient, optional
+            Shared client with a pooled connection. The default is None.
+
+        Returns
+        -------
+        Dict
+            Dict with the number of packages 'updated' and 'removed'.
+        """
+        last_modified = None
+        if full is False:
+            last_modified = self.last_modified
+
+        # Packages deleted on the server, ids only
+        search_kwargs = {}
+        if last_modified is not None:
+            found = CK_helper.search_packages(ckan, rows = rows, page_workers = page_workers,
+                                              client = client, include_private = True,
+                                              q = '*:*', fl = ['id'])
+            timestamp = last_modified
+            if timestamp.endswith('Z') is False:
+                timestamp = timestamp + 'Z'
+            search_kwargs['fq'] = 'metadata_modified:[' + timestamp + ' TO *]'
+
+        packages = CK_helper.search_packages(ckan, rows = rows, page_workers = page_workers,
+                                             client = client, include_private = True,
+                                             q = '*:*', **search_kwargs)
+        if last_modified is None:
+            found = packages
+        found_ids = set(package['id'] for package in found)
+
+        with self._lock:
+            with self._db:
+                removed = [row[0] for row in self._db.execute('SELECT id FROM packages')
+                           if row[0] not in found_ids]
+                for package_id in removed:
+                    self._db.execute('DELETE FROM packages WHERE id = ?', (package_id,))
+                    self._db.execute('DELETE FROM packages_fts WHERE id = ?', (package_id,))
+
+                for package in packages:
+                    self._db.execute('INSERT OR REPLACE INTO packages VALUES (?, ?, ?, ?)',
+                                     (package['id'], package.get('name'), 
+                                      package.get('metadata_modified'), json.dumps(package)))
+                    self._db.execute('DELETE FROM packages_fts WHERE id = ?', (package['id'],))
+                    self._db.execute('INSERT INTO packages_fts VALUES (?, ?, ' 
+                                     + ', '.join('?' * len(self.index_fields)) + ')',
+                                     [package['id'], package.get('name')] + 
+                                     [self._to_text(package.get(field)) for field in self.index_fields])
+                    if ((last_modified is None) or 
+                            (package.get('metadata_modified', '') > last_modified)):
+                        last_modified = package.get('metadata_modified')
+
+                if last_modified is not None:
+                    self._db.execute("INSERT OR REPLACE INTO settings VALUES ('last_modified', ?)",
+                                     (last_modified,))
+
+        return {'updated': len(packages), 'removed': len(removed)}
+
+    def search(self, tag_string = None):
+        """
+        Returns the package dicts matching a tag string, best match first.
+
+        The tag string follows the Solr syntax of package_search: words and
+        "phrases" are searched in the fields in index_fields and the name, 
+        'field:value' and 'field:(group)' only in that field, which must be 
+        the name or one of index_fields. Terms are combined with AND, 
+        unless joined by OR, and excluded by NOT or a leading '-'; terms can 
+        be grouped in parentheses. As FTS5 has no unary NOT, an excluded 
+        term needs a term before it, e.g. 'wake -LES', not '-LES'. Words are
+        stemmed, while Solr's fuzzy, wildcard and range queries are not 
+        supported. If tag_string is None or '', all packages are returned.
+
+        Parameters
+        ----------
+        tag_string : String, optional
+            Words to search for, e.g. 'J. Dietrich'. The default is None.
+
+        Returns
+        -------
+        List
+            List of package dicts.
+
+        Raises
+        ------
+        ValueError
+            If the tag string is not a valid query, or searches a field not
+            in the index.
+        """
+        expression = self.match_expression(tag_string)
+
+        with self._lock:
+            if expression == '':
+                rows = self._db.execute('SELECT payload FROM packages ORDER BY id').fetchall()
+            else:
+                try:
+                    rows = self._db.execute('SELECT packages.payload FROM packages_fts '
+                                            'JOIN packages ON packages.id = packages_fts.id '
+                                            'WHERE packages_fts MATCH ? '
+                                            'ORDER BY bm25(packages_fts), packages.id',
+                                            (expression,)).fetchall()
+                except sqlite3.OperationalError as err:
+                    raise ValueError('Not able to search for "' + str(tag_string) + '": ' + str(err))
+        return [json.loads(row[0]) for row in rows]
+
+    def match_expression(self, tag_string):
+        """
+        Translates a tag string in Solr syntax (see search) into a FTS5 
+        MATCH expression. Returns '' if the tag string has no terms.
+        """
+        if tag_string is None:
+            return ''
+        fields = ['name'] + self.index_fields
+        tokens = re.findall(r'[+-]?(?:\w+:)?\(|\)|[+-]?(?:\w+:)?"[^"]*"|[+-]?(?:\w+:)?[^\s()"]+', 
+                            tag_string)
+        out = []
+        operator = None
+        for token in tokens:
+            if token in ['AND', '&&', 'OR', '||', 'NOT', '!']:
+                # 'AND NOT' is the binary NOT of FTS5
+                operator = {'&&': 'AND', '||': 'OR', '!': 'NOT'}.get(token, token)
+                continue
+            if token == ')':
+                out.append(')')
+                operator = None
+                continue
+            if token.startswith('-'):
+                operator = 'NOT'
+            token = token.lstrip('+-')
+            match = re.match(r'(\w+):(.*)$', token, re.S)
+            if match is None:
+                field, value = '', token
+            else:
+                field, value = match.groups()
+                if field not in fields:
+                    raise ValueError('Field "' + field + '" is not in the index, only ' 
+                                     + ', '.join(fields) + ': "' + tag_string + '"')
+            if value == '(':
+                term = '('
+            else:
+                words = re.findall(r'\w+', value)
+                if len(words) == 0:
+                    continue
+                term = '"' + ' '.join(words) + '"'
+            if field != '':
+                term = field + ' : ' + term
+
+            # Operator between the previous and this term, AND by default
+            if (len(out) > 0) and (out[-1].endswith('(') is False):
+                out.append(operator or 'AND')
+            elif operator == 'NOT':
+                raise ValueError('NOT needs a term before it: "' + tag_string + '"')
+            out.append(term)
+            operator = None
+        return ' '.join(out)
+
+    @staticmethod
+    def _to_text(value):
+        # Lists, e.g. of subjects or tags, and dicts are flattened into words
+        if value is None:
+            return ''
+        if isinstance(value, list):
+            return ' '.join(CatalogIndex._to_text(vv) for vv in value)
+        if isinstance(value, dict):
+            return ' '.join(CatalogIndex._to_text(vv) for vv in value.values())
+        return str(value)
@@ -1,18 +1,27 @@
 #!/usr/bin/env python
-from ckanapi import RemoteCKAN, NotAuthorized, NotFound
+from ckanapi import NotAuthorized, NotFound
+from concurrent.futures import ThreadPoolExecutor, Future
 import CKAN_API_Helper as CK_helper
+from CKAN_API_Client import WindLabClient
 import yaml  # needs pyyaml
 import sys
+import os
+import json
 
 
 
 data_format_list        = ['txt', 'csv', 'netcdf']
 database_format_list    = ['txt', 'csv', 'netcdf', 'yaml']
+mirror_state_file_name  = '.windlab_mirror.json'
 
 
 def write_datasets_via_file(access_dir_file_name= 'default.yml', 
                             dir_file_name       = None,
-                            level_num           = 0):
+                            level_num           = 0,
+                            client              = None,
+                            max_workers         = None,
+                            validation_cache    = None,
+                            lazy_netcdf         = False):
     """
     Function to push data, specified through a yaml file, into a ckan database
     
@@ -21,11 +30,24 @@ def write_datasets_via_file(access_dir_file_name= 'default.yml',
     ----------
     dir_file_name : String, optional
         Dir and file name of the yaml file. The default is None.
+    client : WindLabClient, optional
+        Shared client with a pooled connection, reused for all requests.
+        If given, its URL and access token are used, instead of reading 
+        them from file. The default is None.
+    max_workers : Integer, optional
+        Number of data sets written in parallel. The default is None.
+    validation_cache : yml_utils.ValidationCache, optional
+        Cache of schema validation results, see write_datasets. 
+        The default is None.
+    lazy_netcdf : Boolean, optional
+        Validate included netCDF files lazily, see write_datasets. 
+        The default is False.
 
     Returns
     -------
-    boolean : 
-        Boolean if process worked (True) or failed (False)
+    List or boolean : 
+        List of dicts with the result per resource, see write_datasets, or 
+        False if the yaml file could not be read.
 
     """
     level_num = level_num + 1
@@ -43,7 +65,8 @@ def write_datasets_via_file(access_dir_file_name= 'default.yml',
                                     process_name        = 'write_datasets',
                                     verbose             = True,
                                     error               = True,
-                                    level_num           = level_num)
+                                    level_num           = level_num,
+                                    client              = client)
             
         else:
             # not coded
@@ -67,7 +90,11 @@ def write_datasets_via_file(access_dir_file_name= 'default.yml',
                             windlab_data=windlab_data,
                             verbose=verbose,
                             error=error, 
-                            level_num = level_num)
+                            level_num = level_num,
+                            client = client,
+                            max_workers = max_workers,
+                            validation_cache = validation_cache,
+                            lazy_netcdf = lazy_netcdf)
     CK_helper.buffer_tabs(level_num)
     print('Exiting:  write_datasets_via_file()')
     return ret
@@ -78,7 +105,12 @@ def write_datasets(ckan_url,
                    windlab_data = [], 
                    verbose      = False, 
                    error        = False,
-                   level_num    = 0):
+                   level_num    = 0,
+                   client       = None,
+                   max_workers  = None,
+                   validation_cache = None,
+                   reuse_datasets = False,
+                   lazy_netcdf  = False):
     """
     Function to push data, specified through a set of variables, into a ckan database
     
@@ -94,11 +126,46 @@ def write_datasets(ckan_url,
         Boolean indicating to print messages to screen or not.
     error : Boolean, optional
         Boolean indicating to catch errors or not.
+    client : WindLabClient, optional
+        Shared client with a pooled connection, reused for all requests.
+        The default is None.
+    max_workers : Integer, optional
+        Number of data sets written in parallel. Within a data set, the 
+        package is always created before its resources, which are uploaded
+        one after the other. If None or 1, data sets are written one after the
+        other. The default is None.
+    validation_cache : yml_utils.ValidationCache, optional
+        On-disk cache of schema validation results, so that unchanged 
+        resources are not validated again. The default is None.
+    reuse_datasets : Boolean or Dict, optional
+        To re-run after a partial failure. If a Dict, maps titles to the ID 
+        or name of the data set of the earlier run, e.g. 
+        {entry['dataset']: entry['dataset_id'] for entry in failed_result}.
+        If True, a data set with the same title in the same organization is
+        searched for. A reused data set gets the current meta data, its 
+        resources with the same name and SHA-256 are skipped, and the ones 
+        with the same name but another content are replaced. If False, a 
+        new data set is always created. The default is False.
+    lazy_netcdf : Boolean, optional
+        If True, netCDF files included in yaml resources are validated 
+        without loading them into Python lists, see 
+        CK_helper.validate_yaml_with_schema. The default is False.
 
     Returns
     -------
-    boolean : 
-        Boolean if process worked (True) or failed (False)
+    List
+        List of dicts, one per resource, in the order of windlab_data, with 
+        the following key value pairs:
+            'dataset': title of the data set
+            'dataset_id': id of the created data set, or None
+            'resource': name of the resource, or None if the data set could
+                        not be created
+            'success': Boolean, True if the resource was written
+            'error': None, or the error message
+            'bytes_sent': number of bytes uploaded
+            'bytes_skipped': number of bytes not uploaded, as a resource
+                             with the same name and SHA-256 was already in 
+                             the reused data set
 
     """
     level_num = level_num + 1
@@ -106,47 +173,81 @@ def write_datasets(ckan_url,
         CK_helper.buffer_tabs(level_num)
         print('Entered "write_datasets()"')
     level_num = level_num + 1
-    # Dataset metadata to be uploaded to CKAN
-    success_list = []
-    for thisdata in windlab_data:
-
-        if 'schema_compliance' in thisdata['general_opt']:
-            schema_type = thisdata['general_opt']['schema_compliance']
-        else:
-            schema_type = None
 
-        org_disp_name = thisdata['general_requ']['owner_org_name']
+    def write_dataset(thisdata):
+        title = thisdata['general_requ'].get('title')
+        result_list = []
+        dataset_id = None
+        try:
+            if 'schema_compliance' in thisdata['general_opt']:
+                schema_type = thisdata['general_opt']['schema_compliance']
+            else:
+                schema_type = None
+
+            org_disp_name = thisdata['general_requ']['owner_org_name']
+
+            # get owner/organization ID
+            org_id = CK_helper.get_org_id_from_name(ckan_url = ckan_url, 
+                                                    api_token = api_token, 
+                                                    org_disp_name = org_disp_name, 
+                                                    verbose = verbose,
+                                                    error   = error,
+                                                    level_num = level_num,
+                                                    client  = client)
+            # check resource on scheema 
+            for this_res in thisdata['resource']:
+                # Checking resource on schema if requested.
+                if verbose: 
+                    CK_helper.buffer_tabs(level_num)
+                    print('++++++++++++++++++')
+                    CK_helper.buffer_tabs(level_num)
+                    print(this_res)
+                this_res = CK_helper.check_against_schema(this_res              = this_res,
+                                                    resource_schema_type  = schema_type,
+                                                    verbose               = verbose,
+                                                    error                 = error,
+                                                    level_num             = level_num,
+                                                    validation_cache      = validation_cache,
+                                                    lazy_netcdf           = lazy_netcdf)
+
+            # Reusing the data set of an earlier run, its resources fetched once
+            package, names_in_use = None, None
+            if isinstance(reuse_datasets, dict):
+                reuse_id = reuse_datasets.get(title)
+            else:
+                reuse_id = None
+            if (reuse_datasets is True) or (reuse_id is not None):
+                package, names_in_use = CK_helper.find_dataset(ckan_url   = ckan_url,
+                                                               api_token  = api_token,
+                                                               org_id     = org_id,
+                                                               thisdata   = thisdata,
+                                                               verbose    = verbose,
+                                                               error      = error,
+                                                               level_num  = level_num,
+                                                               client     = client,
+                                                               dataset_id = reuse_id)
+            if package is not None:
+                dataset_id = package['id']
+                existing_resources = package.get('resources', [])
+                meta_data = CK_helper.dataset_meta_data(org_id, thisdata)
+                CK_helper.get_ckan(ckan_url, api_token = api_token, 
+                                   client = client).action.package_patch(id = dataset_id, **meta_data)
+            else:
+                # Creating a package/entry to ckan 
+                dataset_id = CK_helper.setup_dataset(ckan_url   = ckan_url,
+                                                     api_token  = api_token,
+                                                     org_id     = org_id,
+                                                     thisdata   = thisdata,
+                                                     verbose    = verbose,
+                                                     error      = error,
+                                                     level_num  = level_num,
+                                                     client     = client,
+                                                     names_in_use = names_in_use)
+                if len(dataset_id) == 0:
+                    return [{'dataset': title, 'dataset_id': None, 'resource': None,
+                             'success': False, 'error': 'Not able to create data set'}]
+                existing_resources = []
 
-        # get owner/organization ID
-        org_id = CK_helper.get_org_id_from_name(ckan_url = ckan_url, 
-                                                api_token = api_token, 
-                                                org_disp_name = org_disp_name, 
-                                                verbose = verbose,
-                                                error   = error,
-                                                level_num = level_num)
-        # check resource on scheema 
-        for this_res in thisdata['resource']:
-            # Checking resource on schema if requested.
-            if verbose: 
-                CK_helper.buffer_tabs(level_num)
-                print('++++++++++++++++++')
-                CK_helper.buffer_tabs(level_num)
-                print(this_res)
-            this_res = CK_helper.check_against_schema(this_res              = this_res,
-                                                resource_schema_type  = schema_type,
-                                                verbose               = verbose,
-                                                error                 = error,
-                                                level_num             = level_num)
-
-        # Creating a package/entry to ckan 
-        dataset_id = CK_helper.setup_dataset(ckan_url   = ckan_url,
-                                             api_token  = api_token,
-                                             org_id     = org_id,
-                                             thisdata   = thisdata,
-                                             verbose    = verbose,
-                                             error      = error,
-                                             level_num  = level_num)
-        if len(dataset_id) > 0:
             # dumpng the data
             if verbose: 
                 CK_helper.buffer_tabs(level_num)
@@ -159,34 +260,66 @@ def write_datasets(ckan_url,
                                                   resource_schema_type=schema_type,
                                                   verbose=verbose,
                                                   error = error,
-                                                  level_num = level_num)
+                                                  level_num = level_num,
+                                                  validation_cache = validation_cache,
+                                                  lazy_netcdf = lazy_netcdf)
                 # Dropping resource
+                upload_info = {}
                 res_ret = CK_helper.write_resource(ckan_url,
                                                    api_token,
                                                    dataset_id,
                                                    this_res=this_res,
                                                    verbose=verbose,
                                                    error=error,
-                                                   level_num = level_num)
-                success_list.append(res_ret)
-
-        pass
+                                                   level_num = level_num,
+                                                   client = client,
+                                                   upload_info = upload_info,
+                                                   existing_resources = existing_resources)
+                result_list.append({'dataset': title, 'dataset_id': dataset_id, 
+                                    'resource': this_res.get('name'), 'success': res_ret is True,
+                                    'error': None if res_ret is True else 'Not able to write resource',
+                                    'bytes_sent': upload_info.get('bytes_sent', 0),
+                                    'bytes_skipped': upload_info.get('bytes_skipped', 0)})
+        except Exception as err:
+            if error:
+                raise
+            result_list.append({'dataset': title, 'dataset_id': dataset_id or None, 'resource': None,
+                                'success': False, 'error': str(err)})
+        return result_list
+
+    # Dataset metadata to be uploaded to CKAN. A WindLabClient gives each 
+    # worker thread its own session on a shared pool, and resolves 
+    # organizations once for all data sets.
+    success_list = []
+    own_client = client is None
+    if own_client:
+        client = WindLabClient(ckan_url, api_token = api_token, pool_maxsize = max(max_workers or 1, 1))
+    try:
+        if (max_workers is None) or (max_workers <= 1):
+            for thisdata in windlab_data:
+                success_list.extend(write_dataset(thisdata))
+        else:
+            with ThreadPoolExecutor(max_workers = max_workers) as executor:
+                for result_list in executor.map(write_dataset, windlab_data):
+                    success_list.extend(result_list)
+    finally:
+        if own_client:
+            client.close()
 
-    if False in success_list:
-        if verbose:
-            CK_helper.buffer_tabs(level_num)
-            print('Exitiung "write_datasets()"')
-        return False
-    else:
-        if verbose:
-            CK_helper.buffer_tabs(level_num)
-            print('Exitiung "write_datasets()"')
-        return True
+    if verbose:
+        num_failed = len([entry for entry in success_list if entry['success'] is False])
+        CK_helper.buffer_tabs(level_num)
+        print('Written ', len(success_list) - num_failed, ' resources, failed ', num_failed,
+              ', bytes skipped ', sum(entry.get('bytes_skipped', 0) for entry in success_list))
+        CK_helper.buffer_tabs(level_num)
+        print('Exitiung "write_datasets()"')
+    return success_list
 
     
 
 def delete_datasets_via_file(dir_file_name=None,
-                             level_num = 0):
+                             level_num = 0,
+                             client = None):
     """
     Deletes a data sets form the CKAN installation, using the unqiue dataset 
     names. To be deleted dataset need to be supplied through yaml file, which 
@@ -196,6 +329,10 @@ def delete_datasets_via_file(dir_file_name=None,
     ----------
     dir_file_name : TYPE, optional
         DESCRIPTION. The default is None.
+    client : WindLabClient, optional
+        Shared client with a pooled connection, reused for all requests.
+        If given, its URL and access token are used, instead of reading 
+        them from file. The default is None.
 
     Returns
     -------
@@ -204,8 +341,12 @@ def delete_datasets_via_file(dir_file_name=None,
 
     """
     # get ULR for API
-    ckan_url, api_token, verbose, error = \
-        CK_helper.read_access(dir_file_name = 'default.yml')
+    if client is None:
+        ckan_url, api_token, verbose, error = \
+            CK_helper.read_access(dir_file_name = 'default.yml')
+    else:
+        ckan_url, api_token, verbose, error = \
+            client.ckan_url, client.api_token, client.verbose, client.error
     
     # get info from setup file
     with open(dir_file_name, 'r') as file:
@@ -223,7 +364,8 @@ def delete_datasets_via_file(dir_file_name=None,
                           windlab_data=windlab_data, 
                           verbose=verbose,
                           error=error,
-                          level_num = level_num)
+                          level_num = level_num,
+                          client = client)
     return ret
 
 
@@ -232,7 +374,8 @@ def delete_datasets(ckan_url,
                     windlab_data, 
                     verbose=False, 
                     error=False,
-                    level_num    = 0):
+                    level_num    = 0,
+                    client       = None):
     """
     Deletes a data sets form the CKAN installation, using the unqiue dataset 
     names. To be deleted dataset need to be supplied through a set of variables.
@@ -249,6 +392,9 @@ def delete_datasets(ckan_url,
         Boolean indicating to print messages to screen or not.
     error : Boolean, optional
         Boolean indicating to catch errors or not.
+    client : WindLabClient, optional
+        Shared client with a pooled connection, reused for all requests.
+        The default is None.
 
     Returns
     -------
@@ -274,7 +420,8 @@ def delete_datasets(ckan_url,
                                             dataset_name, 
                                             verbose = verbose,
                                             error = error, 
-                                            level_num = level_num)
+                                            level_num = level_num,
+                                            client = client)
         if len(dataset_ids) >1:
             print('Too many data sets found with same name. Please use data set unique id.')
             dataset_ids = None
@@ -292,7 +439,7 @@ def delete_datasets(ckan_url,
         success_list.append({dataset_name: False})
     else:
         # Connect to the CKAN instance
-        ckan = RemoteCKAN(ckan_url, apikey=api_token)
+        ckan = CK_helper.get_ckan(ckan_url, api_token, client = client)
         
         try:
             # Delete the dataset
@@ -319,7 +466,8 @@ def delete_datasets(ckan_url,
     return success_list
 
 
-def search_datasets_via_file(yml_dir_file_name=None):
+def search_datasets_via_file(yml_dir_file_name=None,
+                             client=None):
     '''
     Main function to access the WindLAB ckan data base. Returns the DataCite 
     meta data, based on search criterias.
@@ -329,6 +477,10 @@ def search_datasets_via_file(yml_dir_file_name=None):
     yml_dir_file_name : String, optional
         File and path name of the yaml file. Abs path name needed. 
         The default is None.
+    client : WindLabClient, optional
+        Shared client with a pooled connection, reused for all requests.
+        If given, its URL and access token are used, instead of reading 
+        them from file. The default is None.
 
     Returns
     -------
@@ -342,14 +494,17 @@ def search_datasets_via_file(yml_dir_file_name=None):
         
     # get info from setup file
     ckan_url, api_token, windlab_data, verbose, error = \
-        CK_helper.read_setup(yml_dir_file_name=yml_dir_file_name, 
+        CK_helper.read_setup(dir_file_name=yml_dir_file_name, 
                              process_name='search_datasets')
+    if client is not None:
+        ckan_url, api_token = client.ckan_url, client.api_token
     
     ret = search_datasets(ckan_url=ckan_url,
                           api_token=api_token,
                           windlab_data=windlab_data,
                           verbose=verbose,
-                          error=error)
+                          error=error,
+                          client=client)
     return ret
 
 
@@ -358,7 +513,10 @@ def search_datasets(ckan_url,
                     windlab_data,
                     verbose=False,
                     error=False,
-                    level_num    = 0):
+                    level_num    = 0,
+                    client       = None,
+                    rows         = 100,
+                    page_workers = 4):
     '''
     Function to access the WindLAB ckan data base. Returns the DataCite 
     meta data, based on search criterias.
@@ -375,6 +533,16 @@ def search_datasets(ckan_url,
         Boolean indicating to print messages to screen or not.
     error : Boolean, optional
         Boolean indicating to catch errors or not.
+    client : WindLabClient, optional
+        Shared client with a pooled connection, reused for all requests.
+        The default is None.
+    rows : Integer, optional
+        Number of data sets per page of the search. The default is 100.
+    page_workers : Integer, optional
+        Number of pages of the search fetched in parallel. The default is 4.
+    chunks : Dict, String or None, optional
+        Dask chunks of netCDF resources, see CK_helper.open_netcdf. Only 
+        used if the optional dask is installed. The default is {}.
 
     Returns
     -------
@@ -396,12 +564,11 @@ def search_datasets(ckan_url,
         return []
 
     list_of_data_sets = []
+    dataset_ids = set()
 
     # Example: Connecting to CKAN instance (replace with the actual CKAN URL)
     # like a handle to the web service of ckan
-    ckan = RemoteCKAN(ckan_url)
-    start = 0
-    rows = 10
+    ckan = CK_helper.get_ckan(ckan_url, client = client)
 
     for data in windlab_data:
         tag_strings = data['data']['tag_strings']
@@ -415,25 +582,24 @@ def search_datasets(ckan_url,
             # Search datasets by keyword
             if (tag_string == None) or (tag_string == ''):
                 # Search datasets NOT by keywords
-                while True:
-                    datasets = ckan.action.package_search(include_private=True,
-                                                          start=start, 
-                                                          rows = rows)
-                    list_of_data_sets.extend(datasets['results'])
-                    if datasets["count"] <= start + rows:
-                        break
-                    start += rows
-                    
+                datasets = CK_helper.search_packages(ckan,
+                                                     rows = rows,
+                                                     page_workers = page_workers,
+                                                     client = client,
+                                                     include_private=True)
             else:
-                while True:
-                    datasets = ckan.action.package_search(include_private=True, 
-                                                          q=tag_string, 
-                                                          start=start, 
-                                                          rows = rows)
-                    list_of_data_sets.extend(datasets['results'])
-                    if datasets["count"] <= start + rows:
-                        break
-                    start += rows
+                datasets = CK_helper.search_packages(ckan,
+                                                     rows = rows,
+                                                     page_workers = page_workers,
+                                                     client = client,
+                                                     include_private=True,
+                                                     q=tag_string)
+
+            # Data sets found through several tags are only returned once
+            for dataset in datasets:
+                if dataset['id'] not in dataset_ids:
+                    dataset_ids.add(dataset['id'])
+                    list_of_data_sets.append(dataset)
     if verbose:
         CK_helper.buffer_tabs(level_num)
         print('Exiting: search_datasets()')
@@ -441,9 +607,271 @@ def search_datasets(ckan_url,
     return list_of_data_sets
 
 
+def search_local(windlab_data,
+                 catalog_index,
+                 verbose=False,
+                 error=False,
+                 level_num = 0):
+    '''
+    Same as search_datasets, but answered from a local CatalogIndex without 
+    any request to the server. Use catalog_index.refresh() to update it.
+    Tag strings take words, "phrases", field:value, field:(group), AND, OR,
+    NOT/-word and parentheses as in Solr, but no wildcard, fuzzy or range 
+    queries, only fields stored in the index, and NOT needs a term before 
+    it; see CatalogIndex.search.
+
+    Parameters
+    ----------
+    windlab_data : Dict
+        Dict of the querrie
+    catalog_index : CatalogIndex
+        Local index of the package metadata.
+    verbose : Boolean, optional
+        Boolean indicating to print messages to screen or not.
+    error : Boolean, optional
+        Boolean indicating to catch errors or not.
+
+    Returns
+    -------
+    List
+        List of package dicts, as returned by search_datasets.
+    '''
+    level_num = level_num + 1
+    if verbose:
+        CK_helper.buffer_tabs(level_num)
+        print('Started: search_local()')
+
+    list_of_data_sets = []
+    dataset_ids = set()
+
+    for data in windlab_data:
+        tag_strings = data['data']['tag_strings']
+
+        if (type(tag_strings) is str) or (type(tag_strings) is type(None)):
+            tag_strings = [tag_strings]
+
+        for tag_string in tag_strings:
+            # Data sets found through several tags are only returned once
+            for dataset in catalog_index.search(tag_string):
+                if dataset['id'] not in dataset_ids:
+                    dataset_ids.add(dataset['id'])
+                    list_of_data_sets.append(dataset)
+    if verbose:
+        CK_helper.buffer_tabs(level_num)
+        print('Exiting: search_local()')
+
+    return list_of_data_sets
+
+
+def iter_datasets(ckan_url,
+                  api_token,
+                  windlab_data,
+                  verbose=False,
+                  error=False,
+                  level_num    = 0,
+                  client       = None,
+                  rows         = 100):
+    '''
+    Generator version of search_datasets. Data sets are yielded as the pages
+    of the search arrive, so that processing can start right away and 
+    stopping early saves the remaining requests.
+
+    Parameters
+    ----------
+    ckan_url : String
+        URL of WindLab or other CKAn installation
+    api_token : String
+        String of the required API token
+    windlab_data : Dict
+        Dict of the querrie, as for search_datasets
+    verbose : Boolean, optional
+        Boolean indicating to print messages to screen or not.
+    error : Boolean, optional
+        Boolean indicating to catch errors or not.
+    client : WindLabClient, optional
+        Shared client with a pooled connection, reused for all requests.
+        The default is None.
+    rows : Integer, optional
+        Number of data sets per page of the search. The default is 100.
+    chunks : Dict, String or None, optional
+        Dask chunks of netCDF resources, see CK_helper.open_netcdf. Only 
+        used if the optional dask is installed. The default is {}.
+
+    Yields
+    ------
+    Dict
+        DataCite meta data of a data set.
+    '''
+    level_num = level_num + 1
+    if verbose:
+        CK_helper.buffer_tabs(level_num)
+        print('Started: iter_datasets()')
+
+    # Cehck for ckan_url
+    if ckan_url is None:
+        print('No URL supplied. Program will terminate.')
+        return
+
+    ckan = CK_helper.get_ckan(ckan_url, client = client)
+    dataset_ids = set()
+
+    for data in windlab_data:
+        tag_strings = data['data']['tag_strings']
+
+        if (type(tag_strings) is str) or (type(tag_strings) is type(None)):
+            tag_strings = [tag_strings]
+
+        for tag_string in tag_strings:
+            search_kwargs = {'include_private': True}
+            if (tag_string != None) and (tag_string != ''):
+                search_kwargs['q'] = tag_string
+            for dataset in CK_helper.iter_packages(ckan, rows = rows, **search_kwargs):
+                # Data sets found through several tags are only yielded once
+                if dataset['id'] in dataset_ids:
+                    continue
+                dataset_ids.add(dataset['id'])
+                yield dataset
+
+    if verbose:
+        CK_helper.buffer_tabs(level_num)
+        print('Exiting: iter_datasets()')
+
+
+def iter_resources(ckan_url,
+                   api_token,
+                   windlab_data,
+                   verbose=False,
+                   error=False,
+                   level_num    = 0,
+                   client       = None,
+                   cache        = None,
+                   metadata_cache = None,
+                   resolve_from_search = True,
+                   rows         = 100,
+                   chunks       = {}):
+    '''
+    Generator version of read_datasets. Resources are yielded one by one, as
+    soon as the page of their data set arrived and the resource has been 
+    read, so that processing can start right away and stopping early saves 
+    the remaining searches and downloads.
+
+    Parameters
+    ----------
+    ckan_url : String
+        URL of WindLab or other CKAn installation
+    api_token : String
+        String of the required API token
+    windlab_data : Dict
+        Dict of the data set to be read in, as for read_datasets
+    verbose : Boolean, optional
+        Boolean indicating to print messages to screen or not.
+    error : Boolean, optional
+        Boolean indicating to catch errors or not.
+    client : WindLabClient, optional
+        Shared client with a pooled connection, reused for all requests.
+        The default is None.
+    cache : ResourceCache, optional
+        Local cache of resources. The default is None.
+    metadata_cache : MetadataCache, optional
+        Local store of package and resource metadata. The default is None.
+    resolve_from_search : Boolean, optional
+        If True, resources are taken straight from the package_search results.
+        The default is True.
+    rows : Integer, optional
+        Number of data sets per page of the search. The default is 100.
+    chunks : Dict, String or None, optional
+        Dask chunks of netCDF resources, see CK_helper.open_netcdf. Only 
+        used if the optional dask is installed. The default is {}.
+
+    Yields
+    ------
+    Dict
+        Entry of a resource, same as the inner elements returned by 
+        read_datasets.
+    '''
+    level_num = level_num + 1
+    if verbose:
+        CK_helper.buffer_tabs(level_num)
+        print('Started: iter_resources()')
+        level_num = level_num + 1
+
+    # Cehck for ckan_url
+    if ckan_url is None:
+        print('No URL supplied. Program will terminate.')
+        return
+
+    ckan = CK_helper.get_ckan(ckan_url, client = client)
+    dataset_keys = set()
+
+    for data in windlab_data['data']:
+        resource_type   = data['data']['resource_type']
+        tag_strings     = data['data']['tag_strings']
+        write_to_file   = data['data']['write_to_file']
+        dir_name        = data['data']['dir_name']
+
+        if resource_type not in ['link', 'file', None]:
+            print('requeste resource type not coded: ', resource_type)
+            return
+        # Resources of unknown type are not written to file by read_datasets
+        if resource_type == None:
+            write_to_file = False
+
+        if (type(tag_strings) is str) or (type(tag_strings) is type(None)):
+            tag_strings = [tag_strings]
+
+        for tag_string in tag_strings:
+            search_kwargs = {'include_private': True}
+            if (tag_string != None) and (tag_string != ''):
+                search_kwargs['q'] = tag_string
+
+            for dataset in CK_helper.iter_packages(ckan, rows = rows, **search_kwargs):
+                # Data sets found through several tags are only read once
+                dataset_key = (dataset['id'], resource_type, write_to_file, dir_name)
+                if dataset_key in dataset_keys:
+                    continue
+                dataset_keys.add(dataset_key)
+
+                # Resolve data set from search payload if possible
+                if resolve_from_search and is_package_resolved(dataset):
+                    if metadata_cache is not None:
+                        metadata_cache.add_package(dataset)
+                elif metadata_cache is not None:
+                    dataset = metadata_cache.package_show(ckan, dataset['id'])
+                else:
+                    dataset = ckan.action.package_show(name_or_id=dataset['id'])
+                name = dataset['name']
+                if verbose:
+                    CK_helper.buffer_tabs(level_num)
+                    print('data set name is "', name, '"')
+
+                for rr in dataset['resources']:
+                    if resource_type == 'link':
+                        if (rr['url_type'] == '') or (rr['url_type'] == None):
+                            yield {'name': name, 'resource': {'url' : rr['url']}}
+                    elif rr['format'].lower() in database_format_list:
+                        yield read_resource_entry(ckan,
+                                                  name = name,
+                                                  resource_id = rr['id'],
+                                                  write_to_file = write_to_file,
+                                                  dir_name = dir_name,
+                                                  level_num = level_num,
+                                                  client = client,
+                                                  cache = cache,
+                                                  metadata_cache = metadata_cache,
+                                                  chunks = chunks)
+
+    if verbose:
+        CK_helper.buffer_tabs(level_num)
+        print('Exiting: iter_resources()')
+
+
 def read_datasets_via_file(access_dir_file_name = 'default.yml',
                            dir_file_name        = None,
-                           level_num            = 0):
+                           level_num            = 0,
+                           client               = None,
+                           max_workers          = None,
+                           cache                = None,
+                           metadata_cache       = None):
     '''
     Main function to access the WindLAB ckan data based. Can return data or 
     download files from the data base.
@@ -453,6 +881,16 @@ def read_datasets_via_file(access_dir_file_name = 'default.yml',
     dir_file_name : String
         File and path name of the yaml file. Abs path name needed. 
         The default is None.
+    client : WindLabClient, optional
+        Shared client with a pooled connection, reused for all requests.
+        If given, its URL and access token are used, instead of reading 
+        them from file. The default is None.
+    max_workers : Integer, optional
+        Number of resources downloaded in parallel. The default is None.
+    cache : ResourceCache, optional
+        Local cache of resources. The default is None.
+    metadata_cache : MetadataCache, optional
+        Local store of package and resource metadata. The default is None.
 
     Returns
     -------
@@ -464,16 +902,17 @@ def read_datasets_via_file(access_dir_file_name = 'default.yml',
             'data': Either the data of the resource, or the file name with path
     '''
     level_num = level_num + 1
-    if verbose:
-        CK_helper.buffer_tabs(level_num)
-        print('Started: read_datasets_via_file()')
         
     # get info from setup file
     ckan_url, api_token, windlab_data, verbose, error = \
         CK_helper.read_yaml(access_dir_file_name= access_dir_file_name,
                             dir_file_name       = dir_file_name, 
                             process_name        = 'read_datasets',
-                            level_num           = level_num)
+                            level_num           = level_num,
+                            client              = client)
+    if verbose:
+        CK_helper.buffer_tabs(level_num)
+        print('Started: read_datasets_via_file()')
 
     
     ret = read_datasets(ckan_url        = ckan_url,
@@ -481,19 +920,103 @@ def read_datasets_via_file(access_dir_file_name = 'default.yml',
                           windlab_data  = windlab_data,
                           verbose       = verbose,
                           error         = error,
-                          level_num     = level_num)
+                          level_num     = level_num,
+                          client        = client,
+                          max_workers   = max_workers,
+                          cache         = cache,
+                          metadata_cache = metadata_cache)
     if verbose:
         CK_helper.buffer_tabs(level_num)
         print('Exiting: read_datasets_via_file()')
     return ret
 
 
+def is_package_resolved(dataset):
+    '''
+    Checks if a package dict, e.g. from package_search, contains all fields 
+    read_datasets needs, so that no package_show is required.
+
+    Returns
+    -------
+    Boolean
+        True if the name and all resources with their id, url, url_type and 
+        format are given.
+    '''
+    if ('name' not in dataset) or ('resources' not in dataset):
+        return False
+    if ('num_resources' in dataset) and (dataset['num_resources'] != len(dataset['resources'])):
+        return False
+    for rr in dataset['resources']:
+        for key in ['id', 'url', 'url_type', 'format']:
+            if key not in rr:
+                return False
+    return True
+
+
+def read_resource_entry(ckan,
+                        name,
+                        resource_id,
+                        write_to_file   = False,
+                        dir_name        = '',
+                        level_num       = 0,
+                        client          = None,
+                        cache           = None,
+                        metadata_cache  = None,
+                        chunks          = {}):
+    '''
+    Reads a single resource through CK_helper.read_resource and returns its 
+    entry for the list of resources, including the success of the download.
+    Exceptions are caught and reported in the entry, so that one failing 
+    resource does not stop the others. Can be run in a worker thread. 
+    chunks are the dask chunks of netCDF resources, see 
+    CK_helper.open_netcdf.
+
+    Returns
+    -------
+    Dict
+        Dict with the following key value pairs:
+            'name': name of the Dataset
+            'resource': Either the data of the resource, or the file name with path
+            'success': Boolean, True if the resource could be read
+            'error': None, or the error message if the resource could not be read
+    '''
+    # Each thread to use its own connection of the client
+    if client is not None:
+        ckan = client.ckan
+    try:
+        resource = CK_helper.read_resource(ckan,
+                                           name = name,
+                                           resource_id = resource_id,
+                                           write_to_file = write_to_file,
+                                           dir_name = dir_name,
+                                           level_num = level_num,
+                                           client = client,
+                                           cache = cache,
+                                           metadata_cache = metadata_cache,
+                                           chunks = chunks)
+    except Exception as err:
+        return {'name': name, 'resource': None, 'success': False, 'error': str(err)}
+
+    if (resource is None) or (isinstance(resource, list) and len(resource) == 0):
+        return {'name': name, 'resource': resource, 'success': False,
+                'error': 'Not able to read resource "' + str(resource_id) + '"'}
+    return {'name': name, 'resource': resource, 'success': True, 'error': None}
+
+
 def read_datasets(ckan_url,
                   api_token,
                   windlab_data,
                   verbose=False,
                   error=False,
-                  level_num    = 0):
+                  level_num    = 0,
+                  client       = None,
+                  max_workers  = None,
+                  cache        = None,
+                  metadata_cache = None,
+                  resolve_from_search = True,
+                  rows         = 100,
+                  page_workers = 4,
+                  chunks       = {}):
     '''
     Main function to access the WindLAB ckan data based. Can return data or 
     download files from the data base.
@@ -510,15 +1033,42 @@ def read_datasets(ckan_url,
         Boolean indicating to print messages to screen or not.
     error : Boolean, optional
         Boolean indicating to catch errors or not.
+    client : WindLabClient, optional
+        Shared client with a pooled connection, reused for all requests.
+        The default is None.
+    max_workers : Integer, optional
+        Number of resources downloaded in parallel. If None or 1, resources 
+        are downloaded one after the other. The default is None.
+    cache : ResourceCache, optional
+        Local cache of resources. Unchanged resources are taken from the cache
+        instead of being downloaded again. The default is None.
+    metadata_cache : MetadataCache, optional
+        Local store of package and resource metadata, revalidated through one
+        package_search instead of a package_show per data set.
+        The default is None.
+    resolve_from_search : Boolean, optional
+        If True, resources are taken straight from the package_search results,
+        and package_show is only called for data sets where the search results
+        miss fields. The default is True.
+    rows : Integer, optional
+        Number of data sets per page of the search. The default is 100.
+    page_workers : Integer, optional
+        Number of pages of the search fetched in parallel. The default is 4.
+    chunks : Dict, String or None, optional
+        Dask chunks of netCDF resources, see CK_helper.open_netcdf. Only 
+        used if the optional dask is installed. The default is {}.
 
     Returns
     -------
     List of Lists
         Each outer list corresponds to a Dataset.
         Each inner elements of the list refers to a resource of the Dataset.
-        Each entry is a dict, containing the following two key value pairs:
+        Each entry is a dict, containing the following key value pairs:
             'name': name of the Dataset
-            'data': Either the data of the resource, or the file name with path
+            'resource': Either the data of the resource, or the file name with path
+        Resources of type 'file' have in addition:
+            'success': Boolean, True if the resource could be read
+            'error': None, or the error message if the resource could not be read
     '''
     level_num = level_num + 1
     if verbose:
@@ -535,123 +1085,179 @@ def read_datasets(ckan_url,
 
     list_of_data_sets = []
     list_of_resources = []
-    start = 0
-    rows = 10
+    dataset_keys = set()
 
     # Example: Connecting to CKAN instance (replace with the actual CKAN URL)
     # like a handle to the web service of ckan
-    ckan = RemoteCKAN(ckan_url)
-
-    for data in windlab_data['data']:
-        resource_type   = data['data']['resource_type']
-        tag_strings     = data['data']['tag_strings']
-        write_to_file   = data['data']['write_to_file']
-        dir_name        = data['data']['dir_name']
+    ckan = CK_helper.get_ckan(ckan_url, client = client)
+
+    # Downloading resources in parallel if requested. Worker threads need a
+    # WindLabClient, as it gives each thread its own session on a shared pool.
+    executor = None
+    own_client = False
+    if (max_workers is not None) and (max_workers > 1):
+        if client is None:
+            client = WindLabClient(ckan_url, pool_maxsize = max_workers)
+            own_client = True
+        executor = ThreadPoolExecutor(max_workers = max_workers)
+
+    def read_entry(*args, **kwargs):
+        if executor is None:
+            return read_resource_entry(*args, **kwargs)
+        return executor.submit(read_resource_entry, *args, **kwargs)
+
+    try:
+        for data in windlab_data['data']:
+            resource_type   = data['data']['resource_type']
+            tag_strings     = data['data']['tag_strings']
+            write_to_file   = data['data']['write_to_file']
+            dir_name        = data['data']['dir_name']
         
-        # Checking that tag_strings of correct type
-        if type(tag_strings) is str:
-            tag_strings = [tag_strings]
-        elif type(tag_strings) is type(None):
-            tag_strings = [tag_strings]
+            # Checking that tag_strings of correct type
+            if type(tag_strings) is str:
+                tag_strings = [tag_strings]
+            elif type(tag_strings) is type(None):
+                tag_strings = [tag_strings]
             
-        # Going through each entry in tag_strings
-        for tag_string in tag_strings:
-            # Search datasets by keyword
-            if (tag_string == None) or (tag_string == ''):
-                # Search datasets NOT by keywords
-                while True:
-                    datasets = ckan.action.package_search(start=start, 
-                                                          rows = rows,
-                                                          include_private=True)
-                    list_of_data_sets.extend(datasets['results'])
-                    if datasets["count"] <= start + rows:
-                        break
-                    start += rows
-            else:
-                while True:
-                    datasets = ckan.action.package_search(q=tag_string, 
-                                                          start=start, 
-                                                          rows = rows,
-                                                          include_private=True)
-                    list_of_data_sets.extend(datasets['results'])
-                    if datasets["count"] <= start + rows:
-                        break
-                    start += rows
-
-            # Check if querry returned entries
-            if len(list_of_data_sets) == 0:
-                if verbose:
-                    CK_helper.buffer_tabs(level_num)
-                    print('No data set found with tag: ', tag_strings)
+            # Going through each entry in tag_strings
+            for tag_string in tag_strings:
+                # Search datasets by keyword
+                if (tag_string == None) or (tag_string == ''):
+                    # Search datasets NOT by keywords
+                    datasets = CK_helper.search_packages(ckan,
+                                                         rows = rows,
+                                                         page_workers = page_workers,
+                                                         client = client,
+                                                         include_private=True)
+                else:
+                    datasets = CK_helper.search_packages(ckan,
+                                                         rows = rows,
+                                                         page_workers = page_workers,
+                                                         client = client,
+                                                         include_private=True,
+                                                         q=tag_string)
+
+                # Data sets found through several tags are only read once
+                list_of_data_sets = []
+                for dataset in datasets:
+                    dataset_key = (dataset['id'], resource_type, write_to_file, dir_name)
+                    if dataset_key not in dataset_keys:
+                        dataset_keys.add(dataset_key)
+                        list_of_data_sets.append(dataset)
+
+                # Check if querry returned entries
+                if len(list_of_data_sets) == 0:
+                    if verbose:
+                        CK_helper.buffer_tabs(level_num)
+                        print('No data set found with tag: ', tag_strings)
     
-            # Get list of IDs  
-            dataset_ids = []
-            for dataset in list_of_data_sets:
-                dataset_ids.append(dataset['id'])
-                if verbose:
-                    CK_helper.buffer_tabs(level_num)
-                    print(dataset['title'])
+                # Get list of IDs  
+                dataset_ids = []
+                for dataset in list_of_data_sets:
+                    dataset_ids.append(dataset['id'])
+                    if verbose:
+                        CK_helper.buffer_tabs(level_num)
+                        print(dataset['title'])
     
-            # Go through each data set and see if to be selected due to other settings.
-            for dataset_id in dataset_ids:
-                resource_list = []
-                # Fetch dataset details by its ID or name
-                dataset = ckan.action.package_show(name_or_id=dataset_id)
-                name = dataset['name']
-                if verbose:
-                    CK_helper.buffer_tabs(level_num)
-                    print(' ')
-                    CK_helper.buffer_tabs(level_num)
-                    print('++++++++++++++++++++++++++++++++++++++++++++++++++')
-                    CK_helper.buffer_tabs(level_num)
-                    print('data set name is "', name, '"')
-                if resource_type == 'link':
-                    for rr in dataset['resources']:
-                        if (rr['url_type'] == '') or (rr['url_type'] == None):
-                            resources_url = rr['url']
-                            resource_list.append({'name': name, 'resource': {'url' : resources_url}})
-                elif resource_type == 'file':
-                    for rr in dataset['resources']:
-                        if rr['format'].lower() in database_format_list:
-                            resource_id = rr['id']
-                            resource = CK_helper.read_resource(ckan,
-                                                 name = name,
-                                                 resource_id = resource_id,
-                                                 write_to_file=write_to_file,
-                                                 dir_name = dir_name,
-                                                 level_num = level_num)
-                            resource_list.append({'name': name, 'resource': resource})
-                elif resource_type == None:
-                    for rr in dataset['resources']:
-                        if rr['format'].lower() in database_format_list:
-                            if verbose:
-                                CK_helper.buffer_tabs(level_num)
-                                print('Full')
-                                CK_helper.buffer_tabs(level_num)
-                                print(rr['name'])
-                            resource_id = rr['id']
-                            resource = CK_helper.read_resource(ckan,
-                                                 name = name,
-                                                 resource_id = resource_id,
-                                                 dir_name = dir_name,
-                                                 level_num = level_num)
-                            resource_list.append({'name': name, 'resource': resource})
-                        else:
-                            if verbose:
-                                CK_helper.buffer_tabs(level_num)
-                                print('empty')
-                                CK_helper.buffer_tabs(level_num)
-                                print(rr['name'])
-                    
-                else:
-                    print('requeste resource type not coded: ', resource_type)
+                # Resolve data sets from the search payload, only data sets with
+                # missing fields need to be fetched through package_show
+                datasets_shown = [None] * len(dataset_ids)
+                if resolve_from_search:
+                    for ii in range(len(dataset_ids)):
+                        if is_package_resolved(list_of_data_sets[ii]):
+                            datasets_shown[ii] = list_of_data_sets[ii]
+                            if metadata_cache is not None:
+                                metadata_cache.add_package(list_of_data_sets[ii])
+
+                # Revalidate all others at once against local metadata store
+                missing = [ii for ii in range(len(dataset_ids)) if datasets_shown[ii] is None]
+                if (metadata_cache is not None) and (len(missing) > 0):
+                    shown = metadata_cache.get_packages(ckan, [dataset_ids[ii] for ii in missing])
+                    for ii, dataset in zip(missing, shown):
+                        datasets_shown[ii] = dataset
+
+                # Go through each data set and see if to be selected due to other settings.
+                for ii, dataset_id in enumerate(dataset_ids):
+                    resource_list = []
+                    # Fetch dataset details by its ID or name
+                    dataset = datasets_shown[ii]
+                    if dataset is None:
+                        dataset = ckan.action.package_show(name_or_id=dataset_id)
+                    name = dataset['name']
                     if verbose:
                         CK_helper.buffer_tabs(level_num)
-                        print('Exiting: read_datasets()')
-                    return []
+                        print(' ')
+                        CK_helper.buffer_tabs(level_num)
+                        print('++++++++++++++++++++++++++++++++++++++++++++++++++')
+                        CK_helper.buffer_tabs(level_num)
+                        print('data set name is "', name, '"')
+                    if resource_type == 'link':
+                        for rr in dataset['resources']:
+                            if (rr['url_type'] == '') or (rr['url_type'] == None):
+                                resources_url = rr['url']
+                                resource_list.append({'name': name, 'resource': {'url' : resources_url}})
+                    elif resource_type == 'file':
+                        for rr in dataset['resources']:
+                            if rr['format'].lower() in database_format_list:
+                                resource_id = rr['id']
+                                resource_list.append(read_entry(ckan,
+                                                     name = name,
+                                                     resource_id = resource_id,
+                                                     write_to_file=write_to_file,
+                                                     dir_name = dir_name,
+                                                     level_num = level_num,
+                                                     client = client,
+                                                     cache = cache,
+                                                     metadata_cache = metadata_cache,
+                                                     chunks = chunks))
+                    elif resource_type == None:
+                        for rr in dataset['resources']:
+                            if rr['format'].lower() in database_format_list:
+                                if verbose:
+                                    CK_helper.buffer_tabs(level_num)
+                                    print('Full')
+                                    CK_helper.buffer_tabs(level_num)
+                                    print(rr['name'])
+                                resource_id = rr['id']
+                                resource_list.append(read_entry(ckan,
+                                                     name = name,
+                                                     resource_id = resource_id,
+                                                     dir_name = dir_name,
+                                                     level_num = level_num,
+                                                     client = client,
+                                                     cache = cache,
+                                                     metadata_cache = metadata_cache,
+                                                     chunks = chunks))
+                            else:
+                                if verbose:
+                                    CK_helper.buffer_tabs(level_num)
+                                    print('empty')
+                                    CK_helper.buffer_tabs(level_num)
+                                    print(rr['name'])
+                    
+                    else:
+                        print('requeste resource type not coded: ', resource_type)
+                        if verbose:
+                            CK_helper.buffer_tabs(level_num)
+                            print('Exiting: read_datasets()')
+                        return []
         
-                if len(resource_list) > 0:
-                    list_of_resources.append(resource_list)
+                    if len(resource_list) > 0:
+                        list_of_resources.append(resource_list)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait = True)
+        if own_client:
+            client.close()
+
+    # Collecting results of parallel downloads, keeping the order
+    for resource_list in list_of_resources:
+        for ii in range(len(resource_list)):
+            if isinstance(resource_list[ii], Future):
+                resource_list[ii] = resource_list[ii].result()
+            if error and (resource_list[ii].get('success') is False):
+                raise ValueError('ERROR: read_datasets(): Not able to read resource of "'
+                                 + resource_list[ii]['name'] + '": ' + str(resource_list[ii]['error']))
 
     if verbose:
         CK_helper.buffer_tabs(level_num)
@@ -659,6 +1265,289 @@ def read_datasets(ckan_url,
     return list_of_resources
 
 
+def mirror_name(name):
+    """
+    Returns name of a data set or resource as a file or dir name without 
+    any dir part, e.g. 'b.csv' for 'a/../b.csv', or None if nothing is left.
+    """
+    if name is None:
+        return None
+    name = os.path.basename(str(name).replace('\\', '/'))
+    if name in ('', '.', '..'):
+        return None
+    return name
+
+
+def mirror_path(dest, file_name):
+    """
+    Returns the resolved path of file_name in the mirror dest, or None if it
+    is not inside dest, e.g. for names with '..' in a stored mirror state.
+    """
+    root = os.path.realpath(dest)
+    path = os.path.realpath(os.path.join(root, file_name))
+    if path.startswith(root + os.sep) is False:
+        return None
+    return path
+
+
+def sync_mirror(ckan_url,
+                api_token,
+                query,
+                dest,
+                verbose     = False,
+                error       = False,
+                level_num   = 0,
+                client      = None,
+                max_workers = None,
+                rows        = 100,
+                page_workers = 4):
+    '''
+    Keeps a local copy of all data sets matching query in dest up to date.
+
+    The state of the mirror, including the newest 'metadata_modified' seen, is
+    kept in the file mirror_state_file_name in dest. A sync only asks 
+    package_search for data sets modified since the last sync, and only 
+    downloads new or changed resources. Data sets that were deleted, or no 
+    longer match the query, are detected through one light-weight search 
+    returning ids only, and their local copies are removed, as are dirs of 
+    data sets left empty. Only uploaded resources (url_type 'upload') are 
+    downloaded. Files are stored as dest/<data set name>/<resource name>, 
+    where any dir part of the names is dropped.
+
+    Parameters
+    ----------
+    ckan_url : String
+        URL of WindLab or other CKAN installation
+    api_token : String
+        String of the required API token
+    query : String
+        Solr query of the data sets to mirror, e.g. a tag string. If None or
+        '', all data sets are mirrored.
+    dest : String
+        Dir of the mirror.
+    verbose : Boolean, optional
+        Boolean indicating to print messages to screen or not.
+    error : Boolean, optional
+        If True, an error is raised if any resource could not be downloaded.
+    client : WindLabClient, optional
+        Shared client with a pooled connection. The default is None.
+    max_workers : Integer, optional
+        Number of resources downloaded in parallel. The default is None.
+    rows : Integer, optional
+        Number of data sets per page of the search. The default is 100.
+    page_workers : Integer, optional
+        Number of pages of the search fetched in parallel. The default is 4.
+
+    Returns
+    -------
+    Dict
+        Dict with the following key value pairs:
+            'downloaded': list of file names downloaded
+            'unchanged': number of resources not downloaded again
+            'removed': list of file names removed
+            'failed': list of dicts with 'file' and 'error' of failed downloads
+            'last_modified': newest 'metadata_modified' of the mirror
+    '''
+    level_num = level_num + 1
+    if verbose:
+        CK_helper.buffer_tabs(level_num)
+        print('Started: sync_mirror()')
+        level_num = level_num + 1
+
+    if (query is None) or (query == ''):
+        query = '*:*'
+
+    state_file_name = os.path.join(dest, mirror_state_file_name)
+    state = {'query': query, 'last_modified': None, 'packages': {}}
+    if os.path.isfile(state_file_name):
+        with open(state_file_name, 'r') as file:
+            state = json.load(file)
+        # A changed query requires a full sync
+        if state.get('query') != query:
+            state['query'] = query
+            state['last_modified'] = None
+    if os.path.isdir(dest) is False:
+        os.makedirs(dest)
+
+    ret = {'downloaded': [], 'unchanged': 0, 'removed': [], 'failed': [],
+           'last_modified': state['last_modified']}
+
+    def remove_file(file_name):
+        path = mirror_path(dest, file_name)
+        if path is None:
+            return
+        try:
+            os.remove(path)
+            ret['removed'].append(file_name)
+        except OSError:
+            pass
+        # Dir of the data set, once empty
+        dir_name = os.path.dirname(path)
+        if dir_name != os.path.realpath(dest):
+            try:
+                os.rmdir(dir_name)
+            except OSError:
+                pass
+
+    def remove_package(package_id):
+        for entry in state['packages'].pop(package_id)['resources'].values():
+            remove_file(entry['file'])
+
+    def download(url, file_name):
+        respo = CK_helper.get_resource_response(url, file_name = os.path.join(dest, file_name),
+                                                client = client)
+        if respo.status_code not in (200, 206):
+            respo.close()
+            raise ValueError('Status code ' + str(respo.status_code))
+        CK_helper.write_response_to_file(respo, os.path.join(dest, file_name), client = client)
+
+    executor = None
+    own_client = False
+    if (max_workers is not None) and (max_workers > 1):
+        if client is None:
+            client = WindLabClient(ckan_url, api_token = api_token, pool_maxsize = max_workers)
+            own_client = True
+        executor = ThreadPoolExecutor(max_workers = max_workers)
+
+    ckan = CK_helper.get_ckan(ckan_url, api_token = api_token, client = client)
+    downloads = []
+    last_modified = state['last_modified']
+    try:
+        # Data sets deleted or no longer matching the (current) query, ids only
+        if len(state['packages']) > 0:
+            found = CK_helper.search_packages(ckan,
+                                              rows = 1000,
+                                              page_workers = page_workers,
+                                              client = client,
+                                              include_private = True,
+                                              q = query,
+                                              fl = ['id'])
+            found_ids = set(package['id'] for package in found)
+            for package_id in list(state['packages']):
+                if package_id not in found_ids:
+                    remove_package(package_id)
+
+        # Data sets modified since the last sync
+        search_kwargs = {}
+        if state['last_modified'] is not None:
+            timestamp = state['last_modified']
+            if timestamp.endswith('Z') is False:
+                timestamp = timestamp + 'Z'
+            search_kwargs['fq'] = 'metadata_modified:[' + timestamp + ' TO *]'
+        datasets = CK_helper.search_packages(ckan,
+                                             rows = rows,
+                                             page_workers = page_workers,
+                                             client = client,
+                                             include_private = True,
+                                             q = query,
+                                             **search_kwargs)
+
+        for dataset in datasets:
+            if is_package_resolved(dataset) is False:
+                dataset = ckan.action.package_show(id = dataset['id'])
+            if (last_modified is None) or (dataset['metadata_modified'] > last_modified):
+                last_modified = dataset['metadata_modified']
+
+            # Data set renamed, stored under its new name
+            dataset_name = mirror_name(dataset['name']) or mirror_name(dataset['id'])
+            old = state['packages'].get(dataset['id'])
+            if (old is not None) and (old['name'] != dataset_name):
+                remove_package(dataset['id'])
+                old = None
+            if old is None:
+                old = {'name': dataset_name, 'resources': {}}
+            package = {'name': dataset_name, 
+                       'metadata_modified': dataset['metadata_modified'],
+                       'resources': {}}
+
+            file_names = set()
+            for rr in dataset['resources']:
+                if rr['url_type'] != 'upload':
+                    continue
+                # Names from the server are not trusted as paths
+                resource_name = mirror_name(rr['name'])
+                if resource_name is None:
+                    resource_name = mirror_name(rr['id'][0:5] + '.' + str(rr['format']))
+                if resource_name in file_names:
+                    resource_name = mirror_name(rr['id'] + '_' + resource_name)
+                file_names.add(resource_name)
+                file_name = os.path.join(dataset_name, resource_name)
+                if mirror_path(dest, file_name) is None:
+                    ret['failed'].append({'file': file_name, 'error': 'Not a valid file name'})
+                    continue
+                version = rr.get('hash') or rr.get('last_modified') or dataset['metadata_modified']
+                package['resources'][rr['id']] = {'file': file_name, 'version': version}
+
+                entry = old['resources'].get(rr['id'])
+                if ((entry is not None) and (entry['file'] == file_name) and 
+                        (entry['version'] == version) and 
+                        os.path.isfile(os.path.join(dest, file_name))):
+                    ret['unchanged'] = ret['unchanged'] + 1
+                    continue
+
+                if os.path.isdir(os.path.join(dest, dataset_name)) is False:
+                    os.makedirs(os.path.join(dest, dataset_name))
+                if verbose:
+                    CK_helper.buffer_tabs(level_num)
+                    print('Downloading ', file_name)
+                if executor is None:
+                    try:
+                        download(rr['url'], file_name)
+                        downloads.append((dataset['id'], rr['id'], file_name, None))
+                    except Exception as err:
+                        downloads.append((dataset['id'], rr['id'], file_name, err))
+                else:
+                    downloads.append((dataset['id'], rr['id'], file_name,
+                                      executor.submit(download, rr['url'], file_name)))
+
+            # Resources removed from the data set
+            for resource_id, entry in old['resources'].items():
+                if ((resource_id not in package['resources']) or
+                        (package['resources'][resource_id]['file'] != entry['file'])):
+                    remove_file(entry['file'])
+            state['packages'][dataset['id']] = package
+    finally:
+        if executor is not None:
+            executor.shutdown(wait = True)
+        if own_client:
+            client.close()
+
+    # Failed downloads are retried on the next sync
+    failed = len(ret['failed']) > 0
+    for package_id, resource_id, file_name, result in downloads:
+        if isinstance(result, Future):
+            result = result.exception()
+        if result is None:
+            ret['downloaded'].append(file_name)
+        else:
+            failed = True
+            ret['failed'].append({'file': file_name, 'error': str(result)})
+            state['packages'][package_id]['resources'][resource_id]['version'] = None
+
+    # Timestamp only moved on once all downloads succeeded
+    if failed is False:
+        state['last_modified'] = last_modified
+    ret['last_modified'] = state['last_modified']
+
+    temp_file_name = state_file_name + '.tmp'
+    with open(temp_file_name, 'w') as file:
+        json.dump(state, file)
+    os.replace(temp_file_name, state_file_name)
+
+    if verbose:
+        CK_helper.buffer_tabs(level_num)
+        print('Downloaded ', len(ret['downloaded']), ', unchanged ', ret['unchanged'],
+              ', removed ', len(ret['removed']), ', failed ', len(ret['failed']))
+    if error and failed:
+        raise ValueError('ERROR: sync_mirror(): Not able to download "'
+                         + ret['failed'][0]['file'] + '": ' + ret['failed'][0]['error'])
+
+    if verbose:
+        CK_helper.buffer_tabs(level_num)
+        print('Exiting: sync_mirror()')
+    return ret
+
+
 
 
 
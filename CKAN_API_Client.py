@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+from ckanapi import RemoteCKAN
+import requests
+from requests.adapters import HTTPAdapter
+import threading
+import time
+
+import CKAN_API_Helper as CK_helper
+
+
+class WindLabClient(object):
+    """
+    Reusable connection to the WindLab (or any other CKAN installation).
+
+    Owns one keep-alive connection pool, which is shared by all requests
+    made through the client, so that a batch run pays the TCP+TLS handshake
+    only once per connection. Each thread gets its own requests.Session and
+    RemoteCKAN, but all of them are mounted on the same HTTPAdapter, hence
+    on the same (thread safe) urllib3 pool.
+
+    Parameters
+    ----------
+    ckan_url : String, optional
+        URL of the ckan installation. If None, the URL, token, verbose and
+        error settings are read once from access_dir_file_name.
+    api_token : String, optional
+        CKAN access token. The default is None.
+    access_dir_file_name : String, optional
+        Dir and file name of the yaml file containing URL, access-token, and
+        other settings. Only used if ckan_url is None.
+        The default is 'default.yml'.
+    pool_connections : Integer, optional
+        Number of host pools to cache. The default is 10.
+    pool_maxsize : Integer, optional
+        Maximum number of connections kept alive per host. Should be at least
+        the number of threads using the client. The default is 10.
+    max_retries : Integer, optional
+        Number of retries for failed connections. The default is 0.
+    resolver_ttl : Float, optional
+        Seconds the organization and license lists of self.resolver are kept.
+        The default is 300.
+    verbose : Boolean, optional
+        If true, further display to screen. The default is False.
+    error : Boolean, optional
+        Boolean indicating to catch errors or not. The default is True.
+
+    Example
+    -------
+    with WindLabClient(access_dir_file_name = 'default.yml') as client:
+        dataset_ids, dataset_title = CK_helper.get_dataset_all_id(client.ckan_url,
+                                                                  client = client)
+    """
+
+    def __init__(self,
+                 ckan_url               = None,
+                 api_token              = None,
+                 access_dir_file_name   = 'default.yml',
+                 pool_connections       = 10,
+                 pool_maxsize           = 10,
+                 max_retries            = 0,
+                 resolver_ttl           = 300,
+                 verbose                = False,
+                 error                  = True,
+                 level_num              = 0):
+
+        if ckan_url is None:
+            ret = CK_helper.read_access(dir_file_name   = access_dir_file_name,
+                                        verbose         = verbose,
+                                        error           = error,
+                                        level_num       = level_num)
+            if not ret:
+                raise ValueError('ERROR: WindLabClient: Not able to read access file "'
+                                 + str(access_dir_file_name) + '"')
+            ckan_url, api_token, verbose, error = ret
+
+        self.ckan_url   = ckan_url
+        self.api_token  = api_token
+        self.verbose    = verbose
+        self.error      = error
+
+        self._adapter   = HTTPAdapter(pool_connections  = pool_connections,
+                                      pool_maxsize      = pool_maxsize,
+                                      max_retries       = max_retries)
+        self._local     = threading.local()
+        self._lock      = threading.Lock()
+        self._sessions  = []
+        self.resolver   = NameResolver(self, ttl = resolver_ttl)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def session(self):
+        """requests.Session of the calling thread, mounted on the shared pool."""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('https://', self._adapter)
+            session.mount('http://', self._adapter)
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    @property
+    def ckan(self):
+        """RemoteCKAN of the calling thread, using the shared pool."""
+        ckan = getattr(self._local, 'ckan', None)
+        if ckan is None:
+            ckan = RemoteCKAN(self.ckan_url,
+                              apikey    = self.api_token,
+                              session   = self.session)
+            self._local.ckan = ckan
+        return ckan
+
+    @property
+    def action(self):
+        """Shortcut to self.ckan.action"""
+        return self.ckan.action
+
+    def get(self, url, **kwargs):
+        """Same as requests.get, but through the shared pool."""
+        return self.session.get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """Same as requests.post, but through the shared pool."""
+        return self.session.post(url, **kwargs)
+
+    def close(self):
+        """Closes all sessions and the connection pool of the client."""
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions = []
+        self._local = threading.local()
+        self._adapter.close()
+
+
+class NameResolver(object):
+    """
+    Memoized lookup of organization and license ids by their display names,
+    shared by all threads of a WindLabClient (see WindLabClient.resolver).
+
+    organization_list and license_list are fetched once, and kept for ttl 
+    seconds. Names are compared case-insensitive. A name not found triggers
+    one refresh of the list, so that organizations created in the meantime 
+    are found; further misses of the same name within ttl do not.
+
+    Parameters
+    ----------
+    client : WindLabClient
+        Client used for the requests.
+    ttl : Float, optional
+        Seconds the lists are kept. The default is 300.
+    """
+
+    def __init__(self,
+                 client,
+                 ttl = 300):
+
+        self.client         = client
+        self.ttl            = ttl
+        self.calls          = 0
+
+        self._lock          = threading.Lock()
+        self._fetch_locks   = {'organization': threading.Lock(), 'license': threading.Lock()}
+        self._lists         = {}
+        self._index         = {}
+        self._fetched       = {}
+        self._misses        = {}
+
+    def organizations(self):
+        """List of organization dicts from organization_list(all_fields=True)."""
+        return self._get('organization')
+
+    def licenses(self):
+        """List of license dicts from license_list."""
+        return self._get('license')
+
+    def org_id(self, display_name):
+        """Id of the organization with display_name, or None if not found."""
+        return self._lookup('organization', display_name)
+
+    def license_id(self, title):
+        """Id of the license with title, or None if not found."""
+        return self._lookup('license', title)
+
+    def refresh(self):
+        """Drops the lists, so that they are fetched again on next use."""
+        with self._lock:
+            self._fetched   = {}
+            self._misses    = {}
+
+    def _get(self, kind):
+        with self._lock:
+            fetched = self._fetched.get(kind, -float('inf'))
+            if time.time() - fetched <= self.ttl:
+                return self._lists[kind]
+        self._fetch(kind, fetched)
+        with self._lock:
+            return self._lists[kind]
+
+    def _lookup(self, kind, name):
+        if name is None:
+            return None
+        key = str(name).lower()
+        with self._lock:
+            now = time.time()
+            fetched = self._fetched.get(kind, -float('inf'))
+            if now - fetched <= self.ttl:
+                if key in self._index[kind]:
+                    return self._index[kind][key]
+                if now - self._misses.get((kind, key), -float('inf')) <= self.ttl:
+                    return None
+                self._misses[(kind, key)] = now
+        self._fetch(kind, fetched)
+        with self._lock:
+            return self._index[kind].get(key)
+
+    def _fetch(self, kind, fetched):
+        # The request is made outside of self._lock, so that lookups in 
+        # lists still valid do not wait for it. Threads needing the same 
+        # list wait for one request, and skip theirs if it was made after
+        # they found the list out of date (at fetched).
+        with self._fetch_locks[kind]:
+            with self._lock:
+                if self._fetched.get(kind, -float('inf')) > fetched:
+                    return
+            if kind == 'organization':
+                entries = self.client.ckan.action.organization_list(all_fields = True)
+                field = 'display_name'
+            else:
+                entries = self.client.ckan.action.license_list()
+                field = 'title'
+            index = {str(entry[field]).lower(): entry['id'] for entry in entries}
+            with self._lock:
+                self.calls = self.calls + 1
+                self._lists[kind]   = entries
+                self._index[kind]   = index
+                self._fetched[kind] = time.time()
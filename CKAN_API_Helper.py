@@ -1,16 +1,30 @@
 #!/usr/bin/env python
-from ckanapi import RemoteCKAN
+from ckanapi import RemoteCKAN, NotFound
 import requests
 import yaml  # needs pyyaml
 import xarray as xr
 import os.path
 import os 
 import json  
-import copy
+import binascii
+import re
+import hashlib
+import io
+import time
+import shutil
 import sys
 import zipfile
-from netCDF4 import Dataset
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
+import netCDF4
+try:
+    import dask  # noqa: F401, only needed for chunked netCDF data
+except ImportError:
+    dask = None
+try:
+    import h5py  # noqa: F401, needed by h5netcdf
+except ImportError:
+    h5py = None
 
  
 from jsonschema import ValidationError
@@ -55,6 +69,18 @@ resources_list          = ['url','name', 'description', 'type', resource_schema_
 resources_list_type     = [str, str, str, str,  str,
                            str, str]
 
+# Number of names tried by setup_dataset, if names are taken in the meantime
+max_name_attempts       = 10
+
+# Size of the chunks in bytes, in which resources are downloaded to file
+download_chunk_size     = 1024 * 1024
+
+# Sort order for paginated searches, id as tie breaker keeps pages disjoint
+search_sort_order       = 'score desc, id asc'
+
+# Extensions of resources written to file by read_resource, per format
+resource_file_extensions = {'csv': '.csv', 'yaml': '.yaml', 'zip': '.zip', 'txt': '.txt'}
+
 
 
 
@@ -63,14 +89,284 @@ def buffer_tabs(level_num):
         print("  ", end="")
     return
 
+
+def get_ckan(ckan_url,
+             api_token = None,
+             client = None):
+    """
+    Returns the RemoteCKAN of the WindLabClient if supplied, otherwise a new
+    RemoteCKAN connection to ckan_url.
+
+    Parameters
+    ----------
+    ckan_url : String
+        URL of the ckan installation.
+    api_token : String, optional
+        CKAN access token. Has to be None or the token of the client, if a 
+        client is given. The default is None.
+    client : WindLabClient, optional
+        Shared client with a pooled connection. The default is None.
+
+    Returns
+    -------
+    RemoteCKAN
+
+    Raises
+    ------
+    ValueError
+        If api_token and the token of the client differ.
+    """
+    if client is not None:
+        if (api_token is not None) and (api_token != client.api_token):
+            raise ValueError('get_ckan(): api_token differs from the token of the client. '
+                             'Pass a client created with that token, or no api_token.')
+        return client.ckan
+    return RemoteCKAN(ckan_url, apikey=api_token)
+
+
+def get_http(client = None):
+    """
+    Returns the WindLabClient if supplied, otherwise the requests module.
+    Both offer get() and post() with the same arguments.
+    """
+    if client is not None:
+        return client
+    return requests
+
+
+def resume_headers(file_name,
+                   url = None):
+    """
+    Returns the headers of a request resuming an interrupted download to 
+    file_name, i.e. Range from the size of "<file_name>.part" and If-Range 
+    from the validator (ETag or Last-Modified) in its sidecar file, see 
+    write_response_to_file. Empty if there is nothing to resume, or the part
+    file is of another url.
+    """
+    part_file_name = file_name + '.part'
+    info_file_name = part_file_name + '.json'
+    if (os.path.isfile(part_file_name) is False) or (os.path.isfile(info_file_name) is False):
+        return {}
+    try:
+        with open(info_file_name, 'r') as file:
+            part_info = json.load(file)
+    except Exception:
+        return {}
+    validator = part_info.get('etag') or part_info.get('last_modified')
+    offset = os.path.getsize(part_file_name)
+    if (validator is None) or (offset == 0) or ((url is not None) and (part_info.get('url') != url)):
+        return {}
+    return {'Range': 'bytes=' + str(offset) + '-', 'If-Range': validator}
+
+
+def get_resource_response(url,
+                          file_name = None,
+                          resume = True,
+                          client = None):
+    """
+    Sends the GET request of a streamed download. If resume is True and an
+    earlier download to file_name was interrupted, the request carries the 
+    Range and If-Range headers of resume_headers, so that the server sends 
+    only the remaining bytes (206), or the full resource (200) if it changed 
+    or does not honor ranges.
+    """
+    headers = {}
+    if resume and (file_name is not None):
+        headers = resume_headers(file_name, url = url)
+    return get_http(client).get(url, headers = headers, stream = True)
+
+
+def write_response_to_file(respo,
+                           file_name,
+                           chunk_size = download_chunk_size,
+                           resume = True,
+                           client = None):
+    """
+    Writes the body of a streamed response in chunks to file, so that the 
+    memory used stays constant whatever the size of the resource.
+
+    The data is first written to "<file_name>.part", next to a small sidecar 
+    file "<file_name>.part.json" recording the bytes received and the server 
+    validators (ETag, Last-Modified). Only once the download is complete the 
+    part file is renamed to file_name. To resume an interrupted download, 
+    the request is sent with the headers of resume_headers, e.g. through 
+    get_resource_response: a 206 response is appended to the part file, a 
+    200 response, of a server not honoring ranges or of a changed resource,
+    is written from scratch.
+
+    Parameters
+    ----------
+    respo : requests.Response
+        Response of a request made with stream=True.
+    file_name : String
+        Dir and file name of the destination file.
+    chunk_size : Integer, optional
+        Size of the chunks in bytes. The default is download_chunk_size.
+    resume : Boolean, optional
+        If True, 206 responses are appended to the part file. 
+        The default is True.
+    client : WindLabClient, optional
+        Shared client used to request the full resource, if a 206 response 
+        does not fit the part file, e.g. as it changed in the meantime.
+        The default is None.
+
+    Returns
+    -------
+    Integer
+        Number of bytes written to file by this call.
+    """
+    part_file_name = file_name + '.part'
+    info_file_name = part_file_name + '.json'
+
+    # Checking if the response continues the part file
+    offset = 0
+    if respo.status_code == 206:
+        content_range = respo.headers.get('Content-Range', '')
+        match = re.match(r'bytes (\d+)-', content_range)
+        if (resume and (match is not None) and os.path.isfile(part_file_name) and 
+                (int(match.group(1)) == os.path.getsize(part_file_name))):
+            offset = int(match.group(1))
+        else:
+            url = respo.url
+            respo.close()
+            respo = get_http(client).get(url, stream = True)
+            respo.raise_for_status()
+
+    info = {'url':              respo.url,
+            'etag':             respo.headers.get('ETag'),
+            'last_modified':    respo.headers.get('Last-Modified'),
+            'bytes':            0}
+    if offset > 0:
+        # Validators of the part file, sent as If-Range
+        try:
+            with open(info_file_name, 'r') as file:
+                part_info = json.load(file)
+        except Exception:
+            part_info = {}
+        info['etag'] = info['etag'] or part_info.get('etag')
+        info['last_modified'] = info['last_modified'] or part_info.get('last_modified')
+
+    def write_info(num_bytes):
+        info['bytes'] = num_bytes
+        with open(info_file_name, 'w') as file:
+            json.dump(info, file)
+
+    write_info(offset)
+    num_bytes = 0
+    try:
+        with open(part_file_name, 'ab' if offset > 0 else 'wb') as f:
+            for chunk in respo.iter_content(chunk_size = chunk_size):
+                if chunk:
+                    f.write(chunk)
+                    num_bytes = num_bytes + len(chunk)
+    except BaseException:
+        # Keeping part file for next attempt
+        write_info(offset + num_bytes)
+        raise
+    finally:
+        respo.close()
+
+    os.replace(part_file_name, file_name)
+    os.remove(info_file_name)
+    return num_bytes
+
+
+def read_response_to_memory(respo,
+                            chunk_size = download_chunk_size):
+    '''
+    Reads the body of a streamed response into memory.
+
+    If the size of the body is known, it is read straight into one buffer 
+    of that size, avoiding the list of chunks and the joined copy of 
+    respo.content, i.e. the peak memory is the size of the resource.
+
+    Parameters
+    ----------
+    respo : requests.Response
+        Response of a request with stream = True.
+    chunk_size : Integer, optional
+        Size of the chunks in bytes, in which the body is read. 
+        The default is download_chunk_size.
+
+    Returns
+    -------
+    memoryview
+        Content of the response.
+    '''
+    length = respo.headers.get('Content-Length')
+    if (length is None) or (respo.headers.get('Content-Encoding', 'identity') != 'identity'):
+        return memoryview(respo.content)
+
+    length = int(length)
+    view = memoryview(bytearray(length))
+    pos = 0
+    while pos < length:
+        num_bytes = respo.raw.readinto(view[pos:pos + chunk_size])
+        if num_bytes == 0:
+            raise IOError('Connection closed after ' + str(pos) + ' of ' 
+                          + str(length) + ' bytes of ' + str(respo.url))
+        pos = pos + num_bytes
+    return view
+
+
+def open_netcdf(file_name,
+                chunks = {}):
+    '''
+    Opens a netCDF file lazily as xarray Dataset. Only the metadata is read,
+    variables are read from file when they are accessed, sliced or computed.
+
+    Parameters
+    ----------
+    file_name : String, netCDF4.Dataset or bytes-like
+        Dir and file name of the netCDF file. The file has to be kept as long 
+        as the Dataset is used. 
+        If a netCDF4.Dataset, the Dataset and all variables taken from it 
+        hold a reference to it, so that it is only garbage collected once 
+        they are all gone.
+        If bytes, bytearray or memoryview, the content of a netCDF file, 
+        which is decoded in memory: by h5netcdf if h5py is installed and the
+        content is netCDF4/HDF5, by netCDF4 otherwise.
+    chunks : Dict, String or None, optional
+        Chunks of the dask arrays, see xarray.open_dataset. {} takes the 
+        chunks of the file, 'auto' lets dask choose them. Dask is optional 
+        and not in requirements.txt: if it is not installed, chunks is 
+        ignored and the variables are lazily indexed numpy arrays.
+        The default is {}.
+
+    Returns
+    -------
+    xarray.Dataset
+        Dataset backed by file_name.
+    '''
+    if dask is None:
+        chunks = None
+    if isinstance(file_name, (bytes, bytearray, memoryview)):
+        # BytesIO shares the memory of bytes only, and netCDF4 fails to 
+        # release mutable buffers, hence others are copied once
+        if not isinstance(file_name, bytes):
+            file_name = bytes(file_name)
+        if (h5py is not None) and (file_name[:4] == b'\x89HDF'):
+            return xr.open_dataset(io.BytesIO(file_name), engine = 'h5netcdf', chunks = chunks)
+        file_name = netCDF4.Dataset('inmemory.nc', memory = file_name)
+    if isinstance(file_name, netCDF4.Dataset):
+        return xr.open_dataset(xr.backends.NetCDF4DataStore(file_name), chunks = chunks)
+    return xr.open_dataset(file_name, chunks = chunks)
+
+
 def read_resource(ckan,
                   name,
                   resource_id,
                   write_to_file=False,
-                  dir_name='', 
+                  dir_name='',
                   error = True,
                   verbose=False,
-                  level_num = 0):
+                  level_num = 0,
+                  client = None,
+                  chunk_size = download_chunk_size,
+                  resume = True,
+                  cache = None,
+                  metadata_cache = None,
+                  chunks = {}):
     '''
     Actual working horce to get resource from Dataset.  
 
@@ -92,8 +388,35 @@ def read_resource(ckan,
         String, containing the absolute or relative path, where to drop files
         to, in case that setting for write_to_file == True. Example is 
         './temp/data_01/'
+    error : Boolean, optional, with default True
+        If True, a ValueError with the cause (HTTP status code, time out, 
+        parse error, ...) is raised if the resource can not be read. 
+        Otherwise None, or [] for a failed download, is returned.
     verbose : TYPE, Boolean, optional, with default False
-        Boolean for writing comments on the fly to screen. 
+        Boolean for writing comments on the fly to screen.
+    client : WindLabClient, optional
+        Shared client used for the download. The default is None.
+    chunk_size : Integer, optional
+        Size of the chunks in bytes, in which files are streamed to disk.
+        The default is download_chunk_size.
+    resume : Boolean, optional
+        If True, interrupted downloads to file are resumed where they stopped.
+        The default is True.
+    cache : ResourceCache, optional
+        Local cache of resources. If the resource did not change since it was 
+        cached, it is taken from the cache without any download. 
+        The default is None.
+    metadata_cache : MetadataCache, optional
+        Local store of resource metadata, used instead of resource_show if the
+        package of the resource has been revalidated. The default is None.
+    chunks : Dict, String or None, optional
+        Dask chunks of netCDF resources, see open_netcdf. Only used if the 
+        optional dask is installed. The default is {}.
+        
+        With write_to_file False, nothing is written to disk (except to the 
+        cache, if given): csv, txt and zip resources are returned as 
+        memoryview of their content, yaml resources parsed, and netCDF 
+        resources decoded from memory.
 
     Returns
     -------
@@ -101,6 +424,9 @@ def read_resource(ckan,
         List of dictionaries, with the following elements:
             'name': name of the Dataset
             'data': Either the data of the resource, or the file name with path
+        netCDF resources are returned as xarray.Dataset, lazily loaded from
+        the cached file if a cache is given, or the file in dir_name if 
+        write_to_file is True.
     '''
     level_num = level_num + 1
     if verbose:
@@ -109,58 +435,117 @@ def read_resource(ckan,
         level_num = level_num + 1
 
     # Retrieve the resource details using resource_show
+    respo = None
     try:
-        resource = ckan.action.resource_show(id=resource_id)
+        if metadata_cache is not None:
+            resource = metadata_cache.resource_show(ckan, resource_id)
+        else:
+            resource = ckan.action.resource_show(id=resource_id)
 
         # Get the URL of the Resource
         csv_url = resource['url']
 
-        # Download the Resource
-        respo = requests.get(csv_url)
-
-        # Check if the request was successful
-        if respo.status_code != 200:
-            if verbose:
-                buffer_tabs(level_num)
-                print(f"Failed to get data from data base. Status code: {respo.status_code}")
-                if verbose:
-                    buffer_tabs(level_num)
-                    print('Exiting: read_resource()')
-
-            return []
-
-        # make local directory if needed
         # check if dir name supplied from user
         if dir_name != '':
             dir_name = os.path.join(dir_name, name )
 
-        if os.path.isdir(dir_name) is False:
-            try:
-                os.makedirs(dir_name)
-            except Exception:
-                pass
-
         # check if name given for resource
         if resource['name'] == '':
             print('Warning: get_data_from_host: resource in ',
                   name, ' does not have a name. Name made up here.')
             resource['name'] = resource['id'][0:5] + '.' + resource['format']
 
-        # create destination file name
+        # create destination file name, with the extension of the format
         resource_file_name = os.path.join(dir_name, resource['name'])
+        extension = resource_file_extensions.get(resource['format'].lower(), '')
+        if resource_file_name.lower().endswith(extension) is False:
+            resource_file_name = resource_file_name + extension
+
+        # Check if resource in local cache, key depends on hash/last_modified
+        cached_file_name = None
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.key(resource)
+        if cache_key is not None:
+            key_lock = cache.lock(cache_key)
+            key_lock.acquire()
+        try:
+            if cache_key is not None:
+                cached_file_name = cache.get(cache_key)
+                if verbose and (cached_file_name is not None):
+                    buffer_tabs(level_num)
+                    print('Resource taken from cache: ', cached_file_name)
+
+            if cached_file_name is None:
+                # Download the Resource, body only read when needed. Downloads
+                # to file resume an interrupted one in the same request.
+                if cache_key is not None:
+                    download_file_name = cache.file_name(cache_key)
+                elif write_to_file:
+                    download_file_name = resource_file_name
+                else:
+                    download_file_name = None
+                respo = get_resource_response(csv_url, file_name = download_file_name,
+                                              resume = resume, client = client)
+
+                # Check if the request was successful
+                if respo.status_code not in (200, 206):
+                    if verbose:
+                        buffer_tabs(level_num)
+                        print(f"Failed to get data from data base. Status code: {respo.status_code}")
+                        if verbose:
+                            buffer_tabs(level_num)
+                            print('Exiting: read_resource()')
+                    if error:
+                        raise IOError('HTTP status code ' + str(respo.status_code) + ' for ' + str(csv_url))
+                    return []
+
+                # Adding the Resource to the cache
+                if cache_key is not None:
+                    write_response_to_file(respo, cache.file_name(cache_key), chunk_size = chunk_size,
+                                           resume = resume, client = client)
+                    cached_file_name = cache.add(cache_key, resource['id'])
+        finally:
+            if cache_key is not None:
+                key_lock.release()
+
+        def read_content(as_bytes = False):
+            # Content of the resource as memoryview (or bytes), read once without copies
+            if cached_file_name is not None:
+                if as_bytes:
+                    with open(cached_file_name, 'rb') as f:
+                        return f.read()
+                view = memoryview(bytearray(os.path.getsize(cached_file_name)))
+                with open(cached_file_name, 'rb') as f:
+                    f.readinto(view)
+                return view
+            if as_bytes:
+                return respo.content
+            return read_response_to_memory(respo, chunk_size = chunk_size)
+
+        def save_resource(file_name):
+            # make local directory if needed
+            if os.path.isdir(dir_name) is False:
+                try:
+                    os.makedirs(dir_name)
+                except Exception:
+                    pass
+
+            # Writes the resource to file_name
+            if cached_file_name is not None:
+                shutil.copyfile(cached_file_name, file_name)
+            else:
+                write_response_to_file(respo, file_name, chunk_size = chunk_size,
+                                       resume = resume, client = client)
 
         # Permutate through different file types
         # CSV files
         if resource['format'].lower() == 'csv':
             if write_to_file is False:
-                data = respo.content
+                data = read_content()
             else:
                 # Save the CSV file locally
-                if resource_file_name[-4:].lower() != '.csv':
-                    resource_file_name = resource_file_name + '.csv'
-
-                with open(resource_file_name, 'wb') as f:
-                    f.write(respo.content)
+                save_resource(resource_file_name)
                 if verbose:
                     buffer_tabs(level_num)
                     print(f"CSV file saved as {resource_file_name}")
@@ -175,23 +560,31 @@ def read_resource(ckan,
               (resource['format'].lower() == 'nc') or
               (resource['format'].lower() == 'application/x-hdf5')):
 
-            # Save the file locally 
-            # (optional step if you need to work with the file from disk)
-            with open(resource_file_name, 'wb') as f:
-                f.write(respo.content)
-
-            if write_to_file is False:
-                # Step 3: Open the NetCDF file using netCDF4.Dataset
-                with xr.open_dataset(resource_file_name) as ds:
-                    data = ds
-                # Step 4: removing file
-                os.remove(resource_file_name)
+            # Opening the cached file directly, no copy needed. It is pinned
+            # in the cache, so not evicted while the data is in use.
+            if (write_to_file is False) and (cached_file_name is not None):
+                data_file_name = cached_file_name
+            elif write_to_file is False:
+                data_file_name = None
             else:
-
-                # Open a .nc file ("file_name")
-                data = Dataset(resource_file_name)
-                print(data)
-                #data = resource_file_name
+                save_resource(resource_file_name)
+                data_file_name = resource_file_name
+
+            if data_file_name is None:
+                # Decoding in memory, nothing written to disk
+                data = open_netcdf(read_content(as_bytes = True), chunks = chunks)
+            elif data_file_name == cached_file_name:
+                # Only metadata read here. The file is pinned until the 
+                # handle, shared by the Dataset and its variables, is gone.
+                handle = netCDF4.Dataset(data_file_name)
+                data = open_netcdf(handle, chunks = chunks)
+                cache.pin(cache_key, owner = handle)
+            else:
+                # Only metadata read here, the file has to stay for the data
+                data = open_netcdf(data_file_name, chunks = chunks)
+            if verbose and (data_file_name is not None):
+                buffer_tabs(level_num)
+                print(f"netCDF file opened from {data_file_name}")
 
             if verbose:
                 buffer_tabs(level_num)
@@ -202,23 +595,16 @@ def read_resource(ckan,
         elif resource['format'].lower() == 'yaml':
 
             if write_to_file:
-                # Save the CSV file locally
-                if resource_file_name[-5:].lower() != '.yaml':
-                    resource_file_name = resource_file_name + '.yaml'
-
-                with open(resource_file_name, 'wb') as f:
-                    f.write(respo.content)
+                # Save the YAML file locally
+                save_resource(resource_file_name)
                 if verbose:
                     buffer_tabs(level_num)
                     print(f"YAML file saved as {resource_file_name}")
                 data = resource_file_name
 
             else:
-                # get data as is
-                resource_file_name = resource_file_name.replace('\\', '/')
-                with open(resource_file_name, 'r') as file:
-                    windlab_yaml = yaml.safe_load(file)
-                print(data)
+                # Parsing the content, no file written
+                data = yml_utils.safe_load(str(read_content(), 'utf-8-sig'))
 
             if verbose:
                 buffer_tabs(level_num)
@@ -228,14 +614,10 @@ def read_resource(ckan,
         # ZIP files
         elif resource['format'].lower() == 'zip':
             if write_to_file is False:
-                data = respo.content
+                data = read_content()
             else:
                 # Save the zip file locally
-                if resource_file_name[-4:].lower() != '.zip':
-                    resource_file_name = resource_file_name + '.zip'
-
-                with open(resource_file_name, 'wb') as f:
-                    f.write(respo.content)
+                save_resource(resource_file_name)
                 if verbose:
                     buffer_tabs(level_num)
                     print(f"ZIP file saved as {resource_file_name}")
@@ -244,14 +626,10 @@ def read_resource(ckan,
             return data
         elif resource['format'].lower() == 'txt':
             if write_to_file is False:
-                data = respo.content
+                data = read_content()
             else:
-                # Save the CSV file locally
-                if resource_file_name[-4:].lower() != '.txt':
-                    resource_file_name = resource_file_name + '.txt'
-
-                with open(resource_file_name, 'wb') as f:
-                    f.write(respo.content)
+                # Save the txt file locally
+                save_resource(resource_file_name)
                 if verbose:
                     buffer_tabs(level_num)
                     print(f"CSV file saved as {resource_file_name}")
@@ -265,9 +643,14 @@ def read_resource(ckan,
     except Exception as e:
         print('Exception ', e)
         if error:
-            raise ValueError('Not dataset_id')
+            # Keeping the cause, e.g. HTTP status, time out or parse error
+            raise ValueError('Not able to read resource "' + str(resource_id) + '": ' 
+                             + type(e).__name__ + ': ' + str(e)) from e
         else:
             return None
+    finally:
+        if respo is not None:
+            respo.close()
 
 
 
@@ -535,7 +918,9 @@ def setup_dataset(ckan_url,
                   thisdata, 
                   verbose = False, 
                   error = True,
-                  level_num = 0):
+                  level_num = 0,
+                  client = None,
+                  names_in_use = None):
     """
     Sets up a data set in the WindLab, using DataCite meta data.
     
@@ -550,6 +935,11 @@ def setup_dataset(ckan_url,
         ID for the data set.  
     thisdata : Dict
         Dict containing DataCite meta data in respect of the data set.
+    client : WindLabClient, optional
+        Shared client with a pooled connection. The default is None.
+    names_in_use : Set, optional
+        Names in use starting with the name of the data set, e.g. from 
+        find_dataset. If None, they are searched for. The default is None.
 
     Returns
     -------
@@ -562,27 +952,18 @@ def setup_dataset(ckan_url,
         print('Starting: setup_dataset()')
     level_num = level_num + 1
 
-    general_requ    = thisdata['general_requ']
-    general_opt     = thisdata['general_opt']
-    resources       = thisdata[resource_label()]
-
-    # Check if data set name in use, otherwise find new one
-    count = 0
-    name_new = general_requ['title'].replace(' ', '_').replace('(', '_').replace(')', '_').lower()
-    name_new = name_new[0:20]
-    name = copy.deepcopy(name_new)
-    while True:
-        ret = is_name_in_use(ckan_url, 
-                             api_token, 
-                             name, 
-                             verbose = verbose, 
-                             error = error,
-                             level_num = level_num)
-        if ret == False:
-            break
-        else:
-            name = name_new + '_' + str(count)
-            count = count + 1
+    # All names in use starting with the name, found through one search
+    name_new = get_dataset_name(thisdata)
+    if names_in_use is None:
+        names_in_use = get_names_in_use(ckan_url,
+                                        api_token,
+                                        name_new,
+                                        verbose = verbose,
+                                        error = error,
+                                        level_num = level_num,
+                                        client = client)
+    else:
+        names_in_use = set(names_in_use)
 
     # CKAN dataset creation API endpoint
     dataset_create_url = f'{ckan_url}/api/3/action/package_create'
@@ -590,8 +971,48 @@ def setup_dataset(ckan_url,
     headers = {'Authorization': api_token,
                'Content-Type': 'application/json'}
 
-    data = {"name": name, 
-            "owner_org": org_id, }
+    data = dataset_meta_data(org_id, thisdata)
+
+    # Send a POST request to CKAN to create the dataset. Names not found by 
+    # the search, e.g. of deleted data sets, or taken in the meantime, are 
+    # rejected with 409 and the next free name is tried.
+    for attempt in range(max_name_attempts):
+        data['name'] = get_free_name(name_new, names_in_use)
+        response = get_http(client).post(dataset_create_url, headers=headers, data=json.dumps(data))
+        if (response.status_code != 409) or (is_name_conflict(response) is False):
+            break
+        names_in_use.add(data['name'])
+
+    if response.status_code != 200:
+        if response.status_code == 409:
+            print('ERROR: setup_dataset(): data set URL already in use.')
+        else:
+            print(f"Failed to create dataset. Status Code: {response.status_code}")
+            print("Error:", response.json())
+        if verbose:
+            buffer_tabs(level_num-1)
+            print('Exiting: setup_dataset()')
+        return []
+    else:
+        dataset_id = response.json()['result']['id']
+
+    if verbose:
+        buffer_tabs(level_num-1)
+        print('Exiting: setup_dataset()')
+
+    return dataset_id
+
+
+def dataset_meta_data(org_id, thisdata):
+    """
+    Returns the fields of package_create/package_patch of a data set, from 
+    its DataCite meta data.
+    """
+    general_requ    = thisdata['general_requ']
+    general_opt     = thisdata['general_opt']
+    resources       = thisdata[resource_label()]
+
+    data = {"owner_org": org_id, }
     # general_requ_list
     for key in general_requ_list:
         if key in general_requ:
@@ -606,29 +1027,190 @@ def setup_dataset(ckan_url,
     for key in resources_list:
         if key in resources:
             data[key] = resources[key]
+    return data
 
 
-    # Send a POST request to CKAN to create the dataset
-    response = requests.post(dataset_create_url, headers=headers, data=json.dumps(data))
+def get_names_in_use(ckan_url,
+                     api_token,
+                     prefix,
+                     verbose = False,
+                     error = True,
+                     level_num = 0,
+                     client = None):
+    """
+    Returns all data set names in use starting with prefix, through one 
+    package_search (one per 1000 names).
 
-    if response.status_code != 200:
-        if response.status_code == 409:
-            print('ERROR: setup_dataset(): data set URL already in use.')
-        else:
-            print(f"Failed to create dataset. Status Code: {response.status_code}")
-            print("Error:", response.json())
+    Parameters
+    ----------
+    ckan_url : String
+        URL of the ckan installation.
+    api_token : String
+        CKAN access token.
+    prefix : String
+        Start of the names.
+    client : WindLabClient, optional
+        Shared client with a pooled connection. The default is None.
+
+    Returns
+    -------
+    Set
+        Set of names. Empty if the search failed.
+    """
+    level_num = level_num + 1
+    if verbose:
+        buffer_tabs(level_num)
+        print('Starting: get_names_in_use()')
+
+    ckan = get_ckan(ckan_url, api_token = api_token, client = client)
+    try:
+        packages = search_packages(ckan, 
+                                   rows = 1000, 
+                                   page_workers = 1,
+                                   include_private = True,
+                                   q = name_prefix_query(prefix),
+                                   fl = ['name'])
+        names = set(package['name'] for package in packages)
+    except Exception as err:
+        print('Warning: get_names_in_use(): Search failed: ', err)
+        names = set()
+
+    if verbose:
+        buffer_tabs(level_num)
+        print('Exiting: get_names_in_use()')
+    return names
+
+
+def get_dataset_name(thisdata):
+    """
+    Returns the name of a new data set, derived from its title. If in use, 
+    setup_dataset appends a number, see get_free_name.
+    """
+    name = thisdata['general_requ']['title'].replace(' ', '_').replace('(', '_').replace(')', '_').lower()
+    return name[0:20]
+
+
+def name_prefix_query(prefix):
+    """
+    Returns the Solr query of all data set names starting with prefix.
+    """
+    # Escaping Solr special characters
+    return 'name:' + re.sub(r'([^a-z0-9_])', r'\\\1', prefix.lower()) + '*'
+
+
+def find_dataset(ckan_url,
+                 api_token,
+                 org_id,
+                 thisdata,
+                 verbose = False,
+                 error = True,
+                 level_num = 0,
+                 client = None,
+                 dataset_id = None):
+    """
+    Finds a data set with the title of thisdata in the organization org_id, 
+    e.g. one created by an earlier run which failed part way, so that it 
+    can be reused instead of creating another one. Candidates are the data 
+    sets with names starting with the name setup_dataset would give it, 
+    found through one package_search. If dataset_id is given, only that 
+    data set is looked up.
+
+    Parameters
+    ----------
+    ckan_url : String
+        URL of the ckan installation.
+    api_token : String
+        CKAN access token.
+    org_id : String
+        ID of the organization of the data set.
+    thisdata : Dict
+        Dict containing DataCite meta data in respect of the data set.
+    client : WindLabClient, optional
+        Shared client with a pooled connection. The default is None.
+    dataset_id : String, optional
+        ID or name of the data set, e.g. the 'dataset_id' of the result of 
+        write_datasets of the failed run. The default is None.
+
+    Returns
+    -------
+    Tuple
+        The package of the data set (from package_show) or None if not 
+        found, and the set of names in use, which can be passed to 
+        setup_dataset, or None if the search failed or was not done.
+    """
+    level_num = level_num + 1
+    if verbose:
+        buffer_tabs(level_num)
+        print('Starting: find_dataset()')
+
+    ckan = get_ckan(ckan_url, api_token = api_token, client = client)
+    if dataset_id is not None:
+        try:
+            package = ckan.action.package_show(id = dataset_id)
+        except NotFound:
+            package = None
         if verbose:
-            buffer_tabs(level_num-1)
-            print('Exiting: setup_dataset()')
-        return []
-    else:
-        dataset_id = response.json()['result']['id']
+            buffer_tabs(level_num)
+            print('Exiting: find_dataset()')
+        return package, None
+
+    title = thisdata['general_requ'].get('title')
+    try:
+        packages = search_packages(ckan, 
+                                   rows = 1000, 
+                                   page_workers = 1,
+                                   include_private = True,
+                                   q = name_prefix_query(get_dataset_name(thisdata)),
+                                   fl = ['id', 'name', 'title', 'owner_org'])
+    except Exception as err:
+        print('Warning: find_dataset(): Search failed: ', err)
+        return None, None
+
+    names_in_use = set(package['name'] for package in packages)
+    package = None
+    for candidate in sorted(packages, key = lambda package: package['name']):
+        if (candidate.get('title') == title) and (candidate.get('owner_org') == org_id):
+            package = ckan.action.package_show(id = candidate['id'])
+            if verbose:
+                buffer_tabs(level_num)
+                print('Reusing data set: ', package['name'])
+            break
 
     if verbose:
-        buffer_tabs(level_num-1)
-        print('Exiting: setup_dataset()')
+        buffer_tabs(level_num)
+        print('Exiting: find_dataset()')
+    return package, names_in_use
 
-    return dataset_id
+
+def get_free_name(name, names_in_use):
+    """
+    Returns name if not in names_in_use, otherwise the first of name_0, 
+    name_1, ... not in names_in_use.
+    """
+    if name not in names_in_use:
+        return name
+    count = 0
+    while (name + '_' + str(count)) in names_in_use:
+        count = count + 1
+    return name + '_' + str(count)
+
+
+def is_name_conflict(response):
+    """
+    Checks if a response of package_create with status code 409 was due to
+    the name being in use, and not due to another validation error.
+    """
+    try:
+        messages = response.json()['error']['name']
+    except Exception:
+        return False
+    # e.g. 'That URL is already in use.', but not an invalid name
+    if isinstance(messages, str):
+        messages = [messages]
+    for message in messages:
+        if ('already in use' in str(message).lower()) or ('already exists' in str(message).lower()):
+            return True
+    return False
 
 
 def is_name_in_use(ckan_url, 
@@ -636,9 +1218,10 @@ def is_name_in_use(ckan_url,
                    dataset_name,
                    verbose = False,
                    error = True,
-                   level_num = 0):
+                   level_num = 0,
+                   client = None):
     """
-    Checks if name already given in WindLab
+    Checks if name already given in WindLab, through get_names_in_use.
 
     Test: True
 
@@ -646,45 +1229,27 @@ def is_name_in_use(ckan_url,
     ----------
     ckan_url : String
         URL of the ckan installation.
-    api_token : String (Not Used)
+    api_token : String
         CKAN access token.
     dataset_name : String
         Name to be checked
+    client : WindLabClient, optional
+        Shared client with a pooled connection. The default is None.
 
     Returns
     -------
-    Boolean or None
-        False if name not in WindLab so far. 
+    Boolean
+        False if name not in WindLab so far, or if the search failed. 
         True if name in WindLab.
-        None, if error in WindLab querry
     """
-    level_num = level_num + 1
-    if verbose:
-        buffer_tabs(level_num)
-        print('Starting: is_name_in_use()')
-    level_num = level_num + 1
-
-    # Connect to the CKAN instance
-    ckan = RemoteCKAN(ckan_url)
-
-    # Get the dataset details
-    try:
-        ret = ckan.action.package_show(id=dataset_name)
-        if ret == None:
-            if verbose:
-                buffer_tabs(level_num-1)
-                print('Exiting: is_name_in_use()')
-            return False
-        if verbose:
-            buffer_tabs(level_num-1)
-            print('Exiting: is_name_in_use()')
-        return True
-    except:
-        if verbose:
-            buffer_tabs(level_num-1)
-            print('Exiting: is_name_in_use()')
-        return False
-    
+    names_in_use = get_names_in_use(ckan_url,
+                                    api_token,
+                                    dataset_name,
+                                    verbose = verbose,
+                                    error = error,
+                                    level_num = level_num,
+                                    client = client)
+    return dataset_name.lower() in names_in_use
 
 
 def setup_meta_dict(verbose = False,
@@ -789,7 +1354,8 @@ def read_yaml(access_dir_file_name  = 'default.yml',
                 process_name        = '',
                 verbose             = False,
                 error               = True,
-                level_num           = 0):
+                level_num           = 0,
+                client              = None):
     """
     Reads in the required meta data through a yaml file, 
     and returns the information as a dict.
@@ -810,6 +1376,9 @@ def read_yaml(access_dir_file_name  = 'default.yml',
         Boolean for display of messages to screen
     error : Boolean, default False
         Boolean for displaying caught error messages
+    client : WindLabClient, optional
+        If given, URL, access token, verbose and error are taken from the 
+        client, and access_dir_file_name is not read. The default is None.
 
     Returns
     -------
@@ -832,14 +1401,18 @@ def read_yaml(access_dir_file_name  = 'default.yml',
     level_num = level_num + 1
 
     # Getting some default information for WindLab
-    ckan_url, api_token, verbose, errorVal = \
-    read_access(dir_file_name   = access_dir_file_name, 
-                verbose         = verbose,
-                error           = error,
-                level_num       = level_num)
+    if client is not None:
+        ckan_url, api_token, verbose, errorVal = \
+            client.ckan_url, client.api_token, client.verbose, client.error
+    else:
+        ckan_url, api_token, verbose, errorVal = \
+        read_access(dir_file_name   = access_dir_file_name, 
+                    verbose         = verbose,
+                    error           = error,
+                    level_num       = level_num)
     
     with open(dir_file_name, 'r') as file:
-        windlab_data = yaml.safe_load(file)
+        windlab_data = yml_utils.safe_load(file)
 
     if 'file' in windlab_data['data']:
         windlab_temp = []
@@ -855,7 +1428,7 @@ def read_yaml(access_dir_file_name  = 'default.yml',
             # yaml files
             elif (file_name[-4:].lower() == '.yml') or (file_name[-5:].lower() == '.yaml'):
                 with open(file_name, 'r') as file:
-                    windlab_temp.append([yaml.safe_load(file)])
+                    windlab_temp.append([yml_utils.safe_load(file)])
             
             # Excel tables
             elif (file_name[-4:].lower() == '.xls') or (file_name[-5:].lower() == '.xlsm'):
@@ -950,7 +1523,7 @@ def get_meta_from_zip(dir_file_name = None,
         dir_name = os.path.basename(dir_file_name)
         dir_name = dir_name[:-4]
         windlab_data = archive.read(dir_name + '/WindLab_meta.yaml')
-        windlab_data = yaml.safe_load(windlab_data)
+        windlab_data = yml_utils.safe_load(windlab_data)
 
         if verbose: 
             buffer_tabs(level_num-1)
@@ -1015,7 +1588,7 @@ def read_access(dir_file_name=None,
         
         # Reading yml file, and getting URL and API token 
         with open(dir_file_name, 'r') as file:
-            windlab_yaml = yaml.safe_load(file)
+            windlab_yaml = yml_utils.safe_load(file)
 
         if ('URL' not in windlab_yaml['API']) or ('token' not in windlab_yaml['API']) or ('verbose' not in windlab_yaml['API']) or ('error' not in windlab_yaml['API']):
             print('ERROR Reading set up file. File content API not up to date.')
@@ -1086,7 +1659,7 @@ def read_setup(dir_file_name= None,
         
         # Reading yml file, and getting URL and API token 
         with open(dir_file_name, 'r') as file:
-            windlab_yaml = yaml.safe_load(file)
+            windlab_yaml = yml_utils.safe_load(file)
 
         if ('URL' not in windlab_yaml['API']) or ('token' not in windlab_yaml['API']) or ('verbose' not in windlab_yaml['API']) or ('error' not in windlab_yaml['API']):
             print('ERROR Reading set up file. File content API not up to date.')
@@ -1129,7 +1702,8 @@ def read_setup(dir_file_name= None,
 
 def print_all_org_names(ckan_url, 
                          api_token,
-                         level_num = 0):
+                         level_num = 0,
+                         client = None):
     
     level_num = level_num + 1
     if verbose:
@@ -1138,7 +1712,7 @@ def print_all_org_names(ckan_url,
         level_num = level_num + 1
 
     # Connect to the CKAN instance
-    ckan = RemoteCKAN(ckan_url)
+    ckan = get_ckan(ckan_url, client = client)
     
     # Get the dataset details
     try:
@@ -1171,7 +1745,8 @@ def get_org_id_from_name(ckan_url,
                          org_disp_name, 
                          verbose = False,
                          error=True,
-                         level_num = 0):
+                         level_num = 0,
+                         client = None):
     """
     Returns the ID of an organisation, that is associated with a data set.
 
@@ -1187,6 +1762,8 @@ def get_org_id_from_name(ckan_url,
         display name of the organization, as it is found on the WindLab web page.
     verbose : Boolean, optional
         If true, further display to screen. The default is False.
+    client : WindLabClient, optional
+        Shared client with a pooled connection. The default is None.
 
     Returns
     -------
@@ -1202,11 +1779,20 @@ def get_org_id_from_name(ckan_url,
 
     org_id = None
     # Connect to the CKAN instance
-    ckan = RemoteCKAN(ckan_url)
+    ckan = get_ckan(ckan_url, client = client)
     
-    # Get the dataset details
+    # Get the dataset details, memoized by the client
     try:
-        entries_list  = ckan.action.organization_list(all_fields=True)
+        if client is not None:
+            org_id = client.resolver.org_id(org_disp_name)
+            if org_id is not None:
+                if verbose: 
+                    buffer_tabs(level_num-1)
+                    print('Exiting "get_org_id_from_name"')
+                return org_id
+            entries_list  = client.resolver.organizations()
+        else:
+            entries_list  = ckan.action.organization_list(all_fields=True)
         
     except:
         
@@ -1263,7 +1849,8 @@ def get_cc_id_from_name(ckan_url,
                         cc_disp_name, 
                         verbose = False,
                         error = True,
-                        level_num = 0):
+                        level_num = 0,
+                        client = None):
     """
     Returns the ID of the copy right, by supplying the name
     
@@ -1279,6 +1866,8 @@ def get_cc_id_from_name(ckan_url,
         display name of the copy right, as it is found on the WindLab web page.
     verbose : Boolean, optional
         If true, further display to screen. The default is False.
+    client : WindLabClient, optional
+        Shared client with a pooled connection. The default is None.
 
     Returns
     -------
@@ -1295,11 +1884,20 @@ def get_cc_id_from_name(ckan_url,
     cc_id = None
     
     # Connect to the CKAN instance
-    ckan = RemoteCKAN(ckan_url)
+    ckan = get_ckan(ckan_url, client = client)
     
-    # Get the dataset details
+    # Get the dataset details, memoized by the client
     try:
-        licenses = ckan.action.license_list()
+        if client is not None:
+            cc_id = client.resolver.license_id(cc_disp_name)
+            if cc_id is not None:
+                if verbose: 
+                    buffer_tabs(level_num-1)
+                    print('Exiting: "get_cc_id_from_name"')
+                return cc_id
+            licenses = client.resolver.licenses()
+        else:
+            licenses = ckan.action.license_list()
     except:
         if error:
             if verbose: 
@@ -1320,8 +1918,9 @@ def get_cc_id_from_name(ckan_url,
         for license in licenses:
             title = license['title']
             id = license['id']
-            # Check if the dataset has the copyright field
-            if title == cc_disp_name:
+            # Check if the dataset has the copyright field, case-insensitive 
+            # as through client.resolver
+            if str(title).lower() == str(cc_disp_name).lower():
                 if verbose: 
                     buffer_tabs(level_num-1)
                     print('Exiting: "get_cc_id_from_name"')
@@ -1351,11 +1950,152 @@ def get_cc_id_from_name(ckan_url,
             return cc_id
 
 
+def search_packages(ckan,
+                    rows = 100,
+                    page_workers = 4,
+                    sort = search_sort_order,
+                    client = None,
+                    **search_kwargs):
+    """
+    Returns all packages matching a package_search. The first page gives the
+    total count, all remaining pages are then fetched in parallel. Pages are
+    sorted by a deterministic sort order, so that no data set is returned 
+    twice or dropped. Results are returned in the sort order.
+
+    Parameters
+    ----------
+    ckan : RemoteCKAN
+        Connection to a CKAN data base.
+    rows : Integer, optional
+        Number of packages per page. The default is 100.
+    page_workers : Integer, optional
+        Number of pages fetched in parallel. The default is 4.
+    sort : String, optional
+        Solr sort order of the search. The default is search_sort_order.
+    client : WindLabClient, optional
+        Shared client with a pooled connection, used by the parallel page 
+        requests. The default is None.
+    **search_kwargs
+        Further arguments to package_search, e.g. q, fq or include_private.
+
+    Returns
+    -------
+    List
+        List of package dicts.
+    """
+    first_page = ckan.action.package_search(start = 0, rows = rows, sort = sort, **search_kwargs)
+    pages = [first_page['results']]
+    starts = list(range(rows, first_page['count'], rows))
+
+    if len(starts) > 0:
+        if (page_workers is None) or (page_workers <= 1):
+            for start in starts:
+                pages.append(ckan.action.package_search(start = start, rows = rows, sort = sort,
+                                                        **search_kwargs)['results'])
+        else:
+            # Each thread needs its own session, provided by a WindLabClient
+            own_client = client is None
+            if own_client:
+                from CKAN_API_Client import WindLabClient
+                client = WindLabClient(ckan.address, api_token = ckan.apikey,
+                                       pool_maxsize = page_workers)
+
+            def get_page(start):
+                return client.ckan.action.package_search(start = start, rows = rows, sort = sort,
+                                                         **search_kwargs)['results']
+            try:
+                with ThreadPoolExecutor(max_workers = page_workers) as executor:
+                    pages.extend(executor.map(get_page, starts))
+            finally:
+                if own_client:
+                    client.close()
+
+    # Merging pages, dropping data sets that moved between pages
+    packages = []
+    package_ids = set()
+    for page in pages:
+        for package in page:
+            if 'id' in package:
+                if package['id'] in package_ids:
+                    continue
+                package_ids.add(package['id'])
+            packages.append(package)
+    return packages
+
+
+def iter_packages(ckan,
+                  rows = 100,
+                  sort = search_sort_order,
+                  **search_kwargs):
+    """
+    Generator over all packages matching a package_search. Packages are 
+    yielded as soon as their page arrives, and the next page is only 
+    requested once all packages of the current page have been consumed, so 
+    that stopping early saves the remaining requests.
+
+    Parameters
+    ----------
+    ckan : RemoteCKAN
+        Connection to a CKAN data base.
+    rows : Integer, optional
+        Number of packages per page. The default is 100.
+    sort : String, optional
+        Solr sort order of the search. The default is search_sort_order.
+    **search_kwargs
+        Further arguments to package_search, e.g. q, fq or include_private.
+
+    Yields
+    ------
+    Dict
+        Package dict.
+    """
+    start = 0
+    package_ids = set()
+    while True:
+        page = ckan.action.package_search(start = start, rows = rows, sort = sort, **search_kwargs)
+        for package in page['results']:
+            if 'id' in package:
+                if package['id'] in package_ids:
+                    continue
+                package_ids.add(package['id'])
+            yield package
+
+        start = start + rows
+        if (len(page['results']) == 0) or (start >= page['count']):
+            break
+
+
 def get_dataset_all_id(ckan_url, 
                    api_token = None, 
                    verbose = False,
                    error = True,
-                   level_num = 0):
+                   level_num = 0,
+                   client = None,
+                   rows = 100,
+                   page_workers = 4):
+    """
+    Returns the ids and titles of all data sets.
+
+    Parameters
+    ----------
+    ckan_url : String
+        URL of the ckan installation.
+    api_token : String, optional
+        CKAN access token. The default is None.
+    client : WindLabClient, optional
+        Shared client with a pooled connection. The default is None.
+    rows : Integer, optional
+        Number of data sets per page of the search. The default is 100.
+    page_workers : Integer, optional
+        Number of pages fetched in parallel. The default is 4.
+
+    Returns
+    -------
+    dataset_ids : List
+        List of data set ids.
+    dataset_title : List
+        List of data set titles.
+    """
 
     level_num = level_num + 1
     if verbose: 
@@ -1364,28 +2104,21 @@ def get_dataset_all_id(ckan_url,
         level_num = level_num + 1
 
     # Initialize the CKAN API client
-    ckan = RemoteCKAN(ckan_url, apikey=api_token)
-
-    # Start by getting the first page of datasets
-    start=0
-    rows=100
+    ckan = get_ckan(ckan_url, api_token, client = client)
+
+    # Getting all pages of datasets
+    datasets = search_packages(ckan,
+                               rows = rows,
+                               page_workers = page_workers,
+                               client = client,
+                               q = 'title:*')
     dataset_ids = []
     dataset_title = []
-    while True:
-        list_ids = ckan.action.package_search(q='title:*', start=start, rows=rows)
-
-        # If there are no more datasets, break the loop
-        if not list_ids['results']:
-                break    # List to store dataset IDs
-        
-
-        # Append dataset IDs to the list
-        for dataset in list_ids['results']:
-            dataset_ids.append(dataset['id'])
-            dataset_title.append(dataset['title'])
 
-        # Update the start value for the next page
-        start += rows
+    # Append dataset IDs to the list
+    for dataset in datasets:
+        dataset_ids.append(dataset['id'])
+        dataset_title.append(dataset['title'])
 
     if verbose: 
         buffer_tabs(level_num-1)
@@ -1398,7 +2131,9 @@ def get_dataset_id(ckan_url,
                    dataset_names = '*', 
                    verbose = False,
                    error = True,
-                   level_num = 0):
+                   level_num = 0,
+                   client = None,
+                   metadata_cache = None):
     """
     Gets the dataset_id from dataset_name
     
@@ -1414,6 +2149,11 @@ def get_dataset_id(ckan_url,
         Unique dataset name.
     verbose : Boolean, optional
         If true, further display to screen. The default is False.
+    client : WindLabClient, optional
+        Shared client with a pooled connection. The default is None.
+    metadata_cache : MetadataCache, optional
+        Local store of package metadata. If given, a list of names is 
+        resolved through one package_search. The default is None.
 
     Returns
     -------
@@ -1429,6 +2169,31 @@ def get_dataset_id(ckan_url,
 
     dataset_ids = []
 
+    if (type(dataset_names) == list) and (metadata_cache is not None):
+        # One package_search gives the ids of all names
+        ckan = get_ckan(ckan_url, client = client)
+        dataset_names = [dataset_name.lower() for dataset_name in dataset_names]
+        current = metadata_cache.revalidate(ckan, dataset_names)
+        for dataset_name in dataset_names:
+            try:
+                if dataset_name in current:
+                    dataset_ids.append(current[dataset_name][0])
+                else:
+                    dataset_ids.append(metadata_cache.fetch_package(ckan, dataset_name)['id'])
+            except:
+                if error:
+                    if verbose: 
+                        buffer_tabs(level_num-1)
+                        print('Exiting "get_dataset_id"')
+                    raise ValueError('Not able to get dataset_id')
+                if verbose:
+                    print(f'ERROR: get_dataset_id(): Not able to get dataset_id for dataset with name "{dataset_name}"')
+                dataset_ids.append(None)
+        if verbose: 
+            buffer_tabs(level_num-1)
+            print('Exiting "get_dataset_id"')
+        return dataset_ids
+
     if type(dataset_names) == list:
         for dataset_name in dataset_names:
             dataset_id = get_dataset_id(ckan_url, 
@@ -1436,18 +2201,22 @@ def get_dataset_id(ckan_url,
                             dataset_name, 
                             verbose = verbose,
                             error = error,
-                            level_num = level_num)
+                            level_num = level_num,
+                            client = client)
             dataset_ids.append(dataset_id)
         if verbose: 
             buffer_tabs(level_num-1)
             print('Exiting "get_dataset_id"')
         return dataset_ids
     # Connect to the CKAN instance
-    ckan = RemoteCKAN(ckan_url)
+    ckan = get_ckan(ckan_url, client = client)
 
     # Get the dataset details
     try:
-        dataset = ckan.action.package_show(id=dataset_names.lower())
+        if metadata_cache is not None:
+            dataset = metadata_cache.package_show(ckan, dataset_names.lower())
+        else:
+            dataset = ckan.action.package_show(id=dataset_names.lower())
         if verbose: 
             buffer_tabs(level_num-1)
             print('Exiting "get_dataset_id"')
@@ -1498,7 +2267,7 @@ def load_yaml(file_path):
 
     with open(file_path, 'r') as file:
         try:
-            return yaml.safe_load(file)
+            return yml_utils.safe_load(file)
         except yaml.YAMLError as exc:
             try:
                 return yml_utils.load_yaml(file)
@@ -1511,7 +2280,9 @@ def validate_yaml_with_schema(yaml_file_path,
                               resource_schema_name,
                               verbose = False,
                               error=True,
-                              level_num = 0):
+                              level_num = 0,
+                              validation_cache = None,
+                              lazy_netcdf = False):
     """
     Validate a YAML file against a JSON schema.
 
@@ -1527,6 +2298,13 @@ def validate_yaml_with_schema(yaml_file_path,
     verbose : Boolean, optional
         If true, further display to screen. 
         The default is False.
+    validation_cache : yml_utils.ValidationCache, optional
+        On-disk cache of validation results. Unchanged files and schemas are
+        not validated again. The default is None.
+    lazy_netcdf : Boolean, optional
+        If True, netCDF files included through !include are validated 
+        without loading them into Python lists, see 
+        yml_utils.LazyXrResourceLoader. The default is False.
 
     Returns
     -------
@@ -1559,7 +2337,10 @@ def validate_yaml_with_schema(yaml_file_path,
             try:
                 validate_yaml(
                     data_file   = yaml_file_path, 
-                    schema_file = 'schemas/' + resource_schema_type + '/' + resource_schema_name + '.yaml'
+                    schema_file = 'schemas/' + resource_schema_type + '/' + resource_schema_name + '.yaml',
+                    loader      = (yml_utils.LazyXrResourceLoader if lazy_netcdf 
+                                   else yml_utils.XrResourceLoader),
+                    cache       = validation_cache
                 )
             except:
                 print('ERROR: File ', yaml_file_path, ' could not be validated.')
@@ -1590,7 +2371,9 @@ def check_against_schema(this_res,
                  resource_schema_type = None,
                  verbose = False,
                  error = True,
-                 level_num = 0):
+                 level_num = 0,
+                 validation_cache = None,
+                 lazy_netcdf = False):
     """
     Checks the resource against a schema. If failes, then key 'schema_name' of
     resourcde will be set to None.
@@ -1606,6 +2389,11 @@ def check_against_schema(this_res,
     verbose : Boolean, optional
         If true, further display to screen. 
         The default is False.
+    validation_cache : yml_utils.ValidationCache, optional
+        On-disk cache of validation results. The default is None.
+    lazy_netcdf : Boolean, optional
+        If True, included netCDF files are validated lazily, see 
+        validate_yaml_with_schema. The default is False.
 
     Returns
     -------
@@ -1634,7 +2422,9 @@ def check_against_schema(this_res,
                                                     resource_schema_type = resource_schema_type,
                                                     resource_schema_name = resource_schema_name,
                                                     verbose = verbose,
-                                                    level_num = level_num)
+                                                    level_num = level_num,
+                                                    validation_cache = validation_cache,
+                                                    lazy_netcdf = lazy_netcdf)
                 else:
                     ret = False
 
@@ -1671,13 +2461,138 @@ def check_against_schema(this_res,
             return this_res
 
     
+def file_sha256(file_name,
+                chunk_size = download_chunk_size):
+    """
+    Returns the SHA-256 hex digest of a file, read in chunks of chunk_size 
+    bytes, so that the memory used stays constant whatever the file size.
+    """
+    sha = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class MultipartFileEncoder(object):
+    """
+    File-like multipart/form-data body, with text fields and one file. The 
+    file is read from disk in chunks while the body is sent, so that the 
+    memory used stays constant whatever the size of the file. Passed as data
+    to requests.post together with the Content-Type header of content_type.
+
+    Parameters
+    ----------
+    fields : Dict
+        Text fields of the form. Fields with value None are left out.
+    file_field : String
+        Name of the file field, e.g. 'upload'.
+    file_name : String
+        Dir and file name of the file to send.
+    progress_callback : Function, optional
+        Called as progress_callback(bytes_sent, total_bytes, bytes_per_second)
+        about every download_chunk_size bytes, and once the body is sent, 
+        with the bytes of the file sent and the size of the file.
+        The default is None.
+
+    Example
+    -------
+    with MultipartFileEncoder(resource_data, 'upload', 'data.nc') as body:
+        respo = requests.post(url, data=body, 
+                              headers={'Content-Type': body.content_type})
+    """
+
+    def __init__(self,
+                 fields,
+                 file_field,
+                 file_name,
+                 progress_callback = None):
+
+        self.boundary       = binascii.hexlify(os.urandom(16)).decode('ascii')
+        self.content_type   = 'multipart/form-data; boundary=' + self.boundary
+        self.progress_callback = progress_callback
+
+        preamble = b''
+        for key, value in fields.items():
+            if value is None:
+                continue
+            if not isinstance(value, bytes):
+                value = str(value).encode('utf-8')
+            preamble = (preamble + self._part_header('name="' + self._quote(key) + '"')
+                        + value + b'\r\n')
+        preamble = preamble + self._part_header(
+            'name="' + self._quote(file_field) + '"; filename="' 
+            + self._quote(os.path.basename(file_name)) + '"', 
+            'application/octet-stream')
+        epilogue = ('\r\n--' + self.boundary + '--\r\n').encode('ascii')
+
+        self.file_size  = os.path.getsize(file_name)
+        self.len        = len(preamble) + self.file_size + len(epilogue)
+        self._preamble_size = len(preamble)
+        self.bytes_sent = 0
+        self._file      = open(file_name, 'rb')
+        self._parts     = [io.BytesIO(preamble), self._file, io.BytesIO(epilogue)]
+        self._start     = None
+        self._reported  = 0
+
+    def __len__(self):
+        return self.len
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def read(self, size = -1):
+        """Reads up to size bytes of the body, all remaining if size < 0."""
+        if self._start is None:
+            self._start = time.time()
+        if (size is None) or (size < 0):
+            size = self.len - self.bytes_sent
+        chunk = b''
+        while (len(chunk) < size) and (len(self._parts) > 0):
+            data = self._parts[0].read(size - len(chunk))
+            if len(data) == 0:
+                self._parts.pop(0)
+            chunk = chunk + data
+        self.bytes_sent = self.bytes_sent + len(chunk)
+
+        if self.progress_callback is not None:
+            if ((self.bytes_sent - self._reported >= download_chunk_size) or 
+                    ((self.bytes_sent == self.len) and (self._reported < self.len))):
+                self._reported = self.bytes_sent
+                elapsed = max(time.time() - self._start, 1e-6)
+                file_bytes = min(max(self.bytes_sent - self._preamble_size, 0), self.file_size)
+                self.progress_callback(file_bytes, self.file_size, file_bytes / elapsed)
+        return chunk
+
+    def close(self):
+        """Closes the file."""
+        self._file.close()
+
+    def _part_header(self, disposition, content_type = None):
+        header = '--' + self.boundary + '\r\nContent-Disposition: form-data; ' + disposition + '\r\n'
+        if content_type is not None:
+            header = header + 'Content-Type: ' + content_type + '\r\n'
+        return (header + '\r\n').encode('utf-8')
+
+    @staticmethod
+    def _quote(value):
+        return str(value).replace('\\', '\\\\').replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+
 def write_resource(ckan_url,
                   api_token,
                   dataset_id,
                   this_res,
                   verbose = False,
                   error = True,
-                  level_num = 0):
+                  level_num = 0,
+                  client = None,
+                  progress_callback = None,
+                  upload_info = None,
+                  existing_resources = None):
     """
     Function to dump data into the CKAN data base, and checks if compliant to 
     a schema if requested by user.
@@ -1701,6 +2616,22 @@ def write_resource(ckan_url,
     verbose : Boolean, optional
         If true, further display to screen. 
         The default is False.
+    client : WindLabClient, optional
+        Shared client with a pooled connection. The default is None.
+    progress_callback : Function, optional
+        Called as progress_callback(bytes_sent, total_bytes, bytes_per_second)
+        while a file is uploaded. The default is None.
+    upload_info : Dict, optional
+        If given, filled with 'hash' (SHA-256 of the file), 'bytes_sent' and 
+        'bytes_skipped', the latter if a resource with the same name and 
+        hash already exists in the data set and the upload was skipped. 
+        The default is None.
+    existing_resources : List, optional
+        Resources of the data set before the upload, e.g. from one 
+        package_show per data set. A resource with the same name and hash 
+        is not uploaded again, one with the same name and another hash is 
+        replaced. If None, the data set is looked up by package_show. 
+        The default is None.
 
     Returns
     -------
@@ -1736,13 +2667,59 @@ def write_resource(ckan_url,
         }
         # Get link to local data source
         resource_source = this_res['source']
-        # Now dump the resource
+        if upload_info is None:
+            upload_info = {}
+        upload_info['bytes_sent']       = 0
+        upload_info['bytes_skipped']    = 0
+
+        # Checksum stored with the resource, identical files are not uploaded
+        # again to the same data set under the same name, changed ones 
+        # replace the resources of that name
+        stale_resources = []
         try:
-            respo = requests.post(resource_create_url,
-                              data=resource_data,
-                              headers=headers,
-                              files=[('upload', open(resource_source, 'rb'))])
+            resource_data['hash'] = file_sha256(resource_source)
+            upload_info['hash'] = resource_data['hash']
+            if existing_resources is None:
+                existing = get_ckan(ckan_url, api_token = api_token, 
+                                    client = client).action.package_show(id = dataset_id)
+                existing_resources = existing.get('resources', [])
+            stale_resources = [rr for rr in existing_resources if rr.get('name') == this_res['name']]
+            if resource_data['hash'] in [rr.get('hash') for rr in stale_resources]:
+                upload_info['bytes_skipped'] = os.path.getsize(resource_source)
+                if verbose:
+                    buffer_tabs(level_num)
+                    print('Resource with same name and hash already in data set, not uploaded: ', 
+                          this_res['name'])
+                    buffer_tabs(level_num-1)
+                    print('Exiting "write_resource()"')
+                return True
+        except Exception as err:
+            if verbose:
+                buffer_tabs(level_num)
+                print('Not able to check for existing resource: ', err)
+        if len(stale_resources) > 0:
+            resource_create_url = f'{ckan_url}/api/action/resource_update'
+            resource_data['id'] = stale_resources[0]['id']
+            del resource_data['package_id']
+            if verbose:
+                buffer_tabs(level_num)
+                print('Replacing resource: ', this_res['name'])
+
+        # Now dump the resource, streamed from disk
+        try:
+            with MultipartFileEncoder(resource_data, 'upload', resource_source,
+                                      progress_callback = progress_callback) as body:
+                headers['Content-Type'] = body.content_type
+                respo = get_http(client).post(resource_create_url,
+                                  data=body,
+                                  headers=headers)
+                upload_info['bytes_sent'] = body.bytes_sent
             status_code = respo.status_code
+            if status_code == 200:
+                # Further resources of the same name, e.g. of earlier runs
+                ckan = get_ckan(ckan_url, api_token = api_token, client = client)
+                for rr in stale_resources[1:]:
+                    ckan.action.resource_delete(id = rr['id'])
             if status_code != 200:
                 print('ERROR: write_resource(): ', respo.json()['error'])
                 if verbose: 
@@ -1767,7 +2744,7 @@ def write_resource(ckan_url,
         # Now dump the resource
         status_code = 'unknown'
         try:
-            respo = requests.post(resource_create_url,
+            respo = get_http(client).post(resource_create_url,
                               data=resource_data,
                               headers=headers)
             status_code = respo.status_code
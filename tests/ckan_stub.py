@@ -0,0 +1,225 @@
+"""Minimal CKAN stand-in on a local http.server thread, for the tests."""
+import hashlib
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class CkanStub(object):
+    """
+    Serves the CKAN actions used by the package, and files under /dl/<name>
+    with support for Range and If-Range. If honor_range is False, Range is
+    ignored, while 'Accept-Ranges: bytes' is still sent.
+
+    Example:
+        with CkanStub() as stub:
+            stub.files['a.csv'] = b'...'
+            respo = requests.get(stub.url + '/dl/a.csv')
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.packages = []
+        self.files = {}
+        self.orgs = [{'id': 'org1', 'name': 'dtu', 'display_name': 'DTU'}]
+        self.licenses = [{'id': 'cc-zero', 'title': 'Creative Commons CCZero'}]
+        self.honor_range = True
+        self.etags = {}
+        self.ranges = []
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub._handle(self)
+
+            def do_POST(self):
+                stub._handle(self)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def actions(self, name):
+        """Returns the parameters of all calls of the action name."""
+        return [params for path, params in self.calls if path.endswith('/' + name)]
+
+    def etag(self, name):
+        return self.etags.get(name, '"' + hashlib.md5(self.files[name]).hexdigest() + '"')
+
+    # Request handling
+    def _handle(self, handler):
+        url = urlparse(handler.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        length = int(handler.headers.get('Content-Length') or 0)
+        body = handler.rfile.read(length) if length else b''
+        content_type = handler.headers.get('Content-Type', '')
+        if 'multipart' in content_type:
+            for m in re.finditer(rb'name="([^"]+)"(?:; filename="[^"]*")?\r\n(?:Content-Type: [^\r]*\r\n)?\r\n(.*?)\r\n--',
+                                 body, re.S):
+                params[m.group(1).decode()] = m.group(2).decode(errors='replace')
+        elif 'json' in content_type and body:
+            params.update(json.loads(body))
+        elif body:
+            params.update({k: v[0] for k, v in parse_qs(body.decode()).items()})
+        self.calls.append((url.path, params))
+
+        if url.path.startswith('/dl/'):
+            return self._download(handler, url.path[4:])
+        m = re.match(r'/api/(?:3/)?action/(\w+)$', url.path)
+        action = getattr(self, 'action_' + m.group(1), None) if m else None
+        if action is None:
+            return self._json(handler, {'success': False, 'error': {'message': 'Not found'}}, 404)
+        with self._lock:
+            result = action(params)
+        if isinstance(result, tuple):
+            return self._json(handler, result[1], result[0])
+        return self._json(handler, {'success': True, 'result': result})
+
+    def _json(self, handler, obj, code=200):
+        body = json.dumps(obj).encode()
+        handler.send_response(code)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def _download(self, handler, name):
+        data = self.files.get(name)
+        if data is None:
+            handler.send_response(404)
+            handler.send_header('Content-Length', '0')
+            handler.end_headers()
+            return
+        etag = self.etag(name)
+        self.ranges.append(handler.headers.get('Range'))
+        start = 0
+        match = re.match(r'bytes=(\d+)-$', handler.headers.get('Range', ''))
+        if_range = handler.headers.get('If-Range')
+        if match and self.honor_range and (if_range is None or if_range == etag):
+            start = int(match.group(1))
+            handler.send_response(206)
+            handler.send_header('Content-Range', 'bytes %d-%d/%d' % (start, len(data) - 1, len(data)))
+        else:
+            handler.send_response(200)
+        handler.send_header('Accept-Ranges', 'bytes')
+        handler.send_header('ETag', etag)
+        handler.send_header('Content-Length', str(len(data) - start))
+        handler.end_headers()
+        handler.wfile.write(data[start:])
+
+    # Actions
+    def _package(self, id_or_name):
+        for package in self.packages:
+            if id_or_name in (package['id'], package['name']):
+                return package
+        return None
+
+    def action_package_search(self, params):
+        packages = self.packages
+        q = params.get('q', '*:*')
+        m = re.match(r'name:(.*)\*$', q)
+        if m:
+            prefix = m.group(1).replace('\\', '')
+            packages = [p for p in packages if p['name'].startswith(prefix)]
+        elif ':' not in q:
+            # Free text, matched against the title
+            packages = [p for p in packages if q.lower() in (p.get('title') or '').lower()]
+        elif q != '*:*':
+            # field:value, e.g. tags:wake
+            field, value = q.split(':', 1)
+            packages = [p for p in packages if value in (
+                [t.get('name') for t in p[field]] if isinstance(p.get(field), list) else [p.get(field)])]
+        m = re.match(r'metadata_modified:\[(\S+) TO \*\]$', params.get('fq', ''))
+        if m:
+            packages = [p for p in packages if p['metadata_modified'] >= m.group(1).rstrip('Z')]
+        start, rows = int(params.get('start', 0)), int(params.get('rows', 10))
+        results = packages[start:start + rows]
+        fl = params.get('fl')
+        if fl:
+            keys = fl if isinstance(fl, list) else [k.strip() for k in fl.split(',')]
+            results = [{k: p.get(k) for k in keys} for p in results]
+        return {'count': len(packages), 'results': results}
+
+    def action_package_show(self, params):
+        package = self._package(params.get('id'))
+        if package is None:
+            return 404, {'success': False, 'error': {'__type': 'Not Found Error', 'message': 'Not found'}}
+        return package
+
+    def action_resource_show(self, params):
+        for package in self.packages:
+            for resource in package['resources']:
+                if resource['id'] == params.get('id'):
+                    return resource
+        return 404, {'success': False, 'error': {'__type': 'Not Found Error', 'message': 'Not found'}}
+
+    def action_package_create(self, params):
+        if re.match(r'^[a-z0-9_-]+$', params['name']) is None:
+            return 409, {'success': False, 'error': {'__type': 'Validation Error', 'name': [
+                'Must be purely lowercase alphanumeric (ascii) characters and these symbols: -_']}}
+        if self._package(params['name']) is not None:
+            return 409, {'success': False, 'error': {'__type': 'Validation Error',
+                                                     'name': ['That URL is already in use.']}}
+        package = {'id': 'id_' + params['name'], 'name': params['name'], 'title': params.get('title'),
+                   'owner_org': params.get('owner_org'), 'resources': [], 'num_resources': 0}
+        self.packages.append(package)
+        return package
+
+    def action_resource_create(self, params):
+        package = self._package(params.get('package_id'))
+        if package is None:
+            return 404, {'success': False, 'error': {'message': 'Not found'}}
+        resource = {k: v for k, v in params.items() if k != 'upload'}
+        resource['id'] = 'res_%d' % len(self.calls)
+        package['resources'].append(resource)
+        package['num_resources'] = len(package['resources'])
+        return resource
+
+    def action_package_patch(self, params):
+        package = self._package(params.get('id'))
+        if package is None:
+            return 404, {'success': False, 'error': {'message': 'Not found'}}
+        package.update({k: v for k, v in params.items() if k not in ('id', 'name', 'resources')})
+        return package
+
+    def action_resource_update(self, params):
+        for package in self.packages:
+            for ii, resource in enumerate(package['resources']):
+                if resource['id'] == params.get('id'):
+                    resource = {k: v for k, v in params.items() if k != 'upload'}
+                    resource['package_id'] = package['id']
+                    package['resources'][ii] = resource
+                    return resource
+        return 404, {'success': False, 'error': {'message': 'Not found'}}
+
+    def action_resource_delete(self, params):
+        for package in self.packages:
+            for resource in package['resources']:
+                if resource['id'] == params.get('id'):
+                    package['resources'].remove(resource)
+                    package['num_resources'] = len(package['resources'])
+                    return None
+        return 404, {'success': False, 'error': {'message': 'Not found'}}
+
+    def action_organization_list(self, params):
+        return self.orgs
+
+    def action_license_list(self, params):
+        return self.licenses
@@ -0,0 +1,66 @@
+import sqlite3
+
+import pytest
+
+from ckanapi import RemoteCKAN
+from ckan_stub import CkanStub
+
+from CKAN_API_Cache import CatalogIndex
+
+
+def make_catalog(stub):
+    for ii, (title, notes) in enumerate([('Wakes behind turbines', 'LES of wake flows'),
+                                         ('Wake model', 'engineering model'),
+                                         ('Jet stream', 'mesoscale data')]):
+        stub.packages.append({'id': 'id%d' % ii, 'name': 'ds_%d' % ii, 'title': title, 'notes': notes,
+                              'metadata_modified': '2024-01-0%dT00:00:00' % (ii + 1), 'resources': []})
+
+
+def names(packages):
+    return sorted(package['name'] for package in packages)
+
+
+def test_search_query_syntax(tmp_path):
+    with CkanStub() as stub:
+        make_catalog(stub)
+        catalog = CatalogIndex(str(tmp_path / 'catalog.sqlite'))
+        catalog.refresh(RemoteCKAN(stub.url))
+
+        assert names(catalog.search('wake')) == ['ds_0', 'ds_1']
+        assert names(catalog.search('wake OR jet')) == ['ds_0', 'ds_1', 'ds_2']
+        assert names(catalog.search('wake model')) == ['ds_1']
+        assert names(catalog.search('wake AND NOT LES')) == ['ds_1']
+        assert names(catalog.search('wake -les')) == ['ds_1']
+        assert names(catalog.search('(jet OR les) AND title:wakes')) == ['ds_0']
+        assert names(catalog.search(None)) == ['ds_0', 'ds_1', 'ds_2']
+        catalog.close()
+
+
+def test_search_fields(tmp_path):
+    with CkanStub() as stub:
+        make_catalog(stub)
+        catalog = CatalogIndex(str(tmp_path / 'catalog.sqlite'))
+        catalog.refresh(RemoteCKAN(stub.url))
+
+        assert names(catalog.search('name:ds_0')) == ['ds_0']
+        assert names(catalog.search('title:(wake OR jet)')) == ['ds_0', 'ds_1', 'ds_2']
+        assert names(catalog.search('title:(model OR stream)')) == ['ds_1', 'ds_2']
+        assert names(catalog.search('notes:(les OR mesoscale) -title:jet')) == ['ds_0']
+        for tag_string in ['organization:dtu', 'res_format:CSV', 'wake AND res_format:(CSV)']:
+            with pytest.raises(ValueError):
+                catalog.search(tag_string)
+        catalog.close()
+
+
+def test_index_without_stemming_is_rebuilt(tmp_path):
+    db_file_name = str(tmp_path / 'catalog.sqlite')
+    db = sqlite3.connect(db_file_name)
+    db.execute('CREATE VIRTUAL TABLE packages_fts USING fts5(id UNINDEXED, name, title)')
+    db.execute("CREATE TABLE settings (key TEXT PRIMARY KEY, value TEXT)")
+    db.execute("INSERT INTO settings VALUES ('last_modified', '2030-01-01T00:00:00')")
+    db.commit()
+    db.close()
+
+    catalog = CatalogIndex(db_file_name)
+    assert catalog.last_modified is None
+    catalog.close()
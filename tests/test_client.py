@@ -0,0 +1,50 @@
+import threading
+import time
+
+import pytest
+from ckan_stub import CkanStub
+
+import CKAN_API_Helper as CK_helper
+from CKAN_API_Client import WindLabClient
+
+
+def test_get_ckan_token_of_client():
+    with WindLabClient('http://127.0.0.1:1', 'token') as client:
+        assert CK_helper.get_ckan(client.ckan_url, client = client) is client.ckan
+        assert CK_helper.get_ckan(client.ckan_url, 'token', client = client) is client.ckan
+        with pytest.raises(ValueError):
+            CK_helper.get_ckan(client.ckan_url, 'other', client = client)
+
+
+def test_resolver_not_blocked_by_slow_fetch():
+    with CkanStub() as stub:
+        with WindLabClient(stub.url, 'token') as client:
+            assert client.resolver.org_id('DTU') == 'org1'
+
+            # Slow license_list in one thread
+            started = threading.Event()
+            license_list = stub.action_license_list
+
+            def slow_license_list(params):
+                started.set()
+                time.sleep(1.0)
+                return license_list(params)
+            stub.action_license_list = slow_license_list
+            results = []
+            threads = [threading.Thread(target = lambda: results.append(
+                client.resolver.license_id('creative commons cczero'))) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            assert started.wait(5)
+
+            # Organizations still answered from the list in memory
+            start = time.time()
+            assert client.resolver.org_id('dtu') == 'org1'
+            assert time.time() - start < 0.5
+
+            for thread in threads:
+                thread.join()
+            assert results == ['cc-zero'] * 3
+            # One request for all threads waiting for the list
+            assert len(stub.actions('license_list')) == 1
+            assert len(stub.actions('organization_list')) == 1
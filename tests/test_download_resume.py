@@ -0,0 +1,107 @@
+import json
+import os
+
+from ckanapi import RemoteCKAN
+from ckan_stub import CkanStub
+
+import CKAN_API_Helper as CK_helper
+
+
+CONTENT = bytes(range(256)) * 400
+
+
+def start_download(stub, tmp_path, part_bytes, etag=None, base_name='data.bin'):
+    """Leaves a part file with part_bytes of CONTENT and its sidecar, as an interrupted download."""
+    url = stub.url + '/dl/data.bin'
+    file_name = str(tmp_path / base_name)
+    with open(file_name + '.part', 'wb') as f:
+        f.write(part_bytes)
+    with open(file_name + '.part.json', 'w') as f:
+        json.dump({'url': url, 'etag': etag or stub.etag('data.bin'), 'last_modified': None,
+                   'bytes': len(part_bytes)}, f)
+    return url, file_name
+
+
+def range_requests(stub):
+    return [params for path, params in stub.calls if path == '/dl/data.bin']
+
+
+def read(file_name):
+    with open(file_name, 'rb') as f:
+        return f.read()
+
+
+def test_resume_from_part_file(tmp_path):
+    with CkanStub() as stub:
+        stub.files['data.bin'] = CONTENT
+        url, file_name = start_download(stub, tmp_path, CONTENT[:40000])
+
+        respo = CK_helper.get_resource_response(url, file_name)
+        num_bytes = CK_helper.write_response_to_file(respo, file_name)
+
+        assert num_bytes == len(CONTENT) - 40000
+        assert read(file_name) == CONTENT
+        assert stub.ranges == ['bytes=40000-']
+    assert not os.path.exists(file_name + '.part')
+    assert not os.path.exists(file_name + '.part.json')
+
+
+def test_range_ignored_restarts(tmp_path):
+    with CkanStub() as stub:
+        stub.files['data.bin'] = CONTENT
+        stub.honor_range = False
+        url, file_name = start_download(stub, tmp_path, CONTENT[:40000])
+
+        respo = CK_helper.get_resource_response(url, file_name)
+        num_bytes = CK_helper.write_response_to_file(respo, file_name)
+
+        assert num_bytes == len(CONTENT)
+        assert read(file_name) == CONTENT
+        assert len(range_requests(stub)) == 1
+
+
+def test_if_range_mismatch_restarts(tmp_path):
+    with CkanStub() as stub:
+        stub.files['data.bin'] = CONTENT
+        url, file_name = start_download(stub, tmp_path, CONTENT[:40000])
+
+        # Resource replaced on the server after the part file was written
+        new_content = CONTENT[::-1]
+        stub.files['data.bin'] = new_content
+        respo = CK_helper.get_resource_response(url, file_name)
+        assert respo.status_code == 200
+        num_bytes = CK_helper.write_response_to_file(respo, file_name)
+
+        assert num_bytes == len(new_content)
+        assert read(file_name) == new_content
+        assert len(range_requests(stub)) == 1
+
+
+def test_part_file_of_other_version_not_resumed(tmp_path):
+    with CkanStub() as stub:
+        stub.files['data.bin'] = CONTENT
+        url, file_name = start_download(stub, tmp_path, b'x' * 40000, etag='"old"')
+
+        respo = CK_helper.get_resource_response(url, file_name)
+        num_bytes = CK_helper.write_response_to_file(respo, file_name)
+
+        assert num_bytes == len(CONTENT)
+        assert read(file_name) == CONTENT
+        assert len(range_requests(stub)) == 1
+
+
+def test_read_resource_resumes_in_one_request(tmp_path):
+    with CkanStub() as stub:
+        stub.files['data.bin'] = CONTENT
+        stub.packages.append({'id': 'id0', 'name': 'ds_0', 'resources': [
+            {'id': 'r0', 'name': 'data.zip', 'format': 'zip', 'url': stub.url + '/dl/data.bin',
+             'url_type': 'upload'}]})
+        os.makedirs(str(tmp_path / 'ds_0'))
+        url, file_name = start_download(stub, tmp_path / 'ds_0', CONTENT[:40000], base_name='data.zip')
+
+        data = CK_helper.read_resource(RemoteCKAN(stub.url), 'ds_0', 'r0', write_to_file = True,
+                                       dir_name = str(tmp_path))
+
+        assert data == file_name
+        assert read(data) == CONTENT
+        assert stub.ranges == ['bytes=40000-']
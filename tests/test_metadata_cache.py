@@ -0,0 +1,35 @@
+from ckanapi import RemoteCKAN
+from ckan_stub import CkanStub
+
+from CKAN_API_Cache import MetadataCache
+
+
+def add_package(stub):
+    stub.packages.append({'id': 'id0', 'name': 'ds_0', 'metadata_modified': '2024-01-01T00:00:00',
+                          'resources': [{'id': 'r0', 'name': 'a.csv', 'package_id': 'id0'}]})
+
+
+def test_resource_show_within_ttl(tmp_path):
+    with CkanStub() as stub:
+        add_package(stub)
+        ckan = RemoteCKAN(stub.url)
+        metadata_cache = MetadataCache(str(tmp_path / 'metadata.sqlite'))
+        metadata_cache.package_show(ckan, 'id0')
+
+        assert metadata_cache.resource_show(ckan, 'r0')['name'] == 'a.csv'
+        assert len(stub.actions('resource_show')) == 0
+        metadata_cache.close()
+
+
+def test_resource_show_after_ttl(tmp_path):
+    with CkanStub() as stub:
+        add_package(stub)
+        ckan = RemoteCKAN(stub.url)
+        metadata_cache = MetadataCache(str(tmp_path / 'metadata.sqlite'), ttl = -1)
+        metadata_cache.package_show(ckan, 'id0')
+
+        # Changed on the server, but package not revalidated within ttl
+        stub.packages[0]['resources'][0]['name'] = 'b.csv'
+        assert metadata_cache.resource_show(ckan, 'r0')['name'] == 'b.csv'
+        assert len(stub.actions('resource_show')) == 1
+        metadata_cache.close()
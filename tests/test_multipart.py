@@ -0,0 +1,66 @@
+import email.parser
+import email.policy
+
+from ckan_stub import CkanStub
+
+import CKAN_API_Helper as CK_helper
+
+
+def parse_multipart(content_type, body):
+    message = email.parser.BytesParser(policy = email.policy.HTTP).parsebytes(
+        b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+    assert message.is_multipart()
+    return {part.get_param('name', header = 'content-disposition'): part
+            for part in message.iter_parts()}
+
+
+def test_encoded_body_is_valid_multipart(tmp_path, monkeypatch):
+    monkeypatch.setattr(CK_helper, 'download_chunk_size', 1000)
+    content = bytes(range(256)) * 40 + b'\r\n--'
+    file_name = tmp_path / 'data "1".bin'
+    file_name.write_bytes(content)
+    progress = []
+
+    fields = {'name': 'data.bin', 'description': 'Ä\r\nb', 'package_id': 'id0', 'url': None}
+    with CK_helper.MultipartFileEncoder(fields, 'upload', str(file_name),
+                                        progress_callback = lambda *args: progress.append(args)) as body:
+        chunks = []
+        while True:
+            chunk = body.read(777)
+            if len(chunk) == 0:
+                break
+            chunks.append(chunk)
+        data = b''.join(chunks)
+        assert len(data) == len(body) == body.bytes_sent
+        content_type = body.content_type
+
+    boundary = content_type.split('boundary=')[1].encode()
+    assert data.startswith(b'--' + boundary + b'\r\n')
+    assert data.endswith(b'\r\n--' + boundary + b'--\r\n')
+
+    parts = parse_multipart(content_type, data)
+    assert sorted(parts) == ['description', 'name', 'package_id', 'upload']
+    assert parts['name'].get_payload(decode = True) == b'data.bin'
+    assert parts['description'].get_payload(decode = True) == 'Ä\r\nb'.encode('utf-8')
+    assert parts['upload'].get_filename() == 'data %221%22.bin'
+    assert parts['upload'].get_payload(decode = True) == content
+
+    # Progress adds up to the size of the file, reported about every 1000 bytes
+    assert progress[-1][0] == progress[-1][1] == len(content)
+    assert [args[0] for args in progress] == sorted(set(args[0] for args in progress))
+    assert len(progress) >= len(content) // 2000
+
+
+def test_upload_through_stub(tmp_path):
+    content = b'x,y\n' * 50000
+    file_name = tmp_path / 'data.csv'
+    file_name.write_bytes(content)
+    with CkanStub() as stub:
+        with CK_helper.MultipartFileEncoder({'package_id': 'id0'}, 'upload', str(file_name)) as body:
+            respo = CK_helper.requests.post(stub.url + '/api/action/resource_create', data = body,
+                                            headers = {'Content-Type': body.content_type})
+            length = len(body)
+        path, params = stub.calls[-1]
+    assert respo.request.headers['Content-Length'] == str(length)
+    assert params['upload'].encode() == content
+    assert params['package_id'] == 'id0'
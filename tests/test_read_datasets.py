@@ -0,0 +1,82 @@
+from ckanapi import RemoteCKAN
+from ckan_stub import CkanStub
+
+import CKAN_API_Calls as CK_calls
+import CKAN_API_Helper as CK_helper
+from CKAN_API_Client import WindLabClient
+
+
+def test_failed_resource_reports_cause(tmp_path):
+    with CkanStub() as stub:
+        stub.packages.append({'id': 'id0', 'name': 'ds_0', 'resources': [
+            {'id': 'r0', 'name': 'missing.csv', 'format': 'CSV', 'url': stub.url + '/dl/missing.csv',
+             'url_type': 'upload'}]})
+        entry = CK_calls.read_resource_entry(RemoteCKAN(stub.url), 'ds_0', 'r0')
+
+    assert entry['success'] is False
+    assert 'HTTP status code 404' in entry['error']
+
+
+def test_via_file_uses_client_credentials(tmp_path, monkeypatch):
+    # No default.yml in the working directory
+    monkeypatch.chdir(tmp_path)
+    setup_file_name = tmp_path / 'read.yml'
+    setup_file_name.write_text("data:\n"
+                               "    - data:\n"
+                               "        tag_strings : ['wake']\n"
+                               "        resource_type : 'link'\n"
+                               "        write_to_file : False\n"
+                               "        dir_name : ''\n")
+    with CkanStub() as stub:
+        stub.packages.append({'id': 'id0', 'name': 'ds_0', 'title': 'wake', 'num_resources': 0,
+                              'resources': []})
+        with WindLabClient(stub.url, 'token') as client:
+            ret = CK_calls.read_datasets_via_file(dir_file_name = str(setup_file_name), client = client)
+        assert len(stub.actions('package_search')) > 0
+    assert isinstance(ret, list)
+
+
+def add_packages(stub, num):
+    for ii in range(num):
+        resources = []
+        for jj in range(ii % 3):
+            key = 'f%d_%d.csv' % (ii, jj)
+            stub.files[key] = ('%d,%d\n' % (ii, jj)).encode() * (100 + ii)
+            resources.append({'id': 'r%d_%d' % (ii, jj), 'name': key, 'format': 'CSV',
+                              'url': stub.url + '/dl/' + key, 'url_type': 'upload'})
+        stub.packages.append({'id': 'id%02d' % ii, 'name': 'ds_%02d' % ii, 'title': 'wake %d' % ii,
+                              'num_resources': len(resources), 'resources': resources})
+
+
+def as_bytes(result):
+    return [[(entry['name'], bytes(entry['resource']) if entry['success'] else None)
+             for entry in dataset] for dataset in result]
+
+
+def test_parallel_read_same_as_sequential():
+    windlab_data = {'data': [{'data': {'tag_strings': ['wake'], 'resource_type': 'file',
+                                       'write_to_file': False, 'dir_name': ''}}]}
+    with CkanStub() as stub:
+        add_packages(stub, 12)
+        stub.files['f4_0.csv'] = None
+        sequential = CK_calls.read_datasets(stub.url, 'token', windlab_data, rows = 5, page_workers = 1)
+        parallel = CK_calls.read_datasets(stub.url, 'token', windlab_data, rows = 5, page_workers = 3,
+                                          max_workers = 4)
+
+    assert as_bytes(parallel) == as_bytes(sequential)
+    flat = [entry for dataset in parallel for entry in dataset]
+    assert [entry['name'] for entry in flat] == [package['name'] for package in stub.packages
+                                                 for _ in package['resources']]
+    assert [entry['success'] for entry in flat].count(False) == 1
+    assert bytes(flat[0]['resource']) == stub.files['f1_0.csv']
+
+
+def test_page_fan_out_returns_each_row_once():
+    with CkanStub() as stub:
+        add_packages(stub, 23)
+        for page_workers in [1, 4]:
+            packages = CK_helper.search_packages(RemoteCKAN(stub.url), rows = 5,
+                                                 page_workers = page_workers, q = '*:*')
+            assert [package['id'] for package in packages] == [package['id'] for package in stub.packages]
+        starts = sorted(int(params['start']) for params in stub.actions('package_search'))
+        assert starts == sorted([0, 5, 10, 15, 20] * 2)
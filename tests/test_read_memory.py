@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+import requests
+import xarray as xr
+from ckanapi import RemoteCKAN
+from ckan_stub import CkanStub
+
+import CKAN_API_Helper as CK_helper
+
+
+def add_resource(stub, name, fmt, content):
+    stub.files[name] = content
+    stub.packages.append({'id': 'id_' + name, 'name': 'ds_' + name.replace('.', '_'), 'resources': [
+        {'id': 'r_' + name, 'name': name, 'format': fmt, 'url': stub.url + '/dl/' + name,
+         'url_type': 'upload'}]})
+    return 'ds_' + name.replace('.', '_'), 'r_' + name
+
+
+def test_read_response_to_memory():
+    content = bytes(range(256)) * 5000
+    with CkanStub() as stub:
+        stub.files['data.bin'] = content
+        view = CK_helper.read_response_to_memory(requests.get(stub.url + '/dl/data.bin', stream=True),
+                                                 chunk_size = 4096)
+        assert isinstance(view, memoryview)
+        assert view.nbytes == len(content)
+        assert view.tobytes() == content
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'txt', 'zip'])
+def test_read_as_memoryview(tmp_path, fmt):
+    content = b'x,y\n1,2\n' * 1000
+    with CkanStub() as stub:
+        name, resource_id = add_resource(stub, 'data.' + fmt, fmt.upper(), content)
+        data = CK_helper.read_resource(RemoteCKAN(stub.url), name, resource_id)
+    assert isinstance(data, memoryview)
+    assert bytes(data) == content
+
+
+def test_read_yaml():
+    with CkanStub() as stub:
+        name, resource_id = add_resource(stub, 'data.yaml', 'yaml',
+                                         '\ufeffa: 1\nb: [x, \u00fc]\n'.encode('utf-8'))
+        data = CK_helper.read_resource(RemoteCKAN(stub.url), name, resource_id)
+    assert data == {'a': 1, 'b': ['x', '\u00fc']}
+
+
+@pytest.mark.parametrize('nc_format', ['NETCDF4', 'NETCDF3_CLASSIC'])
+def test_read_netcdf_in_memory(tmp_path, monkeypatch, nc_format):
+    file_name = tmp_path / 'source.nc'
+    xr.Dataset({'a': ('x', np.arange(100.0))}).to_netcdf(file_name, format = nc_format)
+    # Nothing written to disk by read_resource
+    monkeypatch.chdir(tmp_path)
+    with CkanStub() as stub:
+        name, resource_id = add_resource(stub, 'data.nc', 'netCDF', file_name.read_bytes())
+        data = CK_helper.read_resource(RemoteCKAN(stub.url), name, resource_id)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['source.nc']
+    assert isinstance(data, xr.Dataset)
+    np.testing.assert_array_equal(data['a'].values, np.arange(100.0))
+    data.close()
@@ -0,0 +1,89 @@
+import gc
+import json
+import os
+
+import numpy as np
+import xarray as xr
+from ckanapi import RemoteCKAN
+from ckan_stub import CkanStub
+
+import CKAN_API_Calls as CK_calls
+import CKAN_API_Helper as CK_helper
+from CKAN_API_Cache import ResourceCache
+
+
+def add_netcdf(stub, tmp_path, ii):
+    file_name = tmp_path / ('v%d.nc' % ii)
+    xr.Dataset({'a': ('x', np.arange(1000.0) + ii)}).to_netcdf(file_name)
+    stub.files['v%d.nc' % ii] = file_name.read_bytes()
+    stub.packages.append({'id': 'id%d' % ii, 'name': 'ds_%d' % ii, 'resources': [
+        {'id': 'r%d' % ii, 'name': 'v%d.nc' % ii, 'format': 'netCDF', 'hash': 'h%d' % ii,
+         'url': stub.url + '/dl/v%d.nc' % ii, 'url_type': 'upload'}]})
+
+
+def test_open_netcdf_not_evicted(tmp_path):
+    with CkanStub() as stub:
+        for ii in range(2):
+            add_netcdf(stub, tmp_path, ii)
+        ckan = RemoteCKAN(stub.url)
+        # Room for one file
+        cache = ResourceCache(str(tmp_path / 'cache'), max_bytes = len(stub.files['v0.nc']))
+
+        variable = CK_helper.read_resource(ckan, 'ds_0', 'r0', cache = cache)['a']
+        file_name = cache.file_name(cache.key({'id': 'r0', 'hash': 'h0'}))
+        gc.collect()
+
+        # Second resource exceeds the budget, the first one is in use
+        CK_helper.read_resource(ckan, 'ds_1', 'r1', cache = cache)
+        gc.collect()
+        assert os.path.isfile(file_name)
+        assert float(variable[10]) == 10.0
+
+        del variable
+        gc.collect()
+        CK_helper.read_resource(ckan, 'ds_1', 'r1', cache = cache)
+        gc.collect()
+        assert not os.path.isfile(file_name)
+        assert cache.cache_stats()['entries'] == 1
+
+
+def test_access_times_written_in_batches(tmp_path):
+    cache = ResourceCache(str(tmp_path / 'cache'), index_write_interval = 3)
+    key = cache.key({'id': 'r0', 'hash': 'h0'})
+    with open(cache.file_name(key), 'wb') as f:
+        f.write(b'data')
+    cache.add(key, 'r0')
+
+    def last_access():
+        with open(os.path.join(cache.cache_dir, 'index.json')) as f:
+            return json.load(f)[key]['last_access']
+
+    written = last_access()
+    for ii in range(2):
+        assert cache.get(key) == cache.file_name(key)
+    assert last_access() == written
+    cache.get(key)
+    assert last_access() > written
+
+    written = last_access()
+    cache.get(key)
+    assert last_access() == written
+    cache.close()
+    assert last_access() > written
+
+    # Access times are kept by a new cache on the same dir
+    assert ResourceCache(cache.cache_dir)._index[key]['last_access'] == last_access()
+
+
+def test_chunks_passed_through(tmp_path, monkeypatch):
+    calls = []
+    open_netcdf = CK_helper.open_netcdf
+    monkeypatch.setattr(CK_helper, 'open_netcdf',
+                        lambda file_name, chunks = {}: calls.append(chunks) or open_netcdf(file_name, chunks))
+    windlab_data = {'data': [{'data': {'tag_strings': None, 'resource_type': 'file',
+                                       'write_to_file': False, 'dir_name': ''}}]}
+    with CkanStub() as stub:
+        add_netcdf(stub, tmp_path, 0)
+        ret = CK_calls.read_datasets(stub.url, 'token', windlab_data, chunks = {'x': 100})
+    assert ret[0][0]['success'] is True
+    assert calls == [{'x': 100}]
@@ -0,0 +1,102 @@
+import os
+
+from ckan_stub import CkanStub
+
+import CKAN_API_Calls as CK_calls
+import CKAN_API_Helper as CK_helper
+
+
+def add_package(stub, name, files, tags = ('wake',), modified = '2024-01-01T00:00:00'):
+    resources = []
+    for resource_name, content in files.items():
+        key = name + '_' + resource_name.replace('/', '_')
+        stub.files[key] = content
+        resources.append({'id': 'res_' + key, 'name': resource_name, 'format': 'csv',
+                          'url': stub.url + '/dl/' + key, 'url_type': 'upload',
+                          'hash': CK_helper.hashlib.sha256(content).hexdigest()})
+    package = {'id': 'id_' + name, 'name': name, 'metadata_modified': modified,
+               'tags': [{'name': tag} for tag in tags],
+               'resources': resources, 'num_resources': len(resources)}
+    stub.packages.append(package)
+    return package
+
+
+def touch(stub, package, modified):
+    package['metadata_modified'] = modified
+    package['num_resources'] = len(package['resources'])
+
+
+def test_first_and_unchanged_sync(tmp_path):
+    with CkanStub() as stub:
+        add_package(stub, 'ds_a', {'a.csv': b'1,2\n', 'b.csv': b'3,4\n'})
+        add_package(stub, 'ds_b', {'c.csv': b'5,6\n'})
+
+        first = CK_calls.sync_mirror(stub.url, 'token', 'tags:wake', str(tmp_path))
+        assert sorted(first['downloaded']) == [os.path.join('ds_a', 'a.csv'),
+                                               os.path.join('ds_a', 'b.csv'),
+                                               os.path.join('ds_b', 'c.csv')]
+        assert (tmp_path / 'ds_a' / 'b.csv').read_bytes() == b'3,4\n'
+
+        num_downloads = len([path for path, params in stub.calls if path.startswith('/dl/')])
+        second = CK_calls.sync_mirror(stub.url, 'token', 'tags:wake', str(tmp_path))
+        assert second['downloaded'] == []
+        assert second['unchanged'] == 3
+        assert second['removed'] == []
+        assert len([path for path, params in stub.calls if path.startswith('/dl/')]) == num_downloads
+
+
+def test_changed_hash_and_deleted_resource(tmp_path):
+    with CkanStub() as stub:
+        package = add_package(stub, 'ds_a', {'a.csv': b'1,2\n', 'b.csv': b'3,4\n'})
+        CK_calls.sync_mirror(stub.url, 'token', 'tags:wake', str(tmp_path))
+
+        stub.files['ds_a_a.csv'] = b'7,8\n'
+        package['resources'][0]['hash'] = CK_helper.hashlib.sha256(b'7,8\n').hexdigest()
+        del package['resources'][1]
+        touch(stub, package, '2024-02-01T00:00:00')
+
+        ret = CK_calls.sync_mirror(stub.url, 'token', 'tags:wake', str(tmp_path))
+        assert ret['downloaded'] == [os.path.join('ds_a', 'a.csv')]
+        assert ret['removed'] == [os.path.join('ds_a', 'b.csv')]
+        assert (tmp_path / 'ds_a' / 'a.csv').read_bytes() == b'7,8\n'
+        assert not (tmp_path / 'ds_a' / 'b.csv').exists()
+
+
+def test_deleted_data_set_and_changed_query(tmp_path):
+    with CkanStub() as stub:
+        add_package(stub, 'ds_a', {'a.csv': b'1,2\n'}, tags = ['wake'])
+        add_package(stub, 'ds_b', {'b.csv': b'3,4\n'}, tags = ['wake', 'jet'])
+        CK_calls.sync_mirror(stub.url, 'token', 'tags:wake', str(tmp_path))
+
+        # Only matching the old query, removed with its dir
+        ret = CK_calls.sync_mirror(stub.url, 'token', 'tags:jet', str(tmp_path))
+        assert ret['removed'] == [os.path.join('ds_a', 'a.csv')]
+        assert sorted(os.listdir(tmp_path)) == ['.windlab_mirror.json', 'ds_b']
+
+        stub.packages.pop()
+        ret = CK_calls.sync_mirror(stub.url, 'token', 'tags:jet', str(tmp_path))
+        assert ret['removed'] == [os.path.join('ds_b', 'b.csv')]
+        assert os.listdir(tmp_path) == ['.windlab_mirror.json']
+
+
+def test_resource_names_stay_inside_dest(tmp_path):
+    dest = tmp_path / 'mirror'
+    with CkanStub() as stub:
+        add_package(stub, 'ds_a', {'../../evil.csv': b'1,2\n', 'sub/dir.csv': b'3,4\n'})
+        ret = CK_calls.sync_mirror(stub.url, 'token', 'tags:wake', str(dest))
+
+        assert ret['failed'] == []
+        assert sorted(ret['downloaded']) == [os.path.join('ds_a', 'dir.csv'),
+                                             os.path.join('ds_a', 'evil.csv')]
+        assert not (tmp_path / 'evil.csv').exists()
+
+        # Stored paths outside dest are not removed
+        (tmp_path / 'keep.csv').write_bytes(b'')
+        state_file = dest / '.windlab_mirror.json'
+        state = CK_calls.json.loads(state_file.read_text())
+        state['packages']['id_gone'] = {'name': 'gone', 'resources': {
+            'r': {'file': os.path.join('..', 'keep.csv'), 'version': None}}}
+        state_file.write_text(CK_calls.json.dumps(state))
+        ret = CK_calls.sync_mirror(stub.url, 'token', 'tags:wake', str(dest))
+        assert ret['removed'] == []
+        assert (tmp_path / 'keep.csv').exists()
@@ -0,0 +1,171 @@
+from ckan_stub import CkanStub
+
+import CKAN_API_Calls as CK_calls
+import CKAN_API_Helper as CK_helper
+from CKAN_API_Client import WindLabClient
+import yml_utils
+
+
+def make_data(tmp_path):
+    resources = []
+    for name in ['a.csv', 'b.csv']:
+        resources.append({'name': name, 'format': 'csv', 'description': name,
+                          'schema_compliance': None, 'framework': None,
+                          'source': str(tmp_path / name)})
+    return [{'general_requ': {'title': 'Test data', 'owner_org_name': 'DTU'},
+             'general_opt': {},
+             'resource': resources}]
+
+
+def test_second_run_skips_uploaded_files(tmp_path):
+    (tmp_path / 'a.csv').write_bytes(b'x,y\n1,2\n' * 100)
+    with CkanStub() as stub:
+        # First run fails for b.csv, which does not exist yet
+        first = CK_calls.write_datasets(stub.url, 'token', make_data(tmp_path))
+        assert [entry['success'] for entry in first] == [True, False]
+        assert first[0]['bytes_sent'] > 0
+
+        (tmp_path / 'b.csv').write_bytes(b'x,y\n3,4\n' * 100)
+        num_calls = len(stub.calls)
+        reuse = {entry['dataset']: entry['dataset_id'] for entry in first}
+        second = CK_calls.write_datasets(stub.url, 'token', make_data(tmp_path),
+                                         reuse_datasets = reuse)
+
+        assert [entry['success'] for entry in second] == [True, True]
+        assert second[0]['bytes_sent'] == 0
+        assert second[0]['bytes_skipped'] == 800
+        assert second[1]['bytes_sent'] > 0
+        assert second[0]['dataset_id'] == first[0]['dataset_id']
+
+        # Same data set written to, its package fetched once
+        assert len(stub.packages) == 1
+        assert [r['name'] for r in stub.packages[0]['resources']] == ['a.csv', 'b.csv']
+        calls = [path.rsplit('/', 1)[-1] for path, params in stub.calls[num_calls:]]
+        assert calls.count('package_show') == 1
+        assert 'package_create' not in calls
+        assert calls.count('resource_create') == 1
+
+
+def test_new_data_set_by_default(tmp_path):
+    (tmp_path / 'a.csv').write_bytes(b'x,y\n1,2\n')
+    (tmp_path / 'b.csv').write_bytes(b'x,y\n1,2\n')
+    with CkanStub() as stub:
+        first = CK_calls.write_datasets(stub.url, 'token', make_data(tmp_path))
+        second = CK_calls.write_datasets(stub.url, 'token', make_data(tmp_path))
+
+        assert [p['name'] for p in stub.packages] == ['test_data', 'test_data_0']
+        assert second[0]['dataset_id'] != first[0]['dataset_id']
+        # Same bytes under another name are uploaded
+        for result in [first, second]:
+            assert [entry['success'] for entry in result] == [True, True]
+            assert [entry['bytes_skipped'] for entry in result] == [0, 0]
+        for package in stub.packages:
+            assert [r['name'] for r in package['resources']] == ['a.csv', 'b.csv']
+
+
+def test_reused_data_set_replaces_changed_resources(tmp_path):
+    (tmp_path / 'a.csv').write_bytes(b'x,y\n1,2\n')
+    (tmp_path / 'b.csv').write_bytes(b'x,y\n3,4\n')
+    with CkanStub() as stub:
+        CK_calls.write_datasets(stub.url, 'token', make_data(tmp_path))
+        resource_ids = [r['id'] for r in stub.packages[0]['resources']]
+
+        (tmp_path / 'b.csv').write_bytes(b'x,y\n5,6\n')
+        data = make_data(tmp_path)
+        data[0]['general_requ']['notes'] = 'New notes'
+        second = CK_calls.write_datasets(stub.url, 'token', data, reuse_datasets = True)
+
+        assert [entry['success'] for entry in second] == [True, True]
+        assert second[0]['bytes_skipped'] > 0
+        assert second[1]['bytes_sent'] > 0
+        assert len(stub.packages) == 1
+        package = stub.packages[0]
+        assert package['notes'] == 'New notes'
+        assert [r['id'] for r in package['resources']] == resource_ids
+        assert package['resources'][1]['hash'] == CK_helper.file_sha256(tmp_path / 'b.csv')
+        assert len(stub.actions('resource_update')) == 1
+
+
+def test_invalid_name_is_not_retried(tmp_path):
+    thisdata = make_data(tmp_path)[0]
+    thisdata['general_requ']['title'] = 'Ærø data'
+    with CkanStub() as stub:
+        dataset_id = CK_helper.setup_dataset(stub.url, 'token', 'org1', thisdata)
+        assert dataset_id == []
+        assert len(stub.actions('package_create')) == 1
+
+
+def test_name_in_use_is_retried(tmp_path):
+    thisdata = make_data(tmp_path)[0]
+    with CkanStub() as stub:
+        # Name in use, but not found by the search, e.g. of a private data set
+        stub.packages.append({'id': 'hidden', 'name': 'test_data', 'resources': []})
+        stub.action_package_search = lambda params: {'count': 0, 'results': []}
+        dataset_id = CK_helper.setup_dataset(stub.url, 'token', 'org1', thisdata)
+        assert dataset_id == 'id_test_data_0'
+        assert len(stub.actions('package_create')) == 2
+
+
+def test_license_lookup_same_with_and_without_client():
+    with CkanStub() as stub:
+        with WindLabClient(stub.url, 'token') as client:
+            for name in ['Creative Commons CCZero', 'creative commons cczero']:
+                assert CK_helper.get_cc_id_from_name(stub.url, 'token', name) == 'cc-zero'
+                assert CK_helper.get_cc_id_from_name(stub.url, 'token', name, client = client) == 'cc-zero'
+
+
+def test_parallel_write_keeps_order(tmp_path):
+    data = []
+    for ii, title in enumerate(['Test data', 'Test data', 'Other data', 'Test data']):
+        resources = []
+        for name in ['a%d.csv' % ii, 'b%d.csv' % ii]:
+            # b1.csv is missing
+            if name != 'b1.csv':
+                (tmp_path / name).write_bytes(name.encode() * 100)
+            resources.append({'name': name, 'format': 'csv', 'description': name,
+                              'schema_compliance': None, 'framework': None,
+                              'source': str(tmp_path / name)})
+        data.append({'general_requ': {'title': title, 'owner_org_name': 'DTU'},
+                     'general_opt': {}, 'resource': resources})
+
+    with CkanStub() as stub:
+        result = CK_calls.write_datasets(stub.url, 'token', data, max_workers = 4)
+
+        names = [package['name'] for package in stub.packages]
+        assert len(set(names)) == 4
+        assert sorted(names) == ['other_data', 'test_data', 'test_data_0', 'test_data_1']
+
+    assert [entry['resource'] for entry in result] == ['a0.csv', 'b0.csv', 'a1.csv', 'b1.csv',
+                                                       'a2.csv', 'b2.csv', 'a3.csv', 'b3.csv']
+    assert [entry['dataset'] for entry in result] == [thisdata['general_requ']['title']
+                                                      for thisdata in data for _ in range(2)]
+    assert [entry['success'] for entry in result] == [True, True, True, False, True, True, True, True]
+    assert result[3]['error'] is not None
+    assert result[2]['dataset_id'] == result[3]['dataset_id']
+    assert len(set(entry['dataset_id'] for entry in result)) == 4
+
+
+def test_lazy_netcdf_passed_to_validation(tmp_path, monkeypatch):
+    loaders = []
+    monkeypatch.setattr(CK_helper, 'validate_yaml', lambda **kwargs: loaders.append(kwargs['loader']))
+    (tmp_path / 'a.csv').write_bytes(b'x,y\n1,2\n')
+    (tmp_path / 'b.csv').write_bytes(b'x,y\n3,4\n')
+    data = make_data(tmp_path)
+    data[0]['general_opt']['schema_compliance'] = 'windIO'
+    for this_res in data[0]['resource']:
+        this_res['framework'] = 'yaml'
+    with CkanStub() as stub:
+        result = CK_calls.write_datasets(stub.url, 'token', data, lazy_netcdf = True)
+        CK_calls.write_datasets(stub.url, 'token', data)
+
+    assert [entry['success'] for entry in result] == [True, True]
+    assert loaders[:4] == [yml_utils.LazyXrResourceLoader] * 4
+    assert loaders[4:] == [yml_utils.XrResourceLoader] * 4
+
+
+def test_is_name_in_use():
+    with CkanStub() as stub:
+        stub.packages.append({'id': 'id0', 'name': 'test_data_0', 'resources': []})
+        assert CK_helper.is_name_in_use(stub.url, 'token', 'test_data_0') is True
+        assert CK_helper.is_name_in_use(stub.url, 'token', 'test_data') is False
+        assert len(stub.actions('package_search')) == 2
@@ -0,0 +1,129 @@
+import os
+
+import numpy as np
+import xarray as xr
+import yaml
+
+import yml_utils
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_netcdf_case(tmp_path, values):
+    xr.Dataset({'v': ('x', np.array(values))}).to_netcdf(tmp_path / 'var.nc')
+    (tmp_path / 'data.yaml').write_text('nc: !include var.nc\n')
+    schema_dir = tmp_path / 'schemas'
+    schema_dir.mkdir()
+    schema = {'type': 'object',
+              'properties': {'nc': {'type': 'object',
+                                    'properties': {'x': {'type': 'array'},
+                                                   'v': {'type': 'object',
+                                                         'properties': {'dims': {}, 'attrs': {},
+                                                                        'data': {'type': 'array',
+                                                                                 'items': {'type': 'number',
+                                                                                           'minimum': 0}}}}}}}}
+    with open(schema_dir / 'schema.yaml', 'w') as f:
+        yaml.safe_dump(schema, f)
+    return str(tmp_path / 'data.yaml'), str(schema_dir / 'schema.yaml')
+
+
+def test_lazy_netcdf_out_of_bounds(tmp_path):
+    data_file, schema_file = write_netcdf_case(tmp_path, [1.0, 2.0, -5.0])
+    registry = yml_utils.SchemaRegistry()
+    for loader in [yml_utils.XrResourceLoader, yml_utils.LazyXrResourceLoader]:
+        error = yml_utils.validation_error(data_file, schema_file, loader=loader, registry=registry)
+        assert error is not None
+        assert list(error.absolute_path) == ['nc', 'v', 'data', 2]
+        assert 'minimum' in error.message
+
+
+def test_lazy_netcdf_valid(tmp_path):
+    data_file, schema_file = write_netcdf_case(tmp_path, [1.0, 2.0, 5.0])
+    registry = yml_utils.SchemaRegistry()
+    for loader in [yml_utils.XrResourceLoader, yml_utils.LazyXrResourceLoader]:
+        assert yml_utils.validation_error(data_file, schema_file, loader=loader, registry=registry) is None
+
+
+def test_validation_cache_key_depends_on_loader(tmp_path):
+    data_file, schema_file = write_netcdf_case(tmp_path, [1.0, 2.0, -5.0])
+    cache = yml_utils.ValidationCache(str(tmp_path / 'validation.sqlite'))
+    keys = {cache.key(data_file, schema_file, loader=yml_utils.XrResourceLoader),
+            cache.key(data_file, schema_file, loader=yml_utils.LazyXrResourceLoader),
+            cache.key(data_file, schema_file, check_lengths=True)}
+    assert len(keys) == 3
+
+    registry = yml_utils.SchemaRegistry()
+    for loader in [yml_utils.LazyXrResourceLoader, yml_utils.XrResourceLoader]:
+        assert yml_utils.validation_error(data_file, schema_file, loader=loader,
+                                          registry=registry, cache=cache) is not None
+    assert cache.cache_stats()['misses'] == 2
+    cache.close()
+
+
+def write_many_case(tmp_path):
+    schema_dir = tmp_path / 'schemas'
+    (schema_dir / 'simple').mkdir(parents=True)
+    schema = {'type': 'object', 'properties': {'a': {'type': 'number', 'minimum': 0}}}
+    with open(schema_dir / 'simple' / 'thing.yaml', 'w') as f:
+        yaml.safe_dump(schema, f)
+    files = []
+    for ii, value in enumerate([1, -1, 2, 'x', 3]):
+        (tmp_path / ('f%d.yaml' % ii)).write_text('a: %s\n' % value)
+        files.append(str(tmp_path / ('f%d.yaml' % ii)))
+    files.insert(2, str(tmp_path / 'missing.yaml'))
+    return files, str(schema_dir)
+
+
+def test_validate_many_order(tmp_path):
+    files, schema_dir = write_many_case(tmp_path)
+    sequential = yml_utils.validate_many(files, 'simple', 'thing', workers=1, schema_dir=schema_dir)
+    report = yml_utils.validate_many(files, 'simple', 'thing', workers=2, schema_dir=schema_dir,
+                                     chunksize=1)
+
+    assert report == sequential
+    assert [entry['file'] for entry in report] == files
+    assert [entry['valid'] for entry in report] == [True, False, False, True, False, True]
+    assert report[1]['path'] == 'a'
+    assert report[4]['path'] == 'a'
+    assert report[2]['error'] is not None
+    assert report[2]['path'] is None
+
+
+def test_validate_many_cache(tmp_path):
+    files, schema_dir = write_many_case(tmp_path)
+    cache = yml_utils.ValidationCache(str(tmp_path / 'validation.sqlite'))
+
+    first = yml_utils.validate_many(files, 'simple', 'thing', workers=2, schema_dir=schema_dir,
+                                    cache=cache)
+    assert cache.cache_stats()['hits'] == 0
+
+    # Unchanged files taken from the cache, the missing file checked again
+    second = yml_utils.validate_many(files, 'simple', 'thing', workers=2, schema_dir=schema_dir,
+                                     cache=cache)
+    assert second == first
+    assert cache.cache_stats()['hits'] == 5
+
+    # Changed file validated again
+    (tmp_path / 'f1.yaml').write_text('a: 7\n')
+    third = yml_utils.validate_many(files, 'simple', 'thing', workers=1, schema_dir=schema_dir,
+                                    cache=cache)
+    assert cache.cache_stats()['hits'] == 9
+    assert third[1] == {'file': files[1], 'valid': True, 'error': None, 'path': None}
+    assert third[2]['valid'] is False
+    assert third[2]['error'] == first[2]['error']
+    cache.close()
+
+
+def test_length_check_is_opt_in(tmp_path):
+    with open(os.path.join(ROOT, 'test_data', 'turbine.yaml')) as f:
+        data = yaml.safe_load(f)
+    data['performance']['power_curve']['power_values'].append(1650)
+    data_file = tmp_path / 'turbine.yaml'
+    with open(data_file, 'w') as f:
+        yaml.safe_dump(data, f)
+    schema_file = os.path.join(ROOT, 'schemas', 'windIO', 'turbine.yaml')
+
+    assert yml_utils.validation_error(str(data_file), schema_file) is None
+    error = yml_utils.validation_error(str(data_file), schema_file, check_lengths=True)
+    assert list(error.absolute_path) == ['performance', 'power_curve', 'power_values']
@@ -5,10 +5,25 @@ import jsonschema
 import json
 from urllib.parse import urljoin
 import xarray as xr
+import numpy as np
 import re
+import threading
+import hashlib
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 
-class Loader(yaml.SafeLoader):
+# libyaml based loader if available, the pure Python one otherwise
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def safe_load(stream):
+    """Same as yaml.safe_load, but through libyaml if available."""
+    return yaml.load(stream, SafeLoader)
+
+
+class IncludeMixin:
 
     def __init__(self, stream):
 
@@ -23,22 +38,17 @@ class Loader(yaml.SafeLoader):
         with open(filename, 'r') as f:
             return yaml.load(f, self.__class__)
 
-Loader.add_constructor('!include', Loader.include)
 
-# Add regex matching for scientific notation
-Loader.add_implicit_resolver(
-    u'tag:yaml.org,2002:float',
-    re.compile(u'''^(?:
-     [-+]?(?:[0-9][0-9_]*)\\.[0-9_]*(?:[eE][-+]?[0-9]+)?
-    |[-+]?(?:[0-9][0-9_]*)(?:[eE][-+]?[0-9]+)
-    |\\.[0-9_]+(?:[eE][-+][0-9]+)?
-    |[-+]?[0-9][0-9_]*(?::[0-5]?[0-9])+\\.[0-9_]*
-    |[-+]?\\.(?:inf|Inf|INF)
-    |\\.(?:nan|NaN|NAN))$''', re.X),
-    list(u'-+0123456789.'))
+def _fmt(v):
+    if isinstance(v, dict):
+        return {k: _fmt(v) for k, v in v.items() if not (isinstance(v, dict) and _fmt(v) == {})}
+    elif isinstance(v, tuple):
+        return list(v)
+    else:
+        return v
 
 
-class XrResourceLoader(Loader):
+class XrIncludeMixin(IncludeMixin):
 
     def include(self, node):
 
@@ -46,24 +56,128 @@ class XrResourceLoader(Loader):
         ext = os.path.splitext(filename)[1].lower()
         if ext in ['.yaml', '.yml']:
             with open(filename, 'r') as f:
-                return yaml.load(f, XrResourceLoader)
+                return yaml.load(f, self.__class__)
         elif ext in ['.nc']:
-            def fmt(v):
-                if isinstance(v, dict):
-                    return {k: fmt(v) for k, v in v.items() if fmt(v) != {}}
-                elif isinstance(v, tuple):
-                    return list(v)
-                else:
-                    return v
+            return self.include_netcdf(filename)
+
+    def include_netcdf(self, filename):
+
+        def ds2yml(ds):
+            d = ds.to_dict()
+            return _fmt({**{k: v['data'] for k, v in d['coords'].items()},
+                         **d['data_vars']})
+        return ds2yml(xr.open_dataset(filename))
+
+
+class LazyArray:
+    """Array node of a netCDF variable, read from file only when asked for.
+
+    Stands in for the nested lists of the variable in the yaml data. shape,
+    dtype and len() come from the file header. Values are read through
+    values, tolist(), iteration or numpy.asarray().
+    """
+
+    def __init__(self, data_array):
+        self.data_array = data_array
+
+    @property
+    def shape(self):
+        return self.data_array.shape
+
+    @property
+    def dtype(self):
+        return self.data_array.dtype
+
+    @property
+    def ndim(self):
+        return self.data_array.ndim
+
+    @property
+    def values(self):
+        """Values as numpy array, read from file."""
+        return self.data_array.values
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        return lazy_value(self.data_array[index])
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __array__(self, dtype=None, copy=None):
+        return self.data_array.values if dtype is None else self.data_array.values.astype(dtype)
+
+    def __repr__(self):
+        return 'LazyArray(shape=%s, dtype=%s)' % (self.shape, self.dtype)
+
+    def tolist(self):
+        """Values as nested lists, same as in the yaml data of XrResourceLoader."""
+        return self.data_array.to_dict()['data']
+
+
+def lazy_value(data_array):
+    """LazyArray of data_array, or its value if it is a scalar."""
+    if data_array.ndim == 0:
+        return data_array.to_dict()['data']
+    return LazyArray(data_array)
+
+
+class LazyXrIncludeMixin(XrIncludeMixin):
+
+    def include_netcdf(self, filename):
+
+        ds = xr.open_dataset(filename)
+        data = {k: lazy_value(v) for k, v in ds.coords.items()}
+        for k, v in ds.data_vars.items():
+            data[k] = _fmt({'dims': v.dims, 'attrs': dict(v.attrs), 'data': lazy_value(v)})
+        return data
+
+
+def add_loader_tags(loader):
+    """Adds the !include constructor and the scientific notation float resolver."""
+
+    loader.add_constructor('!include', loader.include)
+
+    # Add regex matching for scientific notation
+    loader.add_implicit_resolver(
+        u'tag:yaml.org,2002:float',
+        re.compile(u'''^(?:
+         [-+]?(?:[0-9][0-9_]*)\\.[0-9_]*(?:[eE][-+]?[0-9]+)?
+        |[-+]?(?:[0-9][0-9_]*)(?:[eE][-+]?[0-9]+)
+        |\\.[0-9_]+(?:[eE][-+][0-9]+)?
+        |[-+]?[0-9][0-9_]*(?::[0-5]?[0-9])+\\.[0-9_]*
+        |[-+]?\\.(?:inf|Inf|INF)
+        |\\.(?:nan|NaN|NAN))$''', re.X),
+        list(u'-+0123456789.'))
+    return loader
+
+
+class Loader(IncludeMixin, SafeLoader):
+    pass
 
-            def ds2yml(ds):
-                d = ds.to_dict()
-                return fmt({**{k: v['data'] for k, v in d['coords'].items()},
-                            **d['data_vars']})
-            return ds2yml(xr.open_dataset(filename))
 
+class XrResourceLoader(XrIncludeMixin, Loader):
+    pass
 
-XrResourceLoader.add_constructor('!include', XrResourceLoader.include)
+
+# Pure Python variants, e.g. for comparison
+class PyLoader(IncludeMixin, yaml.SafeLoader):
+    pass
+
+
+class PyXrResourceLoader(XrIncludeMixin, PyLoader):
+    pass
+
+
+# !include of netCDF files gives LazyArray nodes instead of nested lists
+class LazyXrResourceLoader(LazyXrIncludeMixin, Loader):
+    pass
+
+
+for _loader in [Loader, XrResourceLoader, PyLoader, PyXrResourceLoader, LazyXrResourceLoader]:
+    add_loader_tags(_loader)
 
 
 def load_yaml(filename, loader=XrResourceLoader):
@@ -96,46 +210,583 @@ def enforce_no_additional_properties(schema):
     return schema
 
 
-def validate_yaml(data_file, schema_file, loader=XrResourceLoader):
-
-    def add_local_schemas_to(resolver, schema_folder, base_uri, schema_ext_lst=['.json', '.yaml', '.yml']):
-        '''Function from https://gist.github.com/mrtj/d59812a981da17fbaa67b7de98ac3d4b#file-local_ref-py
-        Add local schema instances to a resolver schema cache.
-
-        Arguments:
-            resolver (jsonschema.RefResolver): the reference resolver
-            schema_folder (str): the local folder of the schemas.
-            base_uri (str): the base URL that you actually use in your '$id' tags
-                in the schemas
-            schema_ext (str): filter files with this extension in the schema_folder
-        '''
-        for dir, _, files in os.walk(schema_folder):
-            for file in files:
-                if Path(file).suffix in schema_ext_lst:
-                    schema_path = Path(dir) / Path(file)
-                    rel_path = schema_path.relative_to(schema_folder)
-                    try:
-                        with open(schema_path) as schema_file:
-                            if schema_path.suffix == '.json':
-                                schema_doc = json.load(schema_file)
-                            if schema_path.suffix in ['.yml', '.yaml']:
-                                schema_doc = yaml.safe_load(schema_file)
-
-                        key = urljoin(base_uri, str(rel_path))
-                        resolver.store[key] = schema_doc
-                    # except (ScannerError, ParserError):
-                    except Exception:
-                        print("Reading %s failed" % file)
+def add_local_schemas_to(resolver, schema_folder, base_uri, schema_ext_lst=['.json', '.yaml', '.yml']):
+    '''Function from https://gist.github.com/mrtj/d59812a981da17fbaa67b7de98ac3d4b#file-local_ref-py
+    Add local schema instances to a resolver schema cache.
+
+    Arguments:
+        resolver (jsonschema.RefResolver): the reference resolver
+        schema_folder (str): the local folder of the schemas.
+        base_uri (str): the base URL that you actually use in your '$id' tags
+            in the schemas
+        schema_ext (str): filter files with this extension in the schema_folder
+    '''
+    for dir, _, files in os.walk(schema_folder):
+        for file in files:
+            if Path(file).suffix in schema_ext_lst:
+                schema_path = Path(dir) / Path(file)
+                rel_path = schema_path.relative_to(schema_folder)
+                try:
+                    with open(schema_path) as schema_file:
+                        if schema_path.suffix == '.json':
+                            schema_doc = json.load(schema_file)
+                        if schema_path.suffix in ['.yml', '.yaml']:
+                            schema_doc = safe_load(schema_file)
+
+                    key = urljoin(base_uri, str(rel_path))
+                    resolver.store[key] = schema_doc
+                # except (ScannerError, ParserError):
+                except Exception:
+                    print("Reading %s failed" % file)
+
+
+def _is_array(checker, instance):
+    return isinstance(instance, list) or isinstance(instance, LazyArray)
+
+
+# Keywords not constraining values
+_annotation_keywords = {'title', 'description', 'units', 'default', 'examples', '$comment'}
+
+# Keywords of a numeric items schema, which are checked by numpy
+_numeric_keywords = {'type', 'minimum', 'maximum', 'exclusiveMinimum', 'exclusiveMaximum'} | _annotation_keywords
+
+
+def numeric_items_spec(items):
+    """Returns how an items schema of numbers (or arrays of numbers) is checked by numpy.
+
+    Returns None if the schema uses anything but types, bounds and
+    annotations, otherwise a dict with the keys 'ndim' (min and max number
+    of array levels of an item), 'integer' and the bounds.
+    """
+    if not isinstance(items, dict) or '$ref' in items:
+        return None
+    types = items.get('type')
+    types = set(types) if isinstance(types, list) else {types}
+    if types <= {'number', 'integer'}:
+        if set(items) - _numeric_keywords:
+            return None
+        for key in ['exclusiveMinimum', 'exclusiveMaximum']:
+            if isinstance(items.get(key), bool):
+                return None
+        spec = {key: items[key] for key in ['minimum', 'maximum', 'exclusiveMinimum', 'exclusiveMaximum']
+                if key in items}
+        spec['ndim'] = (0, 0)
+        spec['integer'] = types == {'integer'}
+        return spec
+    if (types == {'array', 'number'}) and not (set(items) - _numeric_keywords):
+        # Nested arrays of any depth, as 'data' of common.yaml#/definitions/dimensional_data
+        spec = numeric_items_spec(dict(items, type='number'))
+        spec['ndim'] = (0, float('inf'))
+        return spec
+    if (types == {'array'}) and not (set(items) - _numeric_keywords - {'items'}):
+        spec = numeric_items_spec(items.get('items'))
+        if spec is not None:
+            spec = dict(spec, ndim=(spec['ndim'][0] + 1, spec['ndim'][1] + 1))
+        return spec
+    return None
+
+
+def _has_bool(values):
+    # numpy turns [1.5, True] into numbers, jsonschema does not count booleans as numbers
+    if len(values) > 0 and isinstance(values[0], list):
+        return any(_has_bool(vv) for vv in values)
+    return bool in map(type, values)
+
+
+def numeric_array_ok(instance, spec):
+    """Checks all items of a list or LazyArray against a numeric items spec at once.
+
+    Returns True if all items are valid, False if they are not or if they
+    can not be checked by numpy, e.g. for ragged lists.
+    """
+    if isinstance(instance, LazyArray):
+        array = None
+        dtype, ndim = instance.dtype, instance.ndim
+    else:
+        try:
+            array = np.asarray(instance)
+        except (ValueError, TypeError):
+            return False
+        dtype, ndim = array.dtype, array.ndim
+    if (dtype.kind not in 'iuf') or not (spec['ndim'][0] <= ndim - 1 <= spec['ndim'][1]):
+        return False
+    if array is not None and _has_bool(instance):
+        return False
+
+    need_values = (len(spec) > 2) or (spec['integer'] and dtype.kind == 'f')
+    if not need_values:
+        return True
+    if array is None:
+        array = instance.values
+    if array.size == 0:
+        return True
+
+    if spec['integer'] and dtype.kind == 'f':
+        if not np.all(np.isfinite(array) & (array == np.floor(array))):
+            return False
+    checks = [('minimum', np.greater_equal), ('maximum', np.less_equal),
+              ('exclusiveMinimum', np.greater), ('exclusiveMaximum', np.less)]
+    for key, op in checks:
+        if key in spec and not np.all(op(array, spec[key])):
+            return False
+    return True
+
+
+_array_validator_classes = {}
+
+
+def array_validator_class(cls):
+    """Extends a jsonschema validator class for large arrays.
+
+    Arrays of numbers, whose items schema only has types and bounds (see
+    numeric_items_spec), are checked by numpy in one pass. Only if that
+    fails, jsonschema checks them item by item, to report the error (for a
+    LazyArray after reading all of it). In windIO these are the 'data' of
+    dimensional_data and the like in common.yaml. Arrays without an items 
+    schema, e.g. power_values and Ct_values of turbine.yaml, are only type 
+    checked as arrays, so none of their elements is visited either way.
+
+    LazyArray nodes are accepted as arrays. As all elements of a numpy array
+    have the same type and shape, items schemas with nothing but a type are
+    checked against the first element only, which is then the only value
+    read from file. Any other items schema (bounds, enum, nested items, ...)
+    applies to every element, so the whole array is read and checked.
+    """
+    if cls not in _array_validator_classes:
+        items = cls.VALIDATORS.get('items')
+        specs = {}
+
+        def array_items(validator, value, instance, schema):
+            if isinstance(value, dict) and _is_array(None, instance):
+                if id(value) not in specs:
+                    specs[id(value)] = (value, numeric_items_spec(value))
+                spec = specs[id(value)][1]
+                if (spec is not None) and numeric_array_ok(instance, spec):
+                    return
+                if isinstance(instance, LazyArray):
+                    # After numpy rejected it, all items are checked to report the error
+                    if (spec is None) and (set(value) - _annotation_keywords <= {'type'}):
+                        if len(instance) > 0:
+                            yield from validator.descend(instance[0], value, path=0)
+                        return
+                    instance = instance.tolist()
+            yield from items(validator, value, instance, schema)
+
+        _array_validator_classes[cls] = jsonschema.validators.extend(
+            cls,
+            validators={'items': array_items},
+            type_checker=cls.TYPE_CHECKER.redefine('array', _is_array))
+    return _array_validator_classes[cls]
 
-    data = load_yaml(data_file, loader)
-    schema = load_yaml(schema_file)
-    schema = enforce_no_additional_properties(schema)
 
-    schema_folder = Path(schema_file).parent
+def array_length_errors(data, path=()):
+    """Yields a ValidationError for every array whose length does not match its coordinates.
+
+    The schemas do not declare these pairs, so the check is opt-in through
+    check_lengths of validation_error. Two conventions of windIO documents 
+    are checked:
+        - 'X_values' and its sibling arrays 'X_...', e.g. 'power_values' and
+          'power_wind_speeds', have the same length
+        - the shape of 'data' of an object with 'data' and 'dims' matches
+          the number of dims, and the length of the sibling coordinate arrays
+          named in 'dims'
+    """
+    if isinstance(data, list):
+        if len(data) > 0 and isinstance(data[0], (dict, list)):
+            for ii, value in enumerate(data):
+                yield from array_length_errors(value, path + (ii,))
+        return
+    if not isinstance(data, dict):
+        return
+
+    for key, value in data.items():
+        if isinstance(key, str) and key.endswith('_values') and _is_array(None, value):
+            prefix = key[:-len('values')]
+            for other_key, other in data.items():
+                if (other_key != key and isinstance(other_key, str) and other_key.startswith(prefix)
+                        and _is_array(None, other) and len(other) != len(value)):
+                    yield jsonschema.ValidationError(
+                        'Length of %r (%d) does not match length of %r (%d)'
+                        % (key, len(value), other_key, len(other)), path=path + (key,))
+
+        if isinstance(value, dict) and isinstance(value.get('dims'), list) and len(value['dims']) > 0:
+            try:
+                shape = np.shape(value.get('data'))
+            except ValueError:
+                shape = None
+            if shape is not None:
+                dims = value['dims']
+                if len(shape) != len(dims):
+                    yield jsonschema.ValidationError(
+                        'Shape %s of data does not match dims %s' % (tuple(shape), dims),
+                        path=path + (key, 'data'))
+                else:
+                    for dim, size in zip(dims, shape):
+                        coord = data.get(dim)
+                        if _is_array(None, coord) and len(coord) != size:
+                            yield jsonschema.ValidationError(
+                                'Length %d of dim %r of data does not match length %d of coordinate %r'
+                                % (size, dim, len(coord), dim), path=path + (key, 'data'))
+
+        if isinstance(value, (dict, list)):
+            yield from array_length_errors(value, path + (key,))
+
+
+class SchemaRegistry:
+    """Process wide cache of schemas and their validators.
+
+    Each schema family (a folder, e.g. schemas/windIO_2) is read once, and
+    each schema file is loaded, checked and compiled into a validator once.
+    Validators are kept per thread, as the RefResolver is not thread safe.
+    Call clear() after changing schema files.
+    """
+
     base_uri = 'https://www.example.com/schemas/'
 
-    resolver = jsonschema.RefResolver(base_uri=base_uri, referrer=schema)
-    add_local_schemas_to(resolver, schema_folder, base_uri)
-    jsonschema.validate(data, schema, resolver=resolver)
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stores = {}
+        self._schemas = {}
+        self._versions = {}
+        self._local = threading.local()
+
+    def store(self, schema_folder):
+        """Returns the documents of all schemas in schema_folder, keyed by their URI."""
+        schema_folder = os.path.abspath(schema_folder)
+        with self._lock:
+            if schema_folder not in self._stores:
+                resolver = jsonschema.RefResolver(base_uri=self.base_uri, referrer={})
+                add_local_schemas_to(resolver, schema_folder, self.base_uri)
+                self._stores[schema_folder] = dict(resolver.store)
+            return self._stores[schema_folder]
+
+    def schema(self, schema_file):
+        """Returns the schema of schema_file, with no additional properties allowed."""
+        schema_file = os.path.abspath(schema_file)
+        with self._lock:
+            if schema_file not in self._schemas:
+                schema = enforce_no_additional_properties(load_yaml(schema_file))
+                jsonschema.validators.validator_for(schema).check_schema(schema)
+                self._schemas[schema_file] = schema
+            return self._schemas[schema_file]
+
+    def validator(self, schema_file):
+        """Returns a ready to use validator for schema_file."""
+        schema_file = os.path.abspath(schema_file)
+        validators = getattr(self._local, 'validators', None)
+        if validators is None:
+            validators = self._local.validators = {}
+        if schema_file not in validators:
+            schema = self.schema(schema_file)
+            store = self.store(Path(schema_file).parent)
+            resolver = jsonschema.RefResolver(base_uri=self.base_uri, referrer=schema, store=store)
+            cls = array_validator_class(jsonschema.validators.validator_for(schema))
+            validators[schema_file] = cls(schema, resolver=resolver)
+        return validators[schema_file]
+
+    def version(self, schema_folder):
+        """Returns a hash over the names and contents of all files of a schema family."""
+        schema_folder = os.path.abspath(schema_folder)
+        with self._lock:
+            if schema_folder not in self._versions:
+                sha = hashlib.sha256()
+                for dir, _, files in sorted(os.walk(schema_folder)):
+                    for file in sorted(files):
+                        file_name = os.path.join(dir, file)
+                        sha.update(os.path.relpath(file_name, schema_folder).encode('utf-8'))
+                        sha.update(file_sha256(file_name).encode('ascii'))
+                self._versions[schema_folder] = sha.hexdigest()
+            return self._versions[schema_folder]
+
+    def preload(self, schema_folder):
+        """Loads and compiles all schemas of a family, e.g. 'schemas/windIO'."""
+        for file in sorted(os.listdir(schema_folder)):
+            if Path(file).suffix in ['.yaml', '.yml']:
+                self.validator(os.path.join(schema_folder, file))
+
+    def clear(self):
+        """Drops all cached schemas and validators."""
+        with self._lock:
+            self._stores = {}
+            self._schemas = {}
+            self._versions = {}
+            self._local = threading.local()
+
+
+schema_registry = SchemaRegistry()
+
+
+def file_sha256(file_name, chunk_size=1024 * 1024):
+    """Returns the SHA-256 hex digest of a file, read in chunks."""
+    sha = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def include_files(file_name, _visited=None):
+    """Returns all files pulled in by !include tags of a yaml file, recursively."""
+    if _visited is None:
+        _visited = set()
+    root = os.path.split(file_name)[0]
+    with open(file_name, 'r') as f:
+        text = f.read()
+    for name in re.findall(r'!include\s+["\']?([^\s"\'#,\]}]+)', text):
+        include = os.path.normpath(os.path.join(root, name))
+        if include in _visited:
+            continue
+        _visited.add(include)
+        if os.path.splitext(include)[1].lower() in ['.yaml', '.yml'] and os.path.isfile(include):
+            include_files(include, _visited)
+    return sorted(_visited)
+
+
+class ValidationCache:
+    """On-disk cache of validation results.
+
+    Results are keyed by a hash of the data file, all files it pulls in
+    through !include, the schema file name, the version of its schema
+    family (see SchemaRegistry.version), the loader and check_lengths. Unchanged inputs are thus not
+    validated again, while any change to the data or schemas is.
+
+    Example:
+        cache = ValidationCache()
+        validate_yaml('turbine.yaml', 'schemas/windIO/turbine.yaml', cache=cache)
+        print(cache.cache_stats())
+    """
+
+    def __init__(self, db_file_name='./windlab_cache/validation.sqlite'):
+        self.db_file_name = db_file_name
+        self.hits = 0
+        self.misses = 0
+
+        dir_name = os.path.dirname(db_file_name)
+        if (dir_name != '') and (os.path.isdir(dir_name) is False):
+            os.makedirs(dir_name)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_file_name, check_same_thread=False)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS results ('
+                             'key TEXT PRIMARY KEY, valid INTEGER, error TEXT, path TEXT, checked REAL)')
+
+    def key(self, data_file, schema_file, registry=schema_registry, loader=XrResourceLoader,
+            check_lengths=False, extra=''):
+        """Returns the cache key of validating data_file against schema_file.
+
+        extra distinguishes results of further validation options.
+        """
+        sha = hashlib.sha256()
+        sha.update(('%s.%s|%s|%s' % (loader.__module__, loader.__qualname__, bool(check_lengths),
+                                     extra)).encode('utf-8'))
+        sha.update(registry.version(Path(schema_file).parent).encode('ascii'))
+        sha.update(os.path.basename(schema_file).encode('utf-8'))
+        sha.update(file_sha256(data_file).encode('ascii'))
+        for include in include_files(data_file):
+            sha.update(include.encode('utf-8'))
+            if os.path.isfile(include):
+                sha.update(file_sha256(include).encode('ascii'))
+        return sha.hexdigest()
+
+    def get(self, key):
+        """Returns the cached result {'valid', 'error', 'path'}, or None."""
+        with self._lock:
+            row = self._db.execute('SELECT valid, error, path FROM results WHERE key = ?',
+                                   (key,)).fetchone()
+            if row is None:
+                self.misses = self.misses + 1
+                return None
+            self.hits = self.hits + 1
+        return {'valid': bool(row[0]), 'error': row[1], 'path': json.loads(row[2])}
+
+    def add(self, key, valid, error=None, path=None):
+        """Stores a result, path being the list of keys/indices of the failing element."""
+        with self._lock:
+            with self._db:
+                self._db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                                 (key, int(valid), error, json.dumps(path), time.time()))
+
+    def cache_stats(self):
+        """Returns a dict with the number of hits and misses, and the hit rate."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_rate': self.hits / total if total > 0 else 0.0}
+
+    def close(self):
+        """Closes the data base."""
+        with self._lock:
+            self._db.close()
+
+
+def validation_error(data_file, schema_file, loader=XrResourceLoader, registry=schema_registry,
+                     cache=None, check_lengths=False):
+    """Returns the best matching ValidationError of data_file, or None if valid.
+
+    If a ValidationCache is given, unchanged files are not validated again.
+    If check_lengths, arrays are also checked against their coordinates, see
+    array_length_errors. This goes beyond the schemas, hence it is opt-in.
+    """
+    key = None
+    if (cache is not None) and (isinstance(data_file, dict) is False):
+        key = cache.key(data_file, schema_file, registry, loader, check_lengths)
+        entry = cache.get(key)
+        if entry is not None:
+            if entry['valid']:
+                return None
+            return jsonschema.ValidationError(entry['error'], path=entry['path'])
+
+    data = load_yaml(data_file, loader)
+
+    # Schemas are loaded and compiled once per process by the registry
+    validator = registry.validator(schema_file)
+    error = jsonschema.exceptions.best_match(validator.iter_errors(data))
+    if error is None and check_lengths:
+        error = next(array_length_errors(data), None)
+
+    if key is not None:
+        if error is None:
+            cache.add(key, True)
+        else:
+            cache.add(key, False, error.message, list(error.absolute_path))
+    return error
+
+
+def validate_yaml(data_file, schema_file, loader=XrResourceLoader, registry=schema_registry,
+                  cache=None, check_lengths=False):
+
+    error = validation_error(data_file, schema_file, loader, registry, cache, check_lengths)
+    if error is not None:
+        raise error
 
     print("Validation succeeded")
+
+
+def _preload_worker(schema_folder):
+    # Initializer of the worker processes of validate_many
+    schema_registry.preload(schema_folder)
+
+
+def _report_entry(data_file, valid, error=None, path=None):
+    # Entry of the report of validate_many
+    if path is not None:
+        path = '/'.join(str(pp) for pp in path)
+    return {'file': data_file, 'valid': valid, 'error': error, 'path': path}
+
+
+def _validate_entry(data_file, schema_file, loader=XrResourceLoader, check_lengths=False):
+    # Validates one file of validate_many, returning the report entry and the
+    # path of the error, or None if the file could not be read. Never raises.
+    try:
+        error = validation_error(data_file, schema_file, loader, check_lengths=check_lengths)
+    except Exception as err:
+        return _report_entry(data_file, False, str(err)), None
+    if error is None:
+        return _report_entry(data_file, True), []
+    return _report_entry(data_file, False, error.message, error.absolute_path), list(error.absolute_path)
+
+
+def validate_many(files, schema_type, schema_name, workers=None, schema_dir='schemas', chunksize=8,
+                  cache=None, loader=XrResourceLoader, check_lengths=False):
+    """Validates many yaml files against schemas/<schema_type>/<schema_name>.yaml.
+
+    The files are spread over a pool of worker processes, each of which loads
+    the schema family once. Nothing is printed and no error is raised for
+    invalid files.
+
+    Arguments:
+        files (list): dir and file names of the yaml files
+        schema_type (str): schema family, e.g. 'windIO_2'
+        schema_name (str): schema of the family, e.g. 'turbine'
+        workers (int): number of processes, all CPUs if None. If 1, the
+            files are validated in the calling process
+        schema_dir (str): folder of the schema families
+        chunksize (int): number of files sent to a worker at once
+        cache (ValidationCache): if given, only files not in the cache are
+            validated, and their results are added to it
+        loader (class): yaml loader, e.g. LazyXrResourceLoader to keep
+            included netCDF files on disk
+        check_lengths (bool): also check array lengths, see validation_error
+
+    Returns:
+        list: one dict per file, in the order of files, with the keys 'file',
+            'valid' (bool), 'error' (message or None) and 'path' (path in the
+            data of the failing element, or None)
+    """
+    schema_folder = os.path.join(schema_dir, schema_type)
+    schema_file = os.path.join(schema_folder, schema_name + '.yaml')
+    files = list(files)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    # Results of unchanged files taken from the cache
+    report = [None] * len(files)
+    keys = [None] * len(files)
+    if cache is not None:
+        for ii, data_file in enumerate(files):
+            try:
+                keys[ii] = cache.key(data_file, schema_file, loader=loader, check_lengths=check_lengths)
+            except Exception:
+                continue
+            entry = cache.get(keys[ii])
+            if entry is not None:
+                report[ii] = _report_entry(data_file, entry['valid'], entry['error'],
+                                           None if entry['valid'] else entry['path'])
+    todo = [ii for ii in range(len(files)) if report[ii] is None]
+    workers = min(workers, max(len(todo), 1))
+
+    if workers <= 1:
+        entries = [_validate_entry(files[ii], schema_file, loader, check_lengths) for ii in todo]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_preload_worker,
+                                 initargs=(schema_folder,)) as executor:
+            entries = list(executor.map(_validate_entry, [files[ii] for ii in todo],
+                                        [schema_file] * len(todo), [loader] * len(todo),
+                                        [check_lengths] * len(todo), chunksize=chunksize))
+
+    for ii, (entry, path) in zip(todo, entries):
+        report[ii] = entry
+        # Files that could not be read are not cached
+        if (keys[ii] is not None) and (path is not None):
+            cache.add(keys[ii], entry['valid'], entry['error'], None if entry['valid'] else path)
+    return report
+
+
+def benchmark_loaders(files=None, repeat=3):
+    """Times loading yaml files with the pure Python and the libyaml based loader.
+
+    Arguments:
+        files (list): dir and file names, all yaml files in schemas/ and
+            test_data/ if None
+        repeat (int): number of loads per file and loader, the fastest counts
+
+    Returns:
+        list: one dict per file with the keys 'file', 'python' and 'libyaml'
+            (seconds per load) and 'speedup'
+    """
+    if files is None:
+        files = sorted(str(pp) for folder in ['schemas', 'test_data']
+                       for pp in Path(folder).rglob('*.y*ml'))
+
+    results = []
+    for file in files:
+        times = {}
+        for label, loader in [('python', PyXrResourceLoader), ('libyaml', XrResourceLoader)]:
+            times[label] = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                load_yaml(file, loader)
+                times[label] = min(times[label], time.perf_counter() - start)
+        results.append({'file': file, 'python': times['python'], 'libyaml': times['libyaml'],
+                        'speedup': times['python'] / times['libyaml']})
+    return results
+
+
+if __name__ == '__main__':
+    if SafeLoader is yaml.SafeLoader:
+        print('libyaml not available, both loaders are pure Python')
+    for res in benchmark_loaders():
+        print('%-75s %8.2f ms %8.2f ms %6.1fx' % (res['file'], 1e3 * res['python'],
+                                                 1e3 * res['libyaml'], res['speedup']))